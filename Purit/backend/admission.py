@@ -0,0 +1,240 @@
+# admission.py
+"""
+Admission control for audio/inference work, per traffic class.
+
+Every piece of inference work is admitted under one of three classes:
+
+- live:   work a running session waits on: roll-call embeddings and the
+          reference embeddings it computes at start (highest priority)
+- upload: direct kiosk/API uploads
+- bulk:   enrollment and other batch work (new students' references,
+          gallery sync, imports)
+
+There is a global cap on work in flight (ADMISSION_MAX_INFLIGHT) and each
+class has its own in-flight limit and waiting-queue cap. When a slot frees
+up it goes to the highest-priority waiter whose class is under its limit.
+A request that finds its class queue full — or waits longer than the
+class's max wait — is rejected straight away with Overloaded, which the API
+turns into 429 + Retry-After instead of letting latency pile up.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, str(default)))
+
+
+MAX_INFLIGHT = _env_int("ADMISSION_MAX_INFLIGHT", 4)
+
+# name -> (priority, max in flight, max queued, max wait seconds); 0 = unbounded
+TRAFFIC_CLASSES = {
+    "live": (
+        2,
+        _env_int("ADMISSION_LIVE_INFLIGHT", MAX_INFLIGHT),
+        _env_int("ADMISSION_LIVE_QUEUE", 0),
+        float(os.getenv("ADMISSION_LIVE_MAX_WAIT", "0")),
+    ),
+    "upload": (
+        1,
+        _env_int("ADMISSION_UPLOAD_INFLIGHT", 2),
+        _env_int("ADMISSION_UPLOAD_QUEUE", 16),
+        float(os.getenv("ADMISSION_UPLOAD_MAX_WAIT", "10")),
+    ),
+    "bulk": (
+        0,
+        _env_int("ADMISSION_BULK_INFLIGHT", 1),
+        _env_int("ADMISSION_BULK_QUEUE", 64),
+        float(os.getenv("ADMISSION_BULK_MAX_WAIT", "120")),
+    ),
+}
+
+
+class Overloaded(Exception):
+    def __init__(self, traffic_class, retry_after, reason):
+        super().__init__(f"{traffic_class} traffic over budget: {reason}")
+        self.traffic_class = traffic_class
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _ClassStats:
+    def __init__(self):
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.service_ewma = 1.0  # seconds per job, seeded pessimistically
+
+    def as_dict(self):
+        return {
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_ms": round(1000 * self.wait_total / self.admitted, 1) if self.admitted else 0.0,
+            "max_wait_ms": round(1000 * self.wait_max, 1),
+            "avg_service_ms": round(1000 * self.service_ewma, 1),
+        }
+
+
+class _Waiter:
+    __slots__ = ("traffic_class", "enqueued", "wake", "granted")
+
+    def __init__(self, traffic_class, wake):
+        self.traffic_class = traffic_class
+        self.enqueued = time.monotonic()
+        self.wake = wake
+        self.granted = False
+
+
+# -----------------------------
+# Controller
+# -----------------------------
+class AdmissionController:
+    def __init__(self, max_inflight=MAX_INFLIGHT, classes=TRAFFIC_CLASSES):
+        self.max_inflight = max(1, max_inflight)
+        self.classes = dict(classes)
+        self._lock = threading.Lock()
+        self._inflight = {name: 0 for name in self.classes}
+        self._waiting = {name: deque() for name in self.classes}
+        self._stats = {name: _ClassStats() for name in self.classes}
+
+    def _check(self, traffic_class):
+        if traffic_class not in self.classes:
+            raise ValueError(f"Unknown traffic class {traffic_class!r}")
+
+    def _can_run(self, name):
+        return sum(self._inflight.values()) < self.max_inflight and self._inflight[name] < self.classes[name][1]
+
+    def _retry_after(self, name):
+        _, limit, _, _ = self.classes[name]
+        backlog = len(self._waiting[name]) + self._inflight[name]
+        return max(1, math.ceil(backlog * self._stats[name].service_ewma / max(1, limit)))
+
+    def _grant_next(self):
+        """Hand free slots to the highest-priority eligible waiters (lock held)."""
+        for name in sorted(self.classes, key=lambda n: -self.classes[n][0]):
+            queue = self._waiting[name]
+            while queue and self._can_run(name):
+                waiter = queue.popleft()
+                waiter.granted = True
+                self._inflight[name] += 1
+                self._record_wait(name, waiter)
+                waiter.wake()
+
+    def _record_wait(self, name, waiter):
+        waited = time.monotonic() - waiter.enqueued
+        st = self._stats[name]
+        st.admitted += 1
+        st.wait_total += waited
+        st.wait_max = max(st.wait_max, waited)
+
+    def _enter(self, traffic_class, wake):
+        """Admit immediately, queue, or reject. Returns a _Waiter (granted or pending)."""
+        self._check(traffic_class)
+        with self._lock:
+            queue_cap = self.classes[traffic_class][2]
+            if queue_cap and len(self._waiting[traffic_class]) >= queue_cap:
+                self._stats[traffic_class].rejected += 1
+                raise Overloaded(traffic_class, self._retry_after(traffic_class), "queue full")
+            waiter = _Waiter(traffic_class, wake)
+            self._waiting[traffic_class].append(waiter)
+            self._grant_next()
+            return waiter
+
+    def _abandon(self, waiter):
+        """A waiter gave up; returns True if it had been granted meanwhile (caller must release)."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            try:
+                self._waiting[waiter.traffic_class].remove(waiter)
+            except ValueError:
+                pass
+            self._stats[waiter.traffic_class].timed_out += 1
+            return False
+
+    def _release(self, traffic_class, started):
+        with self._lock:
+            self._inflight[traffic_class] -= 1
+            st = self._stats[traffic_class]
+            st.service_ewma = 0.8 * st.service_ewma + 0.2 * (time.monotonic() - started)
+            self._grant_next()
+
+    def _max_wait(self, traffic_class):
+        return self.classes[traffic_class][3] or None
+
+    def _timeout(self, traffic_class):
+        with self._lock:
+            retry_after = self._retry_after(traffic_class)
+        return Overloaded(traffic_class, retry_after, "waited too long")
+
+    @contextmanager
+    def admit(self, traffic_class):
+        """Blocking admission for worker threads (session loops, thread pools)."""
+        event = threading.Event()
+        waiter = self._enter(traffic_class, event.set)
+        if not waiter.granted and not event.wait(self._max_wait(traffic_class)):
+            if not self._abandon(waiter):
+                raise self._timeout(traffic_class)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(traffic_class, started)
+
+    @asynccontextmanager
+    async def admit_async(self, traffic_class):
+        """Admission for async routes; waits without holding a thread."""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+
+        def _wake():
+            loop.call_soon_threadsafe(lambda: fut.done() or fut.set_result(None))
+
+        waiter = self._enter(traffic_class, _wake)
+        if not waiter.granted:
+            try:
+                await asyncio.wait_for(fut, self._max_wait(traffic_class))
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if not self._abandon(waiter):
+                    if isinstance(e, asyncio.CancelledError):
+                        raise
+                    raise self._timeout(traffic_class)
+                if isinstance(e, asyncio.CancelledError):
+                    self._release(traffic_class, time.monotonic())
+                    raise
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(traffic_class, started)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_inflight": self.max_inflight,
+                "inflight": sum(self._inflight.values()),
+                "classes": {
+                    name: {
+                        "priority": prio,
+                        "inflight": self._inflight[name],
+                        "inflight_limit": limit,
+                        "queued": len(self._waiting[name]),
+                        "queue_cap": cap or None,
+                        **self._stats[name].as_dict(),
+                    }
+                    for name, (prio, limit, cap, _) in self.classes.items()
+                },
+            }
+
+
+controller = AdmissionController()
+admit = controller.admit
+admit_async = controller.admit_async
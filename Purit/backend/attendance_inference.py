@@ -3,16 +3,28 @@ import threading
 import torch
 import numpy as np
 import librosa
-import soundfile as sf
 import sounddevice as sd
 import wavio
 import pyttsx3
 import time
+import functools
 from datetime import datetime, timedelta
 from pymongo import MongoClient
 
 from model import SpeakerRecognitionCNN
 from dataset import wav_to_logmelspec
+from attendance_store import record_checkins
+import admission
+import cpu_precision
+import audio_store
+import job_queue
+import response_cache
+import session_events
+import session_registry
+from session_registry import WORKER_ID
+from session_scheduler import SharedModel, scheduler, reference_cache, capture_slot
+from inference_executor import INFERENCE_EXECUTOR
+from embedding_gallery import gallery, fingerprint
 
 # -----------------------------
 # Configuration
@@ -28,6 +40,8 @@ RMS_THRESHOLD = 0.01
 # Confidence thresholds for marking present/absent
 CONF_THRESHOLD = 0.93
 MARGIN_THRESHOLD = 0.08
+# Missing gallery rows an upload computes itself before identifying; more than this falls back to the classifier
+GALLERY_INLINE_MAX = int(os.getenv("GALLERY_INLINE_MAX", "4"))
 
 # -----------------------------
 # Database
@@ -39,6 +53,11 @@ def get_db(uri="mongodb://localhost:27017", db_name="purit_db"):
 # -----------------------------
 # Load CNN model
 # -----------------------------
+@functools.lru_cache(maxsize=None)
+def _execution(device="cpu"):
+    """MODEL_PRECISION / MODEL_CHANNELS_LAST for `device` (resolved once per process)."""
+    return cpu_precision.ExecutionMode(device=device)
+
 def load_model(device="cpu"):
     if not os.path.exists(MODEL_PATH):
         raise FileNotFoundError(f"Model not found at {MODEL_PATH}")
@@ -48,26 +67,28 @@ def load_model(device="cpu"):
     inv_labels = {v: k for k, v in labels.items()} if labels else None
     n_classes = len(labels) if labels else 2
 
-    model = SpeakerRecognitionCNN(n_classes=n_classes)
+    model = SpeakerRecognitionCNN.from_config(n_classes, ckpt.get("config"))
     model.load_state_dict(model_state, strict=False)
     model.to(device).eval()
+    _execution(str(device)).prepare(model)
     return model, inv_labels
 
 # -----------------------------
 # Compute embedding
 # -----------------------------
 def compute_embedding(audio_path, model, device="cpu"):
-    wav, sr = sf.read(audio_path, dtype="float32")
+    wav, sr = audio_store.read_audio(audio_path)
     if wav.ndim > 1:
         wav = wav.mean(axis=1)
     if sr != SAMPLE_RATE:
         wav = librosa.resample(wav, orig_sr=sr, target_sr=SAMPLE_RATE)
-    mel = wav_to_logmelspec(wav)
+    mel = wav_to_logmelspec(wav, n_mels=model.n_mels)
     mel = np.expand_dims(mel, (0, 1))
     x = torch.tensor(mel, dtype=torch.float32).to(device)
 
-    with torch.no_grad():
-        emb = model.embed(x).cpu().numpy()[0]
+    execution = _execution(str(device))
+    with torch.no_grad(), execution.autocast():
+        emb = model.embed(execution.input(x)).float().cpu().numpy()[0]
     emb = emb / (np.linalg.norm(emb) + 1e-9)
     return emb
 
@@ -97,7 +118,7 @@ def announce_student(name):
         pass
 
 def is_speech_present(audio_path, thresh_rms=RMS_THRESHOLD):
-    wav, sr = sf.read(audio_path, dtype="float32")
+    wav, sr = audio_store.read_audio(audio_path)
     if wav.ndim > 1:
         wav = wav.mean(axis=1)
     rms = float(np.sqrt(np.mean(wav ** 2)))
@@ -111,9 +132,12 @@ def get_student_reference_embedding(db, student_id, model, device="cpu"):
     if not student:
         return None
     sources = student.get("verified_samples") or student.get("voice_samples") or []
+    return _average_embedding(sources, model, device)
+
+def _average_embedding(sources, model, device="cpu"):
     embeddings = []
     for path in sources:
-        if path and os.path.exists(path):
+        if path and audio_store.exists(path):
             try:
                 emb = compute_embedding(path, model, device)
                 embeddings.append(emb)
@@ -125,6 +149,152 @@ def get_student_reference_embedding(db, student_id, model, device="cpu"):
     avg = avg / (np.linalg.norm(avg) + 1e-9)
     return avg
 
+def _cached_reference_embedding(student, model, device="cpu"):
+    """
+    Reference embedding from the shared gallery when it is current for this
+    student's samples and model, else computed (and kept in the LRU until
+    the session publishes it).
+    """
+    sources = tuple(student.get("verified_samples") or student.get("voice_samples") or [])
+    model_version = shared_model.file_version()
+    emb = gallery.get(student["student_id"], fingerprint(sources), model_version)
+    if emb is not None:
+        return emb
+    key = (student["student_id"], sources, model_version)
+    emb = reference_cache.get(key)
+    if emb is None:
+        with admission.admit("live"):
+            if REMOTE_INFERENCE:
+                emb = job_queue.run("reference", {"sources": list(sources)}, job_queue.PRIORITY_LIVE)
+                emb = np.asarray(emb, dtype=np.float32) if emb is not None else None
+            else:
+                emb = _average_embedding(sources, model, device)
+        if emb is not None:
+            reference_cache.put(key, emb)
+    return emb
+
+def _publish_references(students, ref_embeddings):
+    """Write references that were missing or stale in the gallery back to it."""
+    model_version = shared_model.file_version()
+    updates = {}
+    for s in students:
+        sid = s["student_id"]
+        if sid not in ref_embeddings:
+            continue
+        fp = fingerprint(s.get("verified_samples") or s.get("voice_samples") or [])
+        if gallery.get(sid, fp, model_version) is None:
+            updates[sid] = (fp, ref_embeddings[sid])
+    if updates:
+        try:
+            gallery.publish(updates, model_version)
+        except Exception as e:
+            print(f"⚠️ Could not publish embedding gallery: {e}")
+
+def register_student(student):
+    """
+    Compute a newly enrolled student's reference embedding and add it to the
+    gallery right away, so uploads recognise them without a retrain.
+    """
+    sources = list(student.get("verified_samples") or student.get("voice_samples") or [])
+    if not sources:
+        return None
+    with admission.admit("bulk"):
+        if REMOTE_INFERENCE:
+            emb = job_queue.run("reference", {"sources": sources}, job_queue.PRIORITY_UPLOAD)
+            emb = np.asarray(emb, dtype=np.float32) if emb is not None else None
+        else:
+            emb = _average_embedding(sources, shared_model.get()[0], DEVICE)
+    if emb is None:
+        return None
+    return gallery.publish({student["student_id"]: (fingerprint(sources), emb)}, shared_model.file_version())
+
+def sync_gallery(db=None):
+    """Fill in gallery rows that are missing or stale for the current model (background work)."""
+    db = db or get_db()
+    model_version = shared_model.file_version()
+    model = shared_model.get()[0]
+    updates = {}
+    for s in db.students.find({}, {"_id": 0, "student_id": 1, "verified_samples": 1, "voice_samples": 1}):
+        sources = s.get("verified_samples") or s.get("voice_samples") or []
+        fp = fingerprint(sources)
+        if not sources or gallery.get(s["student_id"], fp, model_version) is not None:
+            continue
+        try:
+            with admission.admit("bulk"):
+                emb = _average_embedding(sources, model, DEVICE)
+        except admission.Overloaded:
+            break  # busy: publish what we have, the next sync picks up the rest
+        if emb is not None:
+            updates[s["student_id"]] = (fp, emb)
+    if updates:
+        gallery.publish(updates, model_version)
+    return len(updates)
+
+_gallery_sync_lock = threading.Lock()
+
+def request_gallery_sync():
+    """Start sync_gallery() in the background unless one is already running in this process."""
+    if not _gallery_sync_lock.acquire(blocking=False):
+        return False
+
+    def _run():
+        try:
+            synced = sync_gallery()
+            if synced:
+                print(f"🧠 Gallery sync added {synced} student(s)")
+        except Exception as e:
+            print(f"⚠️ Gallery sync failed: {e}")
+        finally:
+            _gallery_sync_lock.release()
+
+    threading.Thread(target=_run, daemon=True, name="gallery-sync").start()
+    return True
+
+# -----------------------------
+# Matching (live sessions and uploads use the same rule)
+# -----------------------------
+def match_scores(sims, expected_id=None):
+    """
+    (best_id, best_sim, margin, accepted) for {student_id: cosine}. Accepted
+    needs CONF_THRESHOLD and MARGIN_THRESHOLD over the runner-up, and, when
+    `expected_id` is given (roll-call), that the best match is that student.
+    With a single score there is no runner-up to measure a margin against:
+    a roll-call (claimed identity) is then judged on the threshold alone,
+    an identification is rejected.
+    """
+    if not sims:
+        return None, 0.0, 0.0, False
+    ranked = sorted(sims.items(), key=lambda x: x[1], reverse=True)
+    best_id, best_sim = ranked[0]
+    if len(ranked) > 1:
+        margin = best_sim - ranked[1][1]
+        margin_ok = margin >= MARGIN_THRESHOLD
+    else:
+        margin = 0.0
+        margin_ok = expected_id is not None
+    accepted = (
+        best_sim >= CONF_THRESHOLD
+        and margin_ok
+        and (expected_id is None or best_id == expected_id)
+    )
+    return best_id, best_sim, margin, accepted
+
+# -----------------------------
+# Shared model (one per process, used by every session)
+# -----------------------------
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+shared_model = SharedModel(lambda: load_model(DEVICE), MODEL_PATH)
+
+# INFERENCE_EXECUTOR=queue: sessions send embedding work to inference_worker.py
+REMOTE_INFERENCE = INFERENCE_EXECUTOR == "queue"
+
+def _session_embedding(audio_path, model, device="cpu"):
+    with admission.admit("live"):
+        if REMOTE_INFERENCE:
+            emb = job_queue.run("embed", {"audio_path": audio_path}, job_queue.PRIORITY_LIVE)
+            return np.asarray(emb, dtype=np.float32)
+        return compute_embedding(audio_path, model, device)
+
 # -----------------------------
 # Attendance Session
 # -----------------------------
@@ -138,22 +308,28 @@ def _run_attendance_session(class_name):
     if not students:
         print(f"❌ No students found for {class_name}")
         session["stop"] = True
+        session_registry.get_store().release(class_name, WORKER_ID)
+        session_events.publish(class_name, "status", {"status": "completed"})
         return
 
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    model, inv_labels = load_model(device)
+    device = DEVICE
+    model = None if REMOTE_INFERENCE else shared_model.get()[0]
     print(f"🎧 Starting attendance session for {class_name}")
     session["results"] = []
 
-    # Precompute reference embeddings
+    # Precompute reference embeddings on the shared inference pool
+    pending = {
+        s["student_id"]: scheduler.submit(class_name, _cached_reference_embedding, s, model, device)
+        for s in students
+    }
     ref_embeddings = {}
-    for s in students:
-        sid = s["student_id"]
-        emb = get_student_reference_embedding(db, sid, model, device)
+    for sid, fut in pending.items():
+        emb = fut.result()
         if emb is not None:
             ref_embeddings[sid] = emb
         else:
             print(f"⚠️ No reference embeddings for {sid}")
+    _publish_references(students, ref_embeddings)
 
     for student in students:
         if session["stop"]:
@@ -169,32 +345,28 @@ def _run_attendance_session(class_name):
         name = student.get("name", "Unknown")
         sid = student["student_id"]
         print(f"\n🎧 Listening for {name} ({sid})...")
-        announce_student(name)
-
         filename = f"{sid}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.wav"
         filepath = os.path.join(TMP_AUDIO_DIR, filename)
-        record_audio(filepath, duration=DURATION)
-
-        speech, rms = is_speech_present(filepath)
+        with capture_slot():
+            session_events.publish(class_name, "listening", {"student_id": sid, "name": name})
+            announce_student(name)
+            record_audio(filepath, duration=DURATION)
+        # keep the clip in the blob store; the mic file is only a staging copy
+        audio_ref = audio_store.put_file(filepath, "audio/wav", remove=True)
+
+        speech, rms = is_speech_present(audio_ref)
         if not speech:
             status = "No Speech"
             confidence_pct = 0.0
             print(f"→ {sid} | {name} | No Speech | RMS={rms:.6f}")
         else:
-            emb = compute_embedding(filepath, model, device)
+            emb = scheduler.submit(class_name, _session_embedding, audio_ref, model, device).result()
             sims = {}
             for sid_ref, ref_emb in ref_embeddings.items():
                 sims[sid_ref] = cosine_sim(emb, ref_emb)
-            sorted_sims = sorted(sims.items(), key=lambda x: x[1], reverse=True)
-            best_match_id, best_sim = sorted_sims[0]
-            second_best_sim = sorted_sims[1][1] if len(sorted_sims) > 1 else 0.0
+            _, best_sim, margin, accepted = match_scores(sims, expected_id=sid)
             confidence_pct = round(best_sim * 100.0, 2)
-            margin = best_sim - second_best_sim
-
-            if best_match_id == sid and best_sim >= CONF_THRESHOLD and margin >= MARGIN_THRESHOLD:
-                status = "Present"
-            else:
-                status = "Absent"
+            status = "Present" if accepted else "Absent"
 
             print(f"→ {sid} | {name} | {status} | {confidence_pct:.2f}% | Margin={margin:.3f}")
 
@@ -205,7 +377,7 @@ def _run_attendance_session(class_name):
             "confidence": confidence_pct,
             "status": status,
             "timestamp": datetime.utcnow(),
-            "audio_path": filepath,
+            "audio_path": audio_ref,
         }
 
         db.temp_attendance.update_one(
@@ -213,47 +385,91 @@ def _run_attendance_session(class_name):
             {"$set": temp_doc},
             upsert=True,
         )
+        response_cache.invalidate(response_cache.temp_tag(class_name))
+        session_events.publish(class_name, "result", dict(temp_doc))
         session["results"].append(temp_doc)
         time.sleep(1.5)
 
     session["stop"] = True
+    scheduler.forget(class_name)
+    session_registry.get_store().release(class_name, WORKER_ID)
+    session_events.publish(class_name, "status", {"status": "completed"})
     print(f"✅ Attendance session finished for {class_name}")
 
 # -----------------------------
 # Session Control
 # -----------------------------
-def start_class_attendance(class_name):
+def get_session_status(class_name):
+    # The owning worker answers from memory; any other worker asks the registry
+    session = active_sessions.get(class_name)
+    if session is not None:
+        if session.get("stop"):
+            return "completed"
+        return "paused" if session.get("paused") else "running"
+    return session_registry.describe(session_registry.get_store().get(class_name))
+
+def get_session_snapshot(class_name):
+    """Current status plus results so far (sent to stream subscribers on connect)."""
+    session = active_sessions.get(class_name)
+    if session is not None:
+        results = list(session.get("results", []))
+    else:
+        results = list(get_db().temp_attendance.find({"class_name": class_name}, {"_id": 0}))
+    return {"status": get_session_status(class_name), "results": results}
+
+def start_class_attendance(class_name, priority=0):
     if class_name in active_sessions and not active_sessions[class_name]["stop"]:
         return f"⚠️ Session already running for {class_name}"
+    if not session_registry.get_store().acquire(class_name, WORKER_ID):
+        return f"⚠️ Session already running for {class_name} on another worker"
     active_sessions[class_name] = {"paused": False, "stop": False, "results": []}
     thread = threading.Thread(target=_run_attendance_session, args=(class_name,), daemon=True)
     active_sessions[class_name]["thread"] = thread
+    scheduler.set_priority(class_name, priority)
+    session_events.publish(class_name, "status", {"status": "running"})
     thread.start()
+    session_registry.start_heartbeat(class_name, active_sessions[class_name])
     return f"🎙️ Started attendance session for {class_name}"
 
 def pause_class_attendance(class_name):
+    # Written to the registry so the owning worker sees it on its next heartbeat
+    record = session_registry.get_store().set_control(class_name, paused=True)
     session = active_sessions.get(class_name)
-    if not session:
+    if not session and not record:
         return f"No active session for {class_name}"
-    session["paused"] = True
+    if session:
+        session["paused"] = True
+    session_events.publish(class_name, "status", {"status": "paused"})
     return f"⏸️ Paused session for {class_name}"
 
 def resume_class_attendance(class_name):
     session = active_sessions.get(class_name)
+    store = session_registry.get_store()
     if not session:
-        return f"No active session for {class_name}"
-    if not session["paused"]:
+        status = session_registry.describe(store.get(class_name))
+        if status == "completed":
+            return f"No active session for {class_name}"
+        if status != "paused":
+            return f"Session for {class_name} is not paused"
+    elif not session["paused"]:
         return f"Session for {class_name} is not paused"
-    session["paused"] = False
+    store.set_control(class_name, paused=False)
+    if session:
+        session["paused"] = False
+    session_events.publish(class_name, "status", {"status": "running"})
     return f"▶️ Resumed session for {class_name}"
 
 def finish_class_attendance(class_name):
     db = get_db()
     session = active_sessions.get(class_name)
-    if not session:
+    # Only one worker may finalize; the owner (if elsewhere) sees stop on its next heartbeat
+    record = session_registry.get_store().claim_finish(class_name)
+    if record is None and (session is None or session_registry.get_store().get(class_name)):
+        active_sessions.pop(class_name, None)
         return []
-    session["stop"] = True
-    results = session.get("results", [])
+    if session:
+        session["stop"] = True
+    results = session.get("results", []) if session else []
     if not results:
         results = list(db.temp_attendance.find({"class_name": class_name}, {"_id": 0}))
     if not results:
@@ -294,22 +510,10 @@ def finish_class_attendance(class_name):
     # ✅ Calculate total check-ins for the class
     total_checkins = len(presents)
 
-    # ✅ Update or append today's attendance summary
-    db.classes.update_one(
-        {"class_name": class_name},
-        {"$push": {
-            "attendance_dates": {
-                "date": now.strftime("%Y-%m-%d"),
-                "time": now.strftime("%H:%M:%S"),
-                "avg_confidence": avg_conf,
-                "checkin_count": total_checkins,
-                "students": results,
-            }
-        }},
-        upsert=True,
-    )
+    # ✅ Append check-ins to the time-series store (rollups updated incrementally)
+    record_checkins(db, class_name, results, source="session")
 
-    # ✅ Also update class summary fields (for dashboard top row)
+    # ✅ Update class summary fields (for dashboard top row)
     db.classes.update_one(
         {"class_name": class_name},
         {
@@ -320,34 +524,45 @@ def finish_class_attendance(class_name):
                 "time": now.strftime("%H:%M:%S"),
                 "checkin_count": total_checkins,
             }
-        }
+        },
+        upsert=True,
     )
 
 
     db.temp_attendance.delete_many({"class_name": class_name})
     if results:
         db.temp_attendance.insert_many(results)
-    del active_sessions[class_name]
+    response_cache.invalidate(
+        "classes",
+        response_cache.class_tag(class_name),
+        response_cache.temp_tag(class_name),
+    )
+    active_sessions.pop(class_name, None)
+    session_events.publish(class_name, "finished", {
+        "count": len(results),
+        "avg_confidence": avg_conf,
+        "checkin_count": total_checkins,
+    })
     print(f"✅ Finalized {class_name} — {len(results)} records | Avg={avg_conf}% | Checkins={len(presents)}")
     return results
 
 # -----------------------------
-# Single inference (fallback)
+# Single inference (uploads)
 # -----------------------------
-def process_attendance(audio_path):
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    model, inv_labels = load_model(device)
+def _classify(audio_path, model, inv_labels, device):
+    """Softmax over the classifier head: only knows students from the last training run."""
     try:
-        wav, sr = sf.read(audio_path, dtype="float32")
+        wav, sr = audio_store.read_audio(audio_path)
         if wav.ndim > 1:
             wav = wav.mean(axis=1)
         if sr != SAMPLE_RATE:
             wav = librosa.resample(wav, orig_sr=sr, target_sr=SAMPLE_RATE)
-        mel = wav_to_logmelspec(wav)
+        mel = wav_to_logmelspec(wav, n_mels=model.n_mels)
         mel = np.expand_dims(mel, (0, 1))
         x = torch.tensor(mel, dtype=torch.float32).to(device)
-        with torch.no_grad():
-            logits = model(x)
+        execution = _execution(str(device))
+        with torch.no_grad(), execution.autocast():
+            logits = model(execution.input(x)).float()
             probs = torch.softmax(logits, dim=1)[0].cpu().numpy()
             idx = int(np.argmax(probs))
             conf = float(probs[idx])
@@ -355,4 +570,61 @@ def process_attendance(audio_path):
         idx = None
         conf = 0.0
     student_id = inv_labels.get(idx) if inv_labels else None
-    return {"student_id": student_id, "confidence": float(conf * 100.0)}
+    return {"student_id": student_id, "confidence": float(conf * 100.0), "method": "classifier"}
+
+def _complete_gallery(candidates, model, device, model_version):
+    """
+    Make sure every candidate (every enrolled student when None) with voice
+    samples has a gallery row for `model_version` and their current samples.
+    Up to GALLERY_INLINE_MAX missing rows are computed and published here;
+    with more missing (e.g. right after a promote) a background sync is
+    requested and False returned, so the caller does not score a clip
+    against a partial gallery.
+    """
+    query = {"student_id": {"$in": list(candidates)}} if candidates else {}
+    missing = {}
+    for s in get_db().students.find(query, {"_id": 0, "student_id": 1, "verified_samples": 1, "voice_samples": 1}):
+        sources = s.get("verified_samples") or s.get("voice_samples") or []
+        fp = fingerprint(sources)
+        if sources and gallery.get(s["student_id"], fp, model_version) is None:
+            missing[s["student_id"]] = (fp, sources)
+    if not missing:
+        return True
+    if len(missing) > GALLERY_INLINE_MAX:
+        request_gallery_sync()
+        return False
+    updates = {}
+    for sid, (fp, sources) in missing.items():
+        emb = _average_embedding(sources, model, device)
+        if emb is not None:  # no readable samples: this student can't be matched either way
+            updates[sid] = (fp, emb)
+    if updates:
+        gallery.publish(updates, model_version)
+    return True
+
+def process_attendance(audio_path, candidates=None):
+    """
+    Identify the speaker of an uploaded clip against the enrolled-embedding
+    gallery (optionally only `candidates`, e.g. the class roster) with the
+    live session's threshold/margin rule. Only a complete gallery is used
+    (see _complete_gallery); otherwise this falls back to the classifier.
+    """
+    device = DEVICE
+    model, inv_labels = shared_model.get()
+    model_version = shared_model.file_version()
+    if not _complete_gallery(candidates, model, device, model_version):
+        return _classify(audio_path, model, inv_labels, device)
+    try:
+        emb = compute_embedding(audio_path, model, device)
+    except Exception:
+        return {"student_id": None, "confidence": 0.0, "method": "gallery"}
+    sims = gallery.scores(emb, candidates, model_version=model_version)
+    if not sims:
+        return _classify(audio_path, model, inv_labels, device)
+    best_id, best_sim, margin, accepted = match_scores(sims)
+    return {
+        "student_id": best_id if accepted else None,
+        "confidence": float(best_sim * 100.0),
+        "margin": float(margin),
+        "method": "gallery",
+    }
@@ -0,0 +1,330 @@
+# attendance_store.py
+"""
+Time-series attendance store.
+
+Every check-in is appended to its own small document in the `checkins`
+collection instead of being pushed into `classes.attendance_dates` or the
+student's `stats.{date}` map. Alongside it we keep daily and weekly rollups
+per class and per student (`attendance_rollups`), updated with `$inc` as
+check-ins arrive, so the report routes never have to scan raw check-ins.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+CHECKINS = "checkins"
+ROLLUPS = "attendance_rollups"
+
+STATUS_FIELDS = {
+    "Present": "present",
+    "Absent": "absent",
+    "No Speech": "no_speech",
+}
+DATE_FMT = "%Y-%m-%d"
+
+
+# -----------------------------
+# Indexes
+# -----------------------------
+def ensure_indexes(db):
+    """Create the indexes the store and the report routes rely on (idempotent)."""
+    db[CHECKINS].create_index([("meta.class_name", ASCENDING), ("ts", DESCENDING)])
+    db[CHECKINS].create_index([("meta.student_id", ASCENDING), ("ts", DESCENDING)])
+    db[ROLLUPS].create_index(
+        [
+            ("scope", ASCENDING),
+            ("class_name", ASCENDING),
+            ("student_id", ASCENDING),
+            ("period", ASCENDING),
+            ("bucket", ASCENDING),
+        ],
+        unique=True,
+    )
+    db[ROLLUPS].create_index(
+        [("scope", ASCENDING), ("class_name", ASCENDING), ("period", ASCENDING), ("start", ASCENDING)]
+    )
+
+
+# -----------------------------
+# Bucketing helpers
+# -----------------------------
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return datetime.strptime(value, DATE_FMT).date()
+    return value
+
+
+def day_bucket(ts):
+    return _to_date(ts).strftime(DATE_FMT)
+
+
+def week_bucket(ts):
+    year, week, _ = _to_date(ts).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _week_start(d):
+    return d - timedelta(days=d.weekday())
+
+
+def _split_range(start, end):
+    """
+    Cover [start, end] with as few rollup buckets as possible: whole ISO
+    weeks come from the weekly rollup, the ragged edges from daily ones.
+    Returns (day_buckets, week_buckets).
+    """
+    start, end = _to_date(start), _to_date(end)
+    days, weeks = [], []
+    d = start
+    while d <= end:
+        if d.weekday() == 0 and d + timedelta(days=6) <= end:
+            weeks.append(week_bucket(d))
+            d += timedelta(days=7)
+        else:
+            days.append(day_bucket(d))
+            d += timedelta(days=1)
+    return days, weeks
+
+
+def _counters(status, confidence, sign=1):
+    inc = {"total": sign, "confidence_sum": sign * float(confidence or 0)}
+    field = STATUS_FIELDS.get(status)
+    if field:
+        inc[field] = sign
+    return inc
+
+
+def _rollup_updates(class_name, student_id, ts, inc):
+    d = _to_date(ts)
+    now = datetime.utcnow()
+    buckets = (
+        ("day", day_bucket(d), d),
+        ("week", week_bucket(d), _week_start(d)),
+    )
+    ops = []
+    for scope, sid in (("class", None), ("student", student_id)):
+        for period, bucket, start in buckets:
+            ops.append(UpdateOne(
+                {
+                    "scope": scope,
+                    "class_name": class_name,
+                    "student_id": sid,
+                    "period": period,
+                    "bucket": bucket,
+                },
+                {
+                    "$inc": inc,
+                    "$set": {"updated_at": now},
+                    "$setOnInsert": {"start": start.strftime(DATE_FMT)},
+                },
+                upsert=True,
+            ))
+    return ops
+
+
+# -----------------------------
+# Writes
+# -----------------------------
+def record_checkins(db, class_name, results, source="session"):
+    """
+    Append a batch of per-student results (dicts with student_id, status,
+    confidence, timestamp, audio_path) and fold them into the rollups.
+    """
+    if not results:
+        return 0
+
+    docs = []
+    merged = defaultdict(lambda: defaultdict(int))
+    for r in results:
+        ts = r.get("timestamp") or datetime.utcnow()
+        status = r.get("status", "Absent")
+        confidence = float(r.get("confidence", 0) or 0)
+        docs.append({
+            "ts": ts,
+            "meta": {"class_name": class_name, "student_id": r["student_id"]},
+            "status": status,
+            "confidence": confidence,
+            "audio_path": r.get("audio_path"),
+            "source": source,
+        })
+        key = (r["student_id"], day_bucket(ts))
+        for k, v in _counters(status, confidence).items():
+            merged[key][k] += v
+
+    db[CHECKINS].insert_many(docs)
+
+    ops = []
+    for (student_id, day), inc in merged.items():
+        ops.extend(_rollup_updates(class_name, student_id, day, dict(inc)))
+    db[ROLLUPS].bulk_write(ops, ordered=False)
+    return len(docs)
+
+
+def record_checkin(db, class_name, student_id, status, confidence, ts=None, audio_path=None, source="upload"):
+    """Append a single check-in and update its rollups."""
+    return record_checkins(
+        db,
+        class_name,
+        [{
+            "student_id": student_id,
+            "status": status,
+            "confidence": confidence,
+            "timestamp": ts or datetime.utcnow(),
+            "audio_path": audio_path,
+        }],
+        source=source,
+    )
+
+
+def correct_checkin(db, class_name, student_id, status):
+    """
+    Apply a feedback correction to the student's latest check-in in this
+    class, moving its count between status buckets in the rollups.
+    """
+    latest = db[CHECKINS].find_one(
+        {"meta.class_name": class_name, "meta.student_id": student_id},
+        sort=[("ts", DESCENDING)],
+    )
+    if not latest or latest.get("status") == status:
+        return False
+
+    db[CHECKINS].update_one({"_id": latest["_id"]}, {"$set": {"status": status, "corrected": True}})
+
+    inc = {}
+    old_field = STATUS_FIELDS.get(latest.get("status"))
+    new_field = STATUS_FIELDS.get(status)
+    if old_field:
+        inc[old_field] = -1
+    if new_field:
+        inc[new_field] = inc.get(new_field, 0) + 1
+    if inc:
+        db[ROLLUPS].bulk_write(_rollup_updates(class_name, student_id, latest["ts"], inc), ordered=False)
+    return True
+
+
+# -----------------------------
+# History
+# -----------------------------
+def list_checkins(db, class_name, start=None, end=None, after=None, limit=50):
+    """
+    Newest-first page of raw check-ins for a class. `after` is the
+    (ts, _id) of the last row of the previous page; at most limit + 1 rows
+    are returned so the caller can tell whether another page exists.
+    """
+    query = {"meta.class_name": class_name}
+    ts_range = {}
+    if start:
+        ts_range["$gte"] = datetime.combine(_to_date(start), datetime.min.time())
+    if end:
+        ts_range["$lt"] = datetime.combine(_to_date(end) + timedelta(days=1), datetime.min.time())
+    if ts_range:
+        query["ts"] = ts_range
+    if after:
+        query["$or"] = [
+            {"ts": {"$lt": after["ts"]}},
+            {"ts": after["ts"], "_id": {"$lt": after["_id"]}},
+        ]
+    cursor = (
+        db[CHECKINS]
+        .find(query, {"meta.class_name": 0})
+        .sort([("ts", DESCENDING), ("_id", DESCENDING)])
+        .limit(limit + 1)
+    )
+    return list(cursor)
+
+
+# -----------------------------
+# Reports (answered from rollups only)
+# -----------------------------
+def _range_query(scope, class_name, start, end, student_id=None):
+    days, weeks = _split_range(start, end)
+    query = {
+        "scope": scope,
+        "class_name": class_name,
+        "$or": [
+            {"period": "day", "bucket": {"$in": days}},
+            {"period": "week", "bucket": {"$in": weeks}},
+        ],
+    }
+    if scope == "student" and student_id:
+        query["student_id"] = student_id
+    return query
+
+
+def _summarise(row):
+    total = row.get("total", 0) or 0
+    present = row.get("present", 0) or 0
+    return {
+        "total": total,
+        "present": present,
+        "absent": row.get("absent", 0) or 0,
+        "no_speech": row.get("no_speech", 0) or 0,
+        "rate": round(present / total, 4) if total else 0.0,
+        "avg_confidence": round((row.get("confidence_sum", 0) or 0) / total, 2) if total else 0.0,
+    }
+
+
+def _sum_rows(rows):
+    acc = defaultdict(int)
+    for row in rows:
+        for k in ("total", "present", "absent", "no_speech", "confidence_sum"):
+            acc[k] += row.get(k, 0) or 0
+    return acc
+
+
+def attendance_rate(db, class_name, start, end, student_id=None):
+    scope = "student" if student_id else "class"
+    rows = db[ROLLUPS].find(_range_query(scope, class_name, start, end, student_id), {"_id": 0})
+    summary = _summarise(_sum_rows(rows))
+    summary.update({"class_name": class_name, "start": day_bucket(start), "end": day_bucket(end)})
+    if student_id:
+        summary["student_id"] = student_id
+    return summary
+
+
+def attendance_trend(db, class_name, start, end, period="day", student_id=None):
+    if period not in ("day", "week"):
+        raise ValueError("period must be 'day' or 'week'")
+    start, end = _to_date(start), _to_date(end)
+    if period == "week":
+        start = _week_start(start)
+    query = {
+        "scope": "student" if student_id else "class",
+        "class_name": class_name,
+        "period": period,
+        "start": {"$gte": start.strftime(DATE_FMT), "$lte": end.strftime(DATE_FMT)},
+    }
+    if student_id:
+        query["student_id"] = student_id
+    points = []
+    for row in db[ROLLUPS].find(query, {"_id": 0}).sort("start", ASCENDING):
+        point = _summarise(row)
+        point.update({"bucket": row["bucket"], "start": row["start"]})
+        points.append(point)
+    return points
+
+
+def low_attendance(db, class_name, start, end, threshold=0.75, min_sessions=1):
+    pipeline = [
+        {"$match": _range_query("student", class_name, start, end)},
+        {"$group": {
+            "_id": "$student_id",
+            "total": {"$sum": "$total"},
+            "present": {"$sum": "$present"},
+            "absent": {"$sum": "$absent"},
+            "no_speech": {"$sum": "$no_speech"},
+            "confidence_sum": {"$sum": "$confidence_sum"},
+        }},
+        {"$match": {"total": {"$gte": min_sessions}}},
+    ]
+    students = []
+    for row in db[ROLLUPS].aggregate(pipeline):
+        summary = _summarise(row)
+        if summary["rate"] < threshold:
+            summary["student_id"] = row["_id"]
+            students.append(summary)
+    students.sort(key=lambda s: (s["rate"], s["student_id"]))
+    return students
@@ -0,0 +1,316 @@
+# audio_retention.py
+"""
+Retention, compression and compaction for stored audio.
+
+Every check-in leaves a clip behind (blob store, plus the legacy ./tmp,
+./tmp_audio and ./uploads directories from before it), so disk use only
+ever grows. A retention pass:
+
+1. collects every audio reference in Mongo. Anything in a student's
+   `verified_samples` is protected and never touched, and neither is
+   enrollment audio (`voice_samples`);
+2. deletes audio nothing references once it is older than
+   RETENTION_TEMP_TTL_HOURS;
+3. transcodes check-in evidence that is still WAV to FLAC (lossless,
+   default) or Opus (RETENTION_CODEC=opus) once it is older than
+   RETENTION_COMPRESS_AFTER_HOURS, then repoints the records and drops
+   the WAV.
+
+Work runs in batches of RETENTION_BATCH_SIZE with a pause between them, and
+waits while live sessions are recording or running inference, so it never
+competes with roll-call for I/O. Each pass stores a report (bytes reclaimed
+etc.) in `retention_runs`; only one worker runs a pass at a time.
+"""
+import io
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import soundfile as sf
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import admission
+import audio_store
+import session_scheduler
+
+RETENTION_TEMP_TTL_HOURS = float(os.getenv("RETENTION_TEMP_TTL_HOURS", "72"))
+RETENTION_COMPRESS_AFTER_HOURS = float(os.getenv("RETENTION_COMPRESS_AFTER_HOURS", "24"))
+RETENTION_CODEC = os.getenv("RETENTION_CODEC", "flac")  # flac | opus
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "50"))
+RETENTION_BATCH_PAUSE_SECONDS = float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", "1.0"))
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", "6"))
+LEGACY_AUDIO_DIRS = [d for d in os.getenv("LEGACY_AUDIO_DIRS", "./tmp,./tmp_audio,./uploads").split(",") if d]
+AUDIO_EXTENSIONS = (".wav", ".webm", ".ogg", ".flac", ".mp3", ".m4a")
+
+EVIDENCE_COLLECTIONS = ("checkins", "attendance", "temp_attendance")
+SAMPLE_FIELDS = ("verified_samples", "voice_samples", "invalid_samples")
+
+LOCK_ID = "audio_retention"
+LOCK_SECONDS = 3600
+
+
+def _key(ref):
+    """Comparable form of a reference (legacy paths resolved against cwd)."""
+    return ref if audio_store.is_blob(ref) else os.path.abspath(ref)
+
+
+# -----------------------------
+# Reference scan
+# -----------------------------
+def _scan_references(db):
+    """(protected keys, student sample keys, all referenced keys, evidence {key: ref})."""
+    protected, samples, referenced, evidence = set(), set(), set(), {}
+    for s in db.students.find({}, {field: 1 for field in SAMPLE_FIELDS}):
+        for field in SAMPLE_FIELDS:
+            for ref in s.get(field) or []:
+                if ref:
+                    referenced.add(_key(ref))
+                    samples.add(_key(ref))
+                    if field != "invalid_samples":
+                        protected.add(_key(ref))
+    for col in EVIDENCE_COLLECTIONS:
+        for doc in db[col].find({"audio_path": {"$nin": [None, ""]}}, {"audio_path": 1}):
+            ref = doc["audio_path"]
+            referenced.add(_key(ref))
+            evidence.setdefault(_key(ref), ref)
+    return protected, samples, referenced, evidence
+
+
+def _still_unreferenced(db, ref):
+    """Re-check right before deleting: a feedback call may have just claimed it."""
+    variants = list({ref, _key(ref)})
+    if db.students.count_documents({"$or": [{f: {"$in": variants}} for f in SAMPLE_FIELDS]}, limit=1):
+        return False
+    return not any(db[col].count_documents({"audio_path": {"$in": variants}}, limit=1) for col in EVIDENCE_COLLECTIONS)
+
+
+def _in_student_samples(db, ref):
+    variants = list({ref, _key(ref)})
+    return bool(db.students.count_documents({"$or": [{f: {"$in": variants}} for f in SAMPLE_FIELDS]}, limit=1))
+
+
+# -----------------------------
+# Candidates
+# -----------------------------
+def _stored_audio():
+    """(ref, size, created) for every blob and every file in the legacy dirs."""
+    yield from audio_store.get_store().iter_blobs()
+    for d in LEGACY_AUDIO_DIRS:
+        if not os.path.isdir(d):
+            continue
+        for dirpath, _, filenames in os.walk(d):
+            for name in filenames:
+                if not name.lower().endswith(AUDIO_EXTENSIONS):
+                    continue
+                path = os.path.join(dirpath, name)
+                st = os.stat(path)
+                yield path, st.st_size, datetime.fromtimestamp(st.st_mtime, timezone.utc)
+
+
+def _age_hours(created, now):
+    return (now - created).total_seconds() / 3600.0
+
+
+# -----------------------------
+# Transcoding
+# -----------------------------
+def _transcode(ref, codec=RETENTION_CODEC):
+    """Return (new_ref, new_size) for a WAV reference, or None if not worth it."""
+    with audio_store.open_audio(ref) as f:
+        info = sf.info(f)
+        if info.format != "WAV":
+            return None
+        f.seek(0)
+        if info.subtype in ("PCM_S8", "PCM_16", "PCM_24"):
+            subtype, dtype = info.subtype, "int32"  # bit-exact
+        else:
+            subtype, dtype = "PCM_24", "float32"  # float/32-bit WAV: FLAC tops out at 24 bits
+        data, sr = sf.read(f, dtype=dtype)
+    buf = io.BytesIO()
+    if codec == "opus":
+        try:
+            sf.write(buf, data, sr, format="OGG", subtype="OPUS")
+            content_type = "audio/ogg"
+        except Exception:
+            buf = io.BytesIO()  # sample rate Opus can't take: fall back to lossless
+            codec = "flac"
+    if codec == "flac":
+        sf.write(buf, data, sr, format="FLAC", subtype=subtype)
+        content_type = "audio/flac"
+    new_size = buf.tell()
+    if new_size >= audio_store.size(ref):
+        return None
+    buf.seek(0)
+    return audio_store.put_stream(buf, content_type), new_size
+
+
+def _repoint(db, old_ref, new_ref):
+    variants = list({old_ref, _key(old_ref)})
+    for col in EVIDENCE_COLLECTIONS:
+        db[col].update_many({"audio_path": {"$in": variants}}, {"$set": {"audio_path": new_ref}})
+
+
+# -----------------------------
+# Pass
+# -----------------------------
+def live_busy():
+    """True while roll-call is recording or waiting on/using inference."""
+    live = admission.controller.stats()["classes"]["live"]
+    return live["inflight"] > 0 or live["queued"] > 0 or session_scheduler.stats()["capturing"] > 0
+
+
+def _batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _pace(should_yield, pause):
+    time.sleep(pause)
+    while should_yield():
+        time.sleep(max(pause, 1.0))
+
+
+def run_once(db=None, dry_run=False, should_yield=live_busy,
+             batch_size=RETENTION_BATCH_SIZE, pause=RETENTION_BATCH_PAUSE_SECONDS):
+    """One retention pass. Returns (and stores) a report."""
+    if db is None:
+        from mongodb import get_db
+        db = get_db()
+    now = datetime.now(timezone.utc)
+    report = {
+        "started_at": now,
+        "dry_run": dry_run,
+        "codec": RETENTION_CODEC,
+        "scanned": 0,
+        "deleted": 0,
+        "deleted_bytes": 0,
+        "transcoded": 0,
+        "transcoded_bytes_saved": 0,
+        "skipped_protected": 0,
+        "errors": 0,
+    }
+    protected, samples, referenced, evidence = _scan_references(db)
+
+    expired, compressible = [], []
+    for ref, size, created in _stored_audio():
+        report["scanned"] += 1
+        key = _key(ref)
+        age = _age_hours(created, now)
+        if key in protected:
+            report["skipped_protected"] += 1
+        elif key not in referenced:
+            if age >= RETENTION_TEMP_TTL_HOURS:
+                expired.append((ref, size))
+        elif key in evidence and key not in samples and age >= RETENTION_COMPRESS_AFTER_HOURS:
+            compressible.append((evidence[key], size))
+
+    report["expired_candidates"] = len(expired)
+    report["compress_candidates"] = len(compressible)
+
+    for batch in _batches(expired, batch_size):
+        for ref, size in batch:
+            try:
+                if not _still_unreferenced(db, ref):
+                    continue
+                if not dry_run and not audio_store.delete(ref):
+                    continue
+                report["deleted"] += 1
+                report["deleted_bytes"] += size
+            except Exception as e:
+                report["errors"] += 1
+                print(f"⚠️ Retention could not delete {ref}: {e}")
+        _pace(should_yield, pause)
+
+    for batch in _batches(compressible, batch_size):
+        for ref, size in batch:
+            try:
+                if dry_run or _in_student_samples(db, ref):
+                    continue
+                result = _transcode(ref)
+                if result is None:
+                    continue
+                new_ref, new_size = result
+                _repoint(db, ref, new_ref)
+                report["transcoded"] += 1
+                # a feedback call may have claimed the WAV meanwhile: then it stays
+                if _still_unreferenced(db, ref) and audio_store.delete(ref):
+                    report["transcoded_bytes_saved"] += size - new_size
+            except Exception as e:
+                report["errors"] += 1
+                print(f"⚠️ Retention could not transcode {ref}: {e}")
+        _pace(should_yield, pause)
+
+    report["bytes_reclaimed"] = report["deleted_bytes"] + report["transcoded_bytes_saved"]
+    report["finished_at"] = datetime.now(timezone.utc)
+    db.retention_runs.insert_one(dict(report))
+    print(
+        f"🧹 Audio retention{' (dry run)' if dry_run else ''}: deleted {report['deleted']}, "
+        f"transcoded {report['transcoded']}, reclaimed {report['bytes_reclaimed'] / 1e6:.1f} MB"
+    )
+    return report
+
+
+def last_report(db):
+    return db.retention_runs.find_one({}, {"_id": 0}, sort=[("started_at", -1)])
+
+
+# -----------------------------
+# Single-runner lock + background loop
+# -----------------------------
+def _acquire_lock(db, owner):
+    now = time.time()
+    try:
+        doc = db.maintenance_locks.find_one_and_update(
+            {"_id": LOCK_ID, "expires": {"$lt": now}},
+            {"$set": {"owner": owner, "expires": now + LOCK_SECONDS}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        return False  # another worker holds it
+    return bool(doc and doc.get("owner") == owner)
+
+
+def _release_lock(db, owner):
+    db.maintenance_locks.update_one({"_id": LOCK_ID, "owner": owner}, {"$set": {"expires": 0}})
+
+
+def run_exclusive(db=None, dry_run=False):
+    """run_once() unless another worker is already running a pass (then None)."""
+    from session_registry import WORKER_ID
+    if db is None:
+        from mongodb import get_db
+        db = get_db()
+    if not _acquire_lock(db, WORKER_ID):
+        return None
+    try:
+        return run_once(db, dry_run=dry_run)
+    finally:
+        _release_lock(db, WORKER_ID)
+
+
+def start_background(interval_hours=RETENTION_INTERVAL_HOURS):
+    if interval_hours <= 0:
+        return None
+
+    def _loop():
+        while True:
+            time.sleep(interval_hours * 3600)
+            try:
+                run_exclusive()
+            except Exception as e:
+                print(f"⚠️ Audio retention pass failed: {e}")
+
+    thread = threading.Thread(target=_loop, daemon=True, name="audio-retention")
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run one audio retention pass")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    print(run_exclusive(dry_run=args.dry_run) or "⚠️ Another worker is running retention")
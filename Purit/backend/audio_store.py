@@ -0,0 +1,306 @@
+# audio_store.py
+"""
+Content-addressed audio storage.
+
+Audio used to be stored as relative paths (./uploads, ./tmp, ./tmp_audio,
+../samples) resolved against the process's working directory, which breaks
+as soon as a second node or another cwd is involved, and the same clip
+could be saved several times. Audio now goes into a blob store keyed by
+the SHA-256 of its bytes:
+
+- references look like "blob:<sha256>" and are what Mongo stores in
+  `voice_samples`, `verified_samples` and attendance `audio_path` fields;
+- identical clips are stored once;
+- reads are streamed (soundfile reads straight from the blob handle).
+
+Backends: local filesystem (AUDIO_STORE=local:/path, the default
+local:./audio_blobs) or GridFS (AUDIO_STORE=gridfs, bucket `audio`), which
+every node sharing the Mongo database can read.
+
+Legacy path references still resolve, so old records keep working until
+`python audio_store.py migrate` rewrites them to blob ids.
+"""
+import hashlib
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+import soundfile as sf
+
+AUDIO_STORE = os.getenv("AUDIO_STORE", "local:./audio_blobs")
+BLOB_PREFIX = "blob:"
+CHUNK = 1 << 20
+
+
+def is_blob(ref):
+    return isinstance(ref, str) and ref.startswith(BLOB_PREFIX)
+
+
+def _digest(ref):
+    digest = ref[len(BLOB_PREFIX):]
+    if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+        raise ValueError(f"Malformed blob reference: {ref!r}")
+    return digest
+
+
+def _legacy_path(ref):
+    return str(pathlib.Path(ref))  # normalize slashes for Windows/Linux
+
+
+# -----------------------------
+# Local filesystem backend
+# -----------------------------
+class LocalBlobStore:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._staging = os.path.join(self.root, ".staging")
+        os.makedirs(self._staging, exist_ok=True)
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def put_stream(self, src, content_type=None):
+        h = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=self._staging)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in iter(lambda: src.read(CHUNK), b""):
+                    h.update(chunk)
+                    out.write(chunk)
+            digest = h.hexdigest()
+            final = self._path(digest)
+            if os.path.exists(final):
+                os.remove(tmp)  # duplicate clip: keep the stored copy
+                os.utime(final)  # ...but count it as fresh for retention
+            else:
+                os.makedirs(os.path.dirname(final), exist_ok=True)
+                os.replace(tmp, final)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return BLOB_PREFIX + digest
+
+    def open(self, digest):
+        return open(self._path(digest), "rb")
+
+    def exists(self, digest):
+        return os.path.exists(self._path(digest))
+
+    def size(self, digest):
+        return os.path.getsize(self._path(digest))
+
+    def delete(self, digest):
+        try:
+            os.remove(self._path(digest))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def iter_blobs(self):
+        """Yield (blob_ref, size, created datetime) for every stored blob."""
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if d != ".staging"]
+            for name in filenames:
+                st = os.stat(os.path.join(dirpath, name))
+                yield BLOB_PREFIX + name, st.st_size, datetime.fromtimestamp(st.st_mtime, timezone.utc)
+
+
+# -----------------------------
+# GridFS backend
+# -----------------------------
+class GridFSBlobStore:
+    def __init__(self, db=None, bucket="audio"):
+        import gridfs
+        if db is None:
+            from mongodb import get_db
+            db = get_db()
+        self._gridfs = gridfs
+        self.bucket = gridfs.GridFSBucket(db, bucket_name=bucket)
+        self.files = db[f"{bucket}.files"]
+
+    def put_stream(self, src, content_type=None):
+        h = hashlib.sha256()
+        # hash first (the id is the hash), spilling to disk for large clips
+        with tempfile.SpooledTemporaryFile(max_size=8 * CHUNK) as spool:
+            for chunk in iter(lambda: src.read(CHUNK), b""):
+                h.update(chunk)
+                spool.write(chunk)
+            digest = h.hexdigest()
+            if self.exists(digest):
+                # duplicate clip: count it as fresh for retention
+                self.files.update_one({"_id": digest}, {"$set": {"uploadDate": datetime.now(timezone.utc)}})
+            else:
+                spool.seek(0)
+                try:
+                    self.bucket.upload_from_stream_with_id(
+                        digest, digest, spool, metadata={"content_type": content_type},
+                    )
+                except Exception:
+                    if not self.exists(digest):  # lost a race with an identical upload is fine
+                        raise
+        return BLOB_PREFIX + digest
+
+    def open(self, digest):
+        return self.bucket.open_download_stream(digest)
+
+    def exists(self, digest):
+        return self.files.count_documents({"_id": digest}, limit=1) > 0
+
+    def size(self, digest):
+        doc = self.files.find_one({"_id": digest}, {"length": 1})
+        return doc["length"] if doc else 0
+
+    def delete(self, digest):
+        try:
+            self.bucket.delete(digest)
+            return True
+        except self._gridfs.errors.NoFile:
+            return False
+
+    def iter_blobs(self):
+        for doc in self.files.find({}, {"length": 1, "uploadDate": 1}):
+            created = doc["uploadDate"]
+            if created.tzinfo is None:
+                created = created.replace(tzinfo=timezone.utc)
+            yield BLOB_PREFIX + doc["_id"], doc["length"], created
+
+
+# -----------------------------
+# Store selection
+# -----------------------------
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            if AUDIO_STORE == "gridfs":
+                _store = GridFSBlobStore()
+            else:
+                _store = LocalBlobStore(AUDIO_STORE[len("local:"):] if AUDIO_STORE.startswith("local:") else AUDIO_STORE)
+        return _store
+
+
+# -----------------------------
+# Reference helpers (blob ids or legacy paths)
+# -----------------------------
+def put_stream(src, content_type=None):
+    return get_store().put_stream(src, content_type)
+
+
+def put_bytes(data, content_type=None):
+    import io
+    return put_stream(io.BytesIO(data), content_type)
+
+
+def put_file(path, content_type=None, remove=False):
+    """Store a local file; with remove=True the original is deleted afterwards."""
+    with open(path, "rb") as f:
+        ref = put_stream(f, content_type)
+    if remove:
+        os.remove(path)
+    return ref
+
+
+def open_audio(ref):
+    """Binary, seekable stream for a blob id or a legacy path."""
+    if is_blob(ref):
+        return get_store().open(_digest(ref))
+    return open(_legacy_path(ref), "rb")
+
+
+def exists(ref):
+    if not ref:
+        return False
+    if is_blob(ref):
+        try:
+            return get_store().exists(_digest(ref))
+        except ValueError:
+            return False
+    return os.path.exists(_legacy_path(ref))
+
+
+def size(ref):
+    if is_blob(ref):
+        return get_store().size(_digest(ref))
+    return os.path.getsize(_legacy_path(ref))
+
+
+def delete(ref):
+    """Remove a blob or legacy file; True if something was deleted."""
+    if is_blob(ref):
+        return get_store().delete(_digest(ref))
+    try:
+        os.remove(_legacy_path(ref))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def read_audio(ref, dtype="float32"):
+    """(samples, sample_rate) for a blob id or a legacy path."""
+    with open_audio(ref) as f:
+        return sf.read(f, dtype=dtype)
+
+
+def copy_to(ref, path):
+    """Write a reference's bytes to a local file (for tools that need a path)."""
+    with open_audio(ref) as src, open(path, "wb") as dst:
+        shutil.copyfileobj(src, dst, CHUNK)
+    return path
+
+
+# -----------------------------
+# Migration of legacy path references
+# -----------------------------
+def migrate_legacy_paths(db):
+    """Rewrite path references in students and attendance records to blob ids."""
+    converted = {}
+    stats = {"stored": 0, "missing": 0, "documents": 0}
+
+    def convert(ref):
+        if not ref or is_blob(ref):
+            return ref
+        if ref not in converted:
+            if os.path.exists(_legacy_path(ref)):
+                converted[ref] = put_file(_legacy_path(ref))
+                stats["stored"] += 1
+            else:
+                converted[ref] = ref
+                stats["missing"] += 1
+        return converted[ref]
+
+    for student in db.students.find({}, {"voice_samples": 1, "verified_samples": 1, "invalid_samples": 1}):
+        update = {}
+        for field in ("voice_samples", "verified_samples", "invalid_samples"):
+            refs = student.get(field) or []
+            new = [convert(r) for r in refs]
+            if new != refs:
+                update[field] = new
+        if update:
+            db.students.update_one({"_id": student["_id"]}, {"$set": update})
+            stats["documents"] += 1
+
+    for col in ("temp_attendance", "attendance", "checkins"):
+        for doc in db[col].find({"audio_path": {"$exists": True, "$not": {"$regex": f"^{BLOB_PREFIX}"}}}, {"audio_path": 1}):
+            new = convert(doc["audio_path"])
+            if new != doc["audio_path"]:
+                db[col].update_one({"_id": doc["_id"]}, {"$set": {"audio_path": new}})
+                stats["documents"] += 1
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Audio blob store utilities")
+    parser.add_argument("command", choices=["migrate"])
+    args = parser.parse_args()
+    if args.command == "migrate":
+        from mongodb import get_db
+        print(f"✅ Migrated legacy audio paths: {migrate_legacy_paths(get_db())}")
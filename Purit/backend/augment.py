@@ -0,0 +1,269 @@
+# augment.py
+"""
+Batched training augmentation on log-mel feature tensors.
+
+Training reads precomputed features (feature_shards.py), so augmentation
+runs on whole collated batches (B, 1, n_mels, frames) as tensor ops on the
+training device instead of per clip in NumPy:
+
+- speed:  time-axis resampling (x0.9..x1.1) via cached interpolation matrices
+- pitch:  mel-axis warp (±PITCH_SHIFT of the axis) via cached matrices
+- gain + noise: mixed in the power domain with a cached noise bank
+  (white/pink/brown, plus any WAVs in --noise-dir) at a random SNR
+- specaugment: random time and frequency masks
+
+wav_to_logmelspec() standardizes every clip (dB relative to its peak, then
+z-scored), so absolute gain is a no-op on the features; gain here scales
+the clip against the noise, i.e. it jitters the effective SNR, and is
+rejected without "noise". To mix in the power domain one feature unit is
+taken as DB_PER_UNIT dB.
+
+    python augment.py --bench      # augmentation cost vs. a forward/backward step
+"""
+import glob
+import os
+import time
+
+import numpy as np
+import torch
+
+from dataset import SAMPLE_RATE, N_MELS, N_FFT, HOP_LENGTH, load_wav
+
+DB_PER_UNIT = 15.0
+NOISE_BANK_SECONDS = 8.0
+NOISE_BANK_SEED = 1234
+
+DEFAULT_OPS = ("speed", "pitch", "gain", "noise", "specaugment")
+
+
+# -----------------------------
+# Cached kernels
+# -----------------------------
+def _interp_matrix(n, factor):
+    """(n, n) matrix W with (W @ v)[i] = v linearly sampled at i * factor (edge-clamped)."""
+    pos = np.clip(np.arange(n) * factor, 0, n - 1)
+    lo = np.floor(pos).astype(int)
+    hi = np.minimum(lo + 1, n - 1)
+    frac = pos - lo
+    w = np.zeros((n, n), dtype=np.float32)
+    w[np.arange(n), lo] += 1.0 - frac
+    w[np.arange(n), hi] += frac
+    return torch.from_numpy(w)
+
+
+def _noise_mel_power(wav, n_mels=N_MELS):
+    import librosa
+    return librosa.feature.melspectrogram(
+        y=wav.astype(np.float32), sr=SAMPLE_RATE, n_fft=N_FFT, hop_length=HOP_LENGTH, n_mels=n_mels,
+    )
+
+
+def _colored_noise(n, exponent, rng):
+    """1/f^exponent noise: 0 white, 1 pink, 2 brown."""
+    spectrum = np.fft.rfft(rng.standard_normal(n))
+    freqs = np.maximum(np.fft.rfftfreq(n), 1.0 / n)
+    wav = np.fft.irfft(spectrum / freqs ** (exponent / 2.0), n)
+    return wav / (np.abs(wav).max() + 1e-9)
+
+
+def build_noise_bank(noise_dir=None, seconds=NOISE_BANK_SECONDS, seed=NOISE_BANK_SEED, n_mels=N_MELS):
+    """(K, n_mels, L) mel power spectra, each normalized to unit mean power."""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * SAMPLE_RATE)
+    wavs = [_colored_noise(n, e, rng) for e in (0.0, 1.0, 2.0)]
+    for path in sorted(glob.glob(os.path.join(noise_dir, "*.wav"))) if noise_dir else []:
+        try:
+            wav = load_wav(path, duration=seconds)
+            if np.abs(wav).max() > 0:
+                wavs.append(wav)
+        except Exception as e:
+            print(f"⚠️ Skipping noise file {path}: {e}")
+    bank = np.stack([_noise_mel_power(w, n_mels) for w in wavs])
+    bank /= bank.mean(axis=(1, 2), keepdims=True) + 1e-12
+    return torch.from_numpy(bank.astype(np.float32))
+
+
+# -----------------------------
+# Batch augmentation
+# -----------------------------
+class BatchAugment:
+    """Callable applied to a (B, 1, n_mels, frames) batch; each op fires per sample with probability `p`."""
+
+    def __init__(self, ops=DEFAULT_OPS, p=0.5, speed=(0.9, 0.95, 1.05, 1.1), pitch_shift=0.05,
+                 gain_db=6.0, snr_db=(5.0, 25.0), time_mask=20, freq_mask=8, n_masks=2,
+                 noise_dir=None, device="cpu", seed=None):
+        unknown = set(ops) - set(DEFAULT_OPS)
+        if unknown:
+            raise ValueError(f"Unknown augmentation(s): {', '.join(sorted(unknown))}")
+        if "gain" in ops and "noise" not in ops:
+            raise ValueError("'gain' only jitters the SNR of 'noise'; on its own standardization undoes it")
+        self.ops = tuple(ops)
+        self.p = p
+        self.speed = (1.0,) + tuple(f for f in speed if f != 1.0)
+        self.pitch = (1.0, 1.0 - pitch_shift, 1.0 - pitch_shift / 2, 1.0 + pitch_shift / 2, 1.0 + pitch_shift)
+        self.gain_db = gain_db
+        self.snr_db = snr_db
+        self.time_mask = time_mask
+        self.freq_mask = freq_mask
+        self.n_masks = n_masks
+        self.device = torch.device(device)
+        self.generator = torch.Generator(device=self.device)
+        self.generator.manual_seed(seed if seed is not None else torch.seed() & 0xFFFFFFFF)
+        self._kernels = {}
+        self._noise_dir = noise_dir
+        self._banks = {}  # per n_mels
+
+    def __repr__(self):
+        return f"BatchAugment(ops={','.join(self.ops)}, p={self.p})"
+
+    def __getstate__(self):
+        # torch.Generator does not survive pickling into a spawned process
+        # (train.py --distributed); kernels and noise banks are rebuilt there on demand
+        state = dict(self.__dict__)
+        state.update(generator=None, _kernels={}, _banks={})
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.generator = torch.Generator(device=self.device)
+        self.generator.manual_seed(torch.seed() & 0xFFFFFFFF)  # fresh draws in every process
+
+    # ---- helpers ----
+    def _rand(self, *shape):
+        return torch.rand(*shape, generator=self.generator, device=self.device)
+
+    def _fire(self, b):
+        return self._rand(b) < self.p
+
+    def _kernel_stack(self, kind, n, factors):
+        key = (kind, n, factors)
+        if key not in self._kernels:
+            self._kernels[key] = torch.stack([_interp_matrix(n, f) for f in factors]).to(self.device)
+        return self._kernels[key]
+
+    def _choice(self, b, k):
+        """Per-sample factor index: 0 (identity) unless the op fires, else uniform over 1..k-1."""
+        idx = torch.randint(1, k, (b,), generator=self.generator, device=self.device)
+        return torch.where(self._fire(b), idx, torch.zeros_like(idx))
+
+    def noise_bank(self, n_mels=N_MELS):
+        if n_mels not in self._banks:
+            self._banks[n_mels] = build_noise_bank(self._noise_dir, n_mels=n_mels).to(self.device)
+        return self._banks[n_mels]
+
+    # ---- ops ----
+    def _speed(self, x):
+        b, _, m, t = x.shape
+        kernels = self._kernel_stack("time", t, self.speed)[self._choice(b, len(self.speed))]  # (B, T, T)
+        return torch.matmul(x.squeeze(1), kernels.transpose(1, 2)).unsqueeze(1)
+
+    def _pitch(self, x):
+        b, _, m, t = x.shape
+        # output bin i reads input bin i / factor: factor > 1 moves energy up the mel axis
+        factors = tuple(1.0 / f for f in self.pitch)
+        kernels = self._kernel_stack("freq", m, factors)[self._choice(b, len(factors))]  # (B, M, M)
+        return torch.matmul(kernels, x.squeeze(1)).unsqueeze(1)
+
+    def _gain_noise(self, x, gain, noise):
+        b, _, m, t = x.shape
+        power = torch.pow(10.0, x * (DB_PER_UNIT / 10.0))
+        level = power.mean(dim=(1, 2, 3), keepdim=True)
+        if gain:
+            db = (self._rand(b) * 2 - 1) * self.gain_db * self._fire(b)
+            power = power * torch.pow(10.0, db / 10.0).view(b, 1, 1, 1)
+        if noise:
+            bank = self.noise_bank(m)
+            k = torch.randint(0, bank.shape[0], (b,), generator=self.generator, device=self.device)
+            span = bank.shape[2] - t
+            off = (self._rand(b) * max(span, 0)).long()
+            frames = (off[:, None] + torch.arange(t, device=self.device)[None, :]) % bank.shape[2]  # (B, T)
+            n = bank[k[:, None, None], torch.arange(m, device=self.device)[None, :, None], frames[:, None, :]]
+            lo, hi = self.snr_db
+            snr = lo + self._rand(b) * (hi - lo)
+            scale = level.view(b) * torch.pow(10.0, -snr / 10.0) * self._fire(b)
+            power = power + n.unsqueeze(1) * scale.view(b, 1, 1, 1)
+        db = 10.0 * torch.log10(power.clamp_min(1e-10))
+        mean = db.mean(dim=(1, 2, 3), keepdim=True)
+        std = db.std(dim=(1, 2, 3), keepdim=True)
+        return (db - mean) / (std + 1e-9)
+
+    def _specaugment(self, x):
+        b, _, m, t = x.shape
+        keep = torch.ones(b, m, t, dtype=torch.bool, device=self.device)
+        for _ in range(self.n_masks):
+            for axis, size, width in ((2, t, self.time_mask), (1, m, self.freq_mask)):
+                w = (self._rand(b) * (width + 1)).long() * self._fire(b)
+                start = (self._rand(b) * (size - w + 1).clamp_min(1)).long()
+                pos = torch.arange(size, device=self.device)[None, :]
+                band = (pos >= start[:, None]) & (pos < (start + w)[:, None])  # (B, size)
+                keep &= ~(band[:, None, :] if axis == 2 else band[:, :, None])
+        return x * keep.unsqueeze(1)  # 0 is the per-clip mean of standardized features
+
+    def __call__(self, x):
+        ops = self.ops
+        if "speed" in ops:
+            x = self._speed(x)
+        if "pitch" in ops:
+            x = self._pitch(x)
+        if "gain" in ops or "noise" in ops:
+            x = self._gain_noise(x, "gain" in ops, "noise" in ops)
+        if "specaugment" in ops:
+            x = self._specaugment(x)
+        return x
+
+
+def from_args(spec, device="cpu", **kwargs):
+    """BatchAugment from a comma-separated op list ('none'/'' disables, 'all' = every op)."""
+    if not spec or spec == "none":
+        return None
+    ops = DEFAULT_OPS if spec == "all" else tuple(o.strip() for o in spec.split(",") if o.strip())
+    return BatchAugment(ops=ops, device=device, **kwargs)
+
+
+# -----------------------------
+# Overhead measurement
+# -----------------------------
+def benchmark(augment, model, batch_size=32, frames=None, steps=50, device="cpu"):
+    """(augment ms/batch, forward+backward ms/batch) on random features."""
+    from dataset import DURATION
+    frames = frames or int(SAMPLE_RATE * DURATION) // HOP_LENGTH + 1
+    x = torch.randn(batch_size, 1, N_MELS, frames, device=device)
+    y = torch.randint(0, model.fc.out_features, (batch_size,), device=device)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-4)
+    criterion = torch.nn.CrossEntropyLoss()
+    model.train()
+    augment(x)  # build kernels / noise bank outside the timing
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        augment(x)
+    aug_ms = (time.perf_counter() - start) * 1000 / steps
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        loss = criterion(model(x), y)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+    step_ms = (time.perf_counter() - start) * 1000 / steps
+    return aug_ms, step_ms
+
+
+if __name__ == "__main__":
+    import argparse
+    from model import SpeakerRecognitionCNN
+
+    parser = argparse.ArgumentParser(description="Measure batch augmentation overhead")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--classes", type=int, default=44)
+    parser.add_argument("--steps", type=int, default=50)
+    args = parser.parse_args()
+
+    model = SpeakerRecognitionCNN(n_classes=args.classes)
+    step_ms = None
+    print(f"{'ops':>12} {'aug ms':>8} {'step ms':>8} {'overhead':>9}")
+    for ops in [(op,) for op in DEFAULT_OPS if op != "gain"] + [("gain", "noise"), DEFAULT_OPS]:
+        aug_ms, step_ms = benchmark(BatchAugment(ops=ops, p=1.0, seed=0), model, args.batch_size, steps=args.steps)
+        label = "all" if ops == DEFAULT_OPS else "+".join(ops)
+        print(f"{label:>12} {aug_ms:8.2f} {step_ms:8.2f} {aug_ms / step_ms:8.1%}")
@@ -0,0 +1,111 @@
+# bench_inference_pool.py
+"""
+Throughput/latency of the embedding model for different worker x thread
+splits of the same core budget, each worker a separate process.
+
+    python bench_inference_pool.py --requests 400 --splits 1x8 2x4 4x2 8x1 --pin
+    python bench_inference_pool.py --splits 4x2 4xall     # 'all' = torch default (oversubscribed)
+
+All requests are submitted at once, so latency includes queueing: a split
+with high throughput but few workers shows up as a long p95.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import torch
+
+import cpu_budget
+from model import SpeakerRecognitionCNN
+
+FRAMES = 126  # ~4 s of audio at hop 512 / 16 kHz
+
+_model = None
+_x = None
+
+
+def _init(counter, workers, threads, pin, checkpoint):
+    global _model, _x
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    if threads:
+        cores = cpu_budget.available_cores()
+        cpu_budget.apply_worker(index, workers, budget=min(len(cores), workers * threads), pin=pin)
+    model = SpeakerRecognitionCNN(n_classes=2)
+    if checkpoint and os.path.exists(checkpoint):
+        ckpt = torch.load(checkpoint, map_location="cpu")
+        labels = ckpt.get("labels") or {}
+        model = SpeakerRecognitionCNN.from_config(len(labels) or 2, ckpt.get("config"))
+        model.load_state_dict(ckpt.get("model_state_dict") or ckpt, strict=False)
+    _model = model.eval()
+    _x = torch.randn(1, 1, model.n_mels, FRAMES)
+    with torch.no_grad():
+        _model.embed(_x)  # warm-up
+
+
+def _embed(_):
+    start = time.perf_counter()
+    with torch.no_grad():
+        _model.embed(_x)
+    return time.perf_counter() - start
+
+
+def run_split(workers, threads, requests, pin, checkpoint):
+    ctx = mp.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=_init,
+        initargs=(ctx.Value("i", 0), workers, threads, pin, checkpoint),
+    ) as pool:
+        # make sure every worker is initialized before timing
+        list(pool.map(_embed, range(workers * 2)))
+        t0 = time.perf_counter()
+        submitted = {}
+        for i in range(requests):
+            submitted[pool.submit(_embed, i)] = time.perf_counter()
+        latencies, service = [], []
+        for fut in as_completed(submitted):
+            latencies.append(time.perf_counter() - submitted[fut])
+            service.append(fut.result())
+        wall = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "throughput": requests / wall,
+        "p50": statistics.median(latencies) * 1000,
+        "p95": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+        "service": statistics.median(service) * 1000,
+    }
+
+
+def parse_split(text):
+    workers, threads = text.lower().split("x")
+    return int(workers), (None if threads == "all" else int(threads))
+
+
+def main():
+    cores = len(cpu_budget.available_cores())
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--splits", nargs="*", default=None, help="WORKERSxTHREADS, e.g. 2x4 or 4xall")
+    parser.add_argument("--pin", action="store_true", help="pin each worker to its own cores")
+    parser.add_argument("--checkpoint", default="speaker_cnn.pt")
+    args = parser.parse_args()
+
+    splits = [parse_split(s) for s in args.splits] if args.splits else [
+        (w, max(1, cores // w)) for w in sorted({1, 2, 4, cores}) if w <= cores
+    ]
+    print(f"{cores} core(s) available, {args.requests} requests per split, pin={args.pin}\n")
+    print(f"{'split':>10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'svc ms':>8}")
+    for workers, threads in splits:
+        r = run_split(workers, threads, args.requests, args.pin, args.checkpoint)
+        label = f"{workers}x{threads or 'all'}"
+        print(f"{label:>10} {r['throughput']:8.1f} {r['p50']:8.1f} {r['p95']:8.1f} {r['service']:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
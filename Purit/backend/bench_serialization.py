@@ -0,0 +1,139 @@
+# bench_serialization.py
+"""
+Compare the old response path (clean_mongo_ids + jsonable_encoder + json.dumps)
+with serialization.dumps on large synthetic class and profile payloads.
+
+    python bench_serialization.py --classes 50 --days 180 --students 60 --profiles 5000
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from serialization import dumps
+
+
+# -----------------------------
+# Old path (as main.py did before)
+# -----------------------------
+def clean_mongo_ids(data):
+    if isinstance(data, list):
+        return [clean_mongo_ids(item) for item in data]
+    elif isinstance(data, dict):
+        return {k: clean_mongo_ids(v) for k, v in data.items()}
+    elif isinstance(data, ObjectId):
+        return str(data)
+    return data
+
+
+def old_render(content):
+    content = jsonable_encoder(clean_mongo_ids(content))
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+# -----------------------------
+# Synthetic payloads
+# -----------------------------
+def make_classes(n_classes, n_days, n_students):
+    start = datetime(2025, 1, 1)
+    classes = []
+    for c in range(n_classes):
+        history = []
+        for d in range(n_days):
+            day = start + timedelta(days=d)
+            history.append({
+                "date": day.strftime("%Y-%m-%d"),
+                "time": "09:00:00",
+                "avg_confidence": random.uniform(60, 99),
+                "checkin_count": n_students,
+                "students": [
+                    {
+                        "_id": ObjectId(),
+                        "class_name": f"class_{c}",
+                        "student_id": f"1GV22CS{s:03d}",
+                        "name": f"Student {s}",
+                        "confidence": round(random.uniform(0, 100), 2),
+                        "status": random.choice(["Present", "Absent", "No Speech"]),
+                        "timestamp": day,
+                        "audio_path": f"./tmp_audio/1GV22CS{s:03d}_{day:%Y%m%d}_090000.wav",
+                    }
+                    for s in range(n_students)
+                ],
+            })
+        classes.append({
+            "_id": ObjectId(),
+            "class_name": f"class_{c}",
+            "department": "CSE",
+            "students": [f"1GV22CS{s:03d}" for s in range(n_students)],
+            "attendance_dates": history,
+            "confidence": 90.0,
+            "status": "Recorded",
+            "date": "2025-06-30",
+            "time": "09:00:00",
+        })
+    return classes
+
+
+def make_profiles(n_profiles, n_days):
+    start = datetime(2025, 1, 1)
+    return [
+        {
+            "voiceId": f"1GV22CS{p:05d}",
+            "name": f"Student {p}",
+            "department": "CSE",
+            "class_name": f"class_{p % 50}",
+            "lastUpdated": "2025-06-30 09:00",
+            "voice_samples": [f"./uploads/1GV22CS{p:05d}_20250101_090000.wav"],
+            "verified_samples": [f"./tmp_audio/1GV22CS{p:05d}_{i}.wav" for i in range(10)],
+            "stats": {
+                (start + timedelta(days=d)).strftime("%Y-%m-%d"): {
+                    "confidences": [random.uniform(60, 99)],
+                    "checkins": 1,
+                }
+                for d in range(n_days)
+            },
+        }
+        for p in range(n_profiles)
+    ]
+
+
+def bench(fn, payload, repeat):
+    best = float("inf")
+    body = b""
+    for _ in range(repeat):
+        t0 = time.process_time()
+        body = fn(payload)
+        best = min(best, time.process_time() - t0)
+    return best, body
+
+
+def report(label, payload, repeat):
+    old_t, old_body = bench(old_render, payload, repeat)
+    new_t, new_body = bench(dumps, payload, repeat)
+    assert json.loads(old_body) == json.loads(new_body), "outputs differ"
+    gz = len(gzip.compress(new_body, compresslevel=6))
+    print(f"\n📦 {label}: {len(new_body) / 1e6:.2f} MB raw, {gz / 1e6:.2f} MB gzip")
+    print(f"   old (clean_mongo_ids + jsonable_encoder + json): {old_t * 1000:9.1f} ms CPU")
+    print(f"   new (orjson + BSON default hook)              : {new_t * 1000:9.1f} ms CPU")
+    print(f"   saved per request: {(old_t - new_t) * 1000:.1f} ms ({old_t / max(new_t, 1e-9):.1f}x faster)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--classes", type=int, default=20)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--students", type=int, default=60)
+    parser.add_argument("--profiles", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    random.seed(0)
+    report(f"GET /classes ({args.classes} classes x {args.days} days x {args.students} students)",
+           make_classes(args.classes, args.days, args.students), args.repeat)
+    report(f"GET /profiles ({args.profiles} profiles, {args.days} days of stats)",
+           make_profiles(args.profiles, args.days), args.repeat)
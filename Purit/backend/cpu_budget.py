@@ -0,0 +1,80 @@
+# cpu_budget.py
+"""
+CPU thread budgeting for inference workers.
+
+By default every torch process (and every thread calling into torch) uses
+all cores for intra-op parallelism. With several inference workers running
+`model.embed` at once that oversubscribes the CPU many times over. Instead,
+a fixed core budget (INFERENCE_CORE_BUDGET, default: the cores this process
+may run on) is split between the workers:
+
+- process workers each get budget // slots intra-op threads and, with
+  INFERENCE_PIN_CORES=1, are pinned to their own contiguous slice of cores.
+  `slots` counts everything running inference at once: for
+  inference_worker.py it is the number of worker processes; for the API's
+  process pool it is the pool size plus the session-scheduler threads
+  (INFERENCE_WORKERS), which embed in the API process at the same time;
+- thread workers share one process, so the process gets
+  budget // concurrent callers intra-op threads (again pool threads plus
+  session-scheduler threads).
+
+Inter-op threads default to 1: the model is a straight chain of ops, so
+there is nothing for an inter-op pool to run in parallel.
+"""
+import os
+
+import torch
+
+
+def available_cores():
+    """Cores this process may run on (respects taskset/cgroup affinity)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+CORE_BUDGET = int(os.getenv("INFERENCE_CORE_BUDGET", "0")) or len(available_cores())
+INTEROP_THREADS = int(os.getenv("INFERENCE_INTEROP_THREADS", "1"))
+PIN_CORES = os.getenv("INFERENCE_PIN_CORES", "0") == "1"
+
+
+def plan(workers, budget=CORE_BUDGET, cores=None):
+    """[(intra_op_threads, [core ids]), ...] for each of `workers` workers."""
+    cores = cores or available_cores()
+    workers = max(1, workers)
+    budget = max(1, min(budget, len(cores)))
+    per_worker = max(1, budget // workers)
+    out = []
+    for i in range(workers):
+        start = (i * per_worker) % budget
+        out.append((per_worker, cores[start:start + per_worker]))
+    return out
+
+
+def _set_threads(intra, interop=INTEROP_THREADS):
+    torch.set_num_threads(intra)
+    try:
+        torch.set_num_interop_threads(interop)
+    except RuntimeError:
+        pass  # only settable before the first parallel op in this process
+
+
+def apply_worker(index, workers, budget=CORE_BUDGET, pin=PIN_CORES, interop=INTEROP_THREADS):
+    """Configure torch (and optionally affinity) for worker `index` of `workers` concurrent slots."""
+    intra, cores = plan(workers, budget)[index % max(1, workers)]
+    _set_threads(intra, interop)
+    pinned = False
+    if pin and cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+        pinned = True
+    print(f"⚙️ Inference worker {index}: {intra} intra-op thread(s), "
+          f"{'pinned to cores ' + ','.join(map(str, cores)) if pinned else 'unpinned'}")
+    return {"intra_op_threads": intra, "interop_threads": interop, "cores": cores if pinned else None}
+
+
+def apply_shared(concurrency, budget=CORE_BUDGET, interop=INTEROP_THREADS):
+    """Configure torch for a process where `concurrency` threads run inference at once."""
+    intra = max(1, budget // max(1, concurrency))
+    _set_threads(intra, interop)
+    print(f"⚙️ Inference threads: {concurrency} concurrent caller(s) x {intra} intra-op thread(s)")
+    return {"intra_op_threads": intra, "interop_threads": interop, "cores": None}
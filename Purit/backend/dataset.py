@@ -97,8 +97,7 @@ import torch
 import numpy as np
 import librosa
 from torch.utils.data import Dataset
-import soundfile as sf
-import pathlib
+import audio_store
 
 SAMPLE_RATE = 16000
 DURATION = 2.0       # seconds
@@ -111,10 +110,10 @@ HOP_LENGTH = 256
 # Audio Loading Utility
 # ---------------------------
 def load_wav(path, sr=SAMPLE_RATE, duration=DURATION):
-    norm_path = str(pathlib.Path(path))
-    if not os.path.exists(norm_path):
-        raise FileNotFoundError(f"Audio file not found: {norm_path}")
-    wav, file_sr = sf.read(norm_path, dtype='float32')
+    # path: blob id or legacy file path
+    if not audio_store.exists(path):
+        raise FileNotFoundError(f"Audio file not found: {path}")
+    wav, file_sr = audio_store.read_audio(path)
     if wav.ndim > 1:
         wav = wav.mean(axis=1)
     if file_sr != sr:
@@ -142,7 +141,8 @@ def wav_to_logmelspec(wav, sr=SAMPLE_RATE, n_mels=N_MELS, n_fft=N_FFT, hop_lengt
 # Custom Dataset Class
 # ---------------------------
 class StudentAudioDataset(Dataset):
-    def __init__(self, records):
+    def __init__(self, records, n_mels=N_MELS):
+        self.n_mels = n_mels
         self.samples = []
         self.label_map = {}
         label_id = 0
@@ -155,11 +155,10 @@ class StudentAudioDataset(Dataset):
 
             # each record now has a list of valid paths
             for p in rec.get("paths", []):
-                norm_path = str(pathlib.Path(p))
-                if os.path.exists(norm_path):
-                    self.samples.append((norm_path, self.label_map[sid]))
+                if audio_store.exists(p):
+                    self.samples.append((p, self.label_map[sid]))
                 else:
-                    print(f"⚠️ Skipping missing file: {norm_path}")
+                    print(f"⚠️ Skipping missing file: {p}")
 
         if not self.samples:
             print("⚠️ No valid audio samples found in dataset!")
@@ -175,6 +174,6 @@ class StudentAudioDataset(Dataset):
             print(f"⚠️ Error loading {path}: {e}")
             wav = np.zeros(int(SAMPLE_RATE * DURATION), dtype=np.float32)
 
-        mel = wav_to_logmelspec(wav)  # (n_mels, time_frames)
+        mel = wav_to_logmelspec(wav, n_mels=self.n_mels)  # (n_mels, time_frames)
         mel = np.expand_dims(mel, axis=0)  # (1, n_mels, time_frames)
         return torch.tensor(mel, dtype=torch.float32), torch.tensor(label, dtype=torch.long)
@@ -0,0 +1,277 @@
+# embedding_gallery.py
+"""
+Reference embeddings published as one memory-mapped float16 file.
+
+Every API/inference worker used to build and hold its own float32 copy of
+every student's reference embedding. Instead, whoever computes embeddings
+publishes them to a single gallery file; every process maps it read-only,
+so the OS page cache holds one copy for the whole host.
+
+File layout (little-endian):
+
+    header   HEADER struct (magic, format, version, count, dim,
+             model_version, index offset/length)
+    matrix   count x dim float16, starting at a 64-byte boundary
+    index    JSON list of [student_id, samples_fingerprint], one per row
+
+Writes go to a temp file that is fsynced and renamed over the old one, so
+readers only ever see a complete gallery. Readers stat the file at most
+once per GALLERY_REFRESH_SECONDS and remap when it was replaced — no
+restart needed. Rows are float16 on disk and upcast when scored.
+"""
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single writer assumed
+    fcntl = None
+
+GALLERY_PATH = os.getenv("GALLERY_PATH", "./embedding_gallery.bin")
+GALLERY_REFRESH_SECONDS = float(os.getenv("GALLERY_REFRESH_SECONDS", "1.0"))
+
+MAGIC = b"VGAL"
+FORMAT = 1
+HEADER = struct.Struct("<4sHHQIIdQQ")  # magic, format, pad, version, count, dim, model_version, index_off, index_len
+ALIGN = 64
+SCORE_BLOCK = 4096
+
+
+def fingerprint(sources):
+    """Short hash of a student's sample list; a changed list means a stale row."""
+    h = hashlib.blake2b(digest_size=8)
+    for s in sources:
+        h.update(str(s).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _model_key(model_version):
+    return float(model_version) if model_version is not None else -1.0
+
+
+# -----------------------------
+# Writing
+# -----------------------------
+def write_gallery(path, entries, dim, version, model_version):
+    """
+    Atomically write a gallery. `entries` is a list of
+    (student_id, fingerprint, embedding) tuples.
+    """
+    index = json.dumps([[sid, fp] for sid, fp, _ in entries]).encode()
+    count = len(entries)
+    matrix_off = -(-HEADER.size // ALIGN) * ALIGN
+    index_off = matrix_off + count * dim * 2
+    header = HEADER.pack(MAGIC, FORMAT, 0, version, count, dim, _model_key(model_version), index_off, len(index))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".gallery-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(b"\0" * (matrix_off - HEADER.size))
+            if count:
+                matrix = np.stack([np.asarray(e, dtype=np.float32) for _, _, e in entries]).astype("<f2")
+                f.write(matrix.tobytes())
+            f.write(index)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class _WriteLock:
+    """Serializes read-merge-write between processes on the same host."""
+
+    def __init__(self, path):
+        self.path = path + ".lock"
+        self._local = threading.Lock()
+        self._f = None
+
+    def __enter__(self):
+        self._local.acquire()
+        if fcntl is not None:
+            self._f = open(self.path, "a+")
+            fcntl.flock(self._f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._f is not None:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+            self._f.close()
+            self._f = None
+        self._local.release()
+
+
+# -----------------------------
+# Reading
+# -----------------------------
+class _Mapped:
+    def __init__(self, path):
+        st = os.stat(path)
+        self.stat_key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with open(path, "rb") as f:
+            raw = f.read(HEADER.size)
+        magic, fmt, _, self.version, count, self.dim, model_version, index_off, index_len = HEADER.unpack(raw)
+        if magic != MAGIC or fmt != FORMAT:
+            raise ValueError(f"{path} is not a format-{FORMAT} embedding gallery")
+        self.model_version = None if model_version < 0 else model_version
+        matrix_off = -(-HEADER.size // ALIGN) * ALIGN
+        # read-only maps: the pages are shared with every other process mapping the file
+        self.matrix = (
+            np.memmap(path, dtype="<f2", mode="r", offset=matrix_off, shape=(count, self.dim))
+            if count else np.zeros((0, self.dim), dtype="<f2")
+        )
+        index = json.loads(bytes(np.memmap(path, dtype=np.uint8, mode="r", offset=index_off, shape=(index_len,))))
+        self.ids = [sid for sid, _ in index]
+        self.rows = {sid: (i, fp) for i, (sid, fp) in enumerate(index)}
+
+
+class EmbeddingGallery:
+    def __init__(self, path=GALLERY_PATH, refresh_seconds=GALLERY_REFRESH_SECONDS):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._mapped = None
+        self._checked = 0.0
+        self._write_lock = _WriteLock(path)
+
+    # ---- reading ----
+    def current(self):
+        """The mapped gallery, remapped if the file was replaced (None if absent)."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked < self.refresh_seconds and self._mapped is not None:
+                return self._mapped
+            self._checked = now
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self._mapped = None
+                return None
+            key = (st.st_ino, st.st_mtime_ns, st.st_size)
+            if self._mapped is None or self._mapped.stat_key != key:
+                try:
+                    self._mapped = _Mapped(self.path)
+                    print(f"🧠 Mapped embedding gallery v{self._mapped.version} ({len(self._mapped.ids)} students)")
+                except (OSError, ValueError, struct.error) as e:
+                    print(f"⚠️ Could not map embedding gallery: {e}")
+                    self._mapped = None
+            return self._mapped
+
+    @property
+    def version(self):
+        mapped = self.current()
+        return mapped.version if mapped else 0
+
+    def get(self, student_id, sources_fingerprint=None, model_version=None):
+        """
+        Zero-copy float16 row for a student, or None if missing or stale
+        (different samples or produced by a different model checkpoint).
+        """
+        mapped = self.current()
+        if mapped is None or mapped.model_version != model_version:
+            return None
+        row = mapped.rows.get(student_id)
+        if row is None or (sources_fingerprint is not None and row[1] != sources_fingerprint):
+            return None
+        return mapped.matrix[row[0]]
+
+    def scores(self, query, student_ids=None, model_version=None):
+        """
+        Cosine scores (rows are unit-norm) of `query` against the gallery,
+        upcast per block. Empty if the rows come from another checkpoint than
+        `model_version` (when given).
+        """
+        mapped = self.current()
+        if mapped is None or not mapped.ids:
+            return {}
+        if model_version is not None and mapped.model_version != model_version:
+            return {}
+        q = np.asarray(query, dtype=np.float32)
+        q = q / (np.linalg.norm(q) + 1e-9)
+        if student_ids is not None:
+            rows = [(sid, mapped.rows[sid][0]) for sid in student_ids if sid in mapped.rows]
+            if not rows:
+                return {}
+            sims = mapped.matrix[[r for _, r in rows]].astype(np.float32) @ q
+            return {sid: float(s) for (sid, _), s in zip(rows, sims)}
+        out = {}
+        for start in range(0, len(mapped.ids), SCORE_BLOCK):
+            block = mapped.matrix[start:start + SCORE_BLOCK].astype(np.float32) @ q
+            out.update(zip(mapped.ids[start:start + SCORE_BLOCK], map(float, block)))
+        return out
+
+    # ---- writing ----
+    def publish(self, updates, model_version, remove=()):
+        """
+        Merge `updates` ({student_id: (fingerprint, embedding)}) into the
+        gallery and atomically write the next version. Rows from another
+        model checkpoint are dropped, since they are no longer comparable.
+        """
+        if not updates and not remove:
+            return self.version
+        with self._write_lock:
+            try:
+                existing = _Mapped(self.path)
+            except (OSError, ValueError, struct.error):
+                existing = None
+            entries = {}
+            version = 1
+            dim = None
+            if existing is not None:
+                version = existing.version + 1
+                if existing.model_version == model_version:
+                    dim = existing.dim
+                    for sid, (i, fp) in existing.rows.items():
+                        entries[sid] = (fp, np.array(existing.matrix[i], dtype=np.float32))
+            for sid in remove:
+                entries.pop(sid, None)
+            for sid, (fp, emb) in updates.items():
+                emb = np.asarray(emb, dtype=np.float32)
+                if dim is not None and emb.shape[0] != dim:
+                    raise ValueError(f"Embedding for {sid} has dim {emb.shape[0]}, gallery has {dim}")
+                dim = emb.shape[0]
+                entries[sid] = (fp, emb / (np.linalg.norm(emb) + 1e-9))
+            write_gallery(
+                self.path,
+                [(sid, fp, emb) for sid, (fp, emb) in sorted(entries.items())],
+                dim or 0,
+                version,
+                model_version,
+            )
+        with self._lock:
+            self._checked = 0.0  # let this process see its own write right away
+        print(f"✅ Published embedding gallery v{version} ({len(entries)} students)")
+        return version
+
+    def is_current(self, model_version):
+        """True if the gallery holds rows produced by `model_version`."""
+        mapped = self.current()
+        return mapped is not None and mapped.model_version == model_version
+
+    def stats(self):
+        mapped = self.current()
+        if mapped is None:
+            return {"path": self.path, "version": 0, "students": 0}
+        return {
+            "path": self.path,
+            "version": mapped.version,
+            "students": len(mapped.ids),
+            "dim": mapped.dim,
+            "model_version": mapped.model_version,
+            "bytes": os.path.getsize(self.path),
+        }
+
+
+gallery = EmbeddingGallery()
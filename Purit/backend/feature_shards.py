@@ -0,0 +1,260 @@
+# feature_shards.py
+"""
+Precomputed training features in a memory-mapped shard.
+
+StudentAudioDataset decodes, resamples and mel-transforms every file on
+every epoch, so training time is dominated by librosa rather than the CNN.
+`build_shard()` does that work once (in parallel) and writes all log-mel
+features as one float16 array plus labels:
+
+    <shard_dir>/<key>.f16    N x 1 x n_mels x frames float16 (raw, C order)
+    <shard_dir>/<key>.json   shape, labels, label_map, audio refs
+
+The key hashes the audio references (content-addressed blob ids, see
+audio_store.py) and the feature parameters, so a retrain on unchanged data
+reuses the existing shard. When the data did change, rows for clips that
+an earlier shard already holds are copied from it, so only new clips are
+decoded. The .json is written last and acts as the commit marker.
+References that no longer exist are skipped (as StudentAudioDataset
+does). A clip that exists but cannot be decoded (e.g. a browser upload
+that is not really WAV) is dropped with a warning: it gets no row and is
+left out of the shard key, so no zero row is ever persisted and reused.
+Undecodable blob refs are listed in <shard_dir>/undecodable-refs.txt
+(blobs never change content), so the next build finds its shard without
+decoding everything again.
+
+ShardDataset reads from the map with zero decode work and, given a list
+of indices, returns a whole batch with one fancy-indexing read.
+"""
+import functools
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+import audio_store
+from dataset import SAMPLE_RATE, DURATION, N_MELS, N_FFT, HOP_LENGTH, load_wav, wav_to_logmelspec
+
+SHARD_DIR = os.getenv("FEATURE_SHARD_DIR", "./feature_shards")
+FEATURE_WORKERS = int(os.getenv("FEATURE_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+
+
+def _samples(records, undecodable=()):
+    """[(audio_ref, label)], label_map — same ordering rules as StudentAudioDataset."""
+    label_map, samples = {}, []
+    for rec in records:
+        sid = rec["student_id"]
+        label_map.setdefault(sid, len(label_map))
+        for ref in rec.get("paths", []):
+            if ref in undecodable:
+                print(f"⚠️ Skipping undecodable file: {ref}")
+            elif audio_store.exists(ref):
+                samples.append((ref, label_map[sid]))
+            else:
+                print(f"⚠️ Skipping missing file: {ref}")
+    return samples, label_map
+
+
+def _undecodable_path(shard_dir):
+    return os.path.join(shard_dir, "undecodable-refs.txt")
+
+
+def _load_undecodable(shard_dir):
+    try:
+        with open(_undecodable_path(shard_dir)) as f:
+            return {line.strip() for line in f if line.strip()}
+    except OSError:
+        return set()
+
+
+def _record_undecodable(shard_dir, refs):
+    blobs = sorted(r for r in refs if audio_store.is_blob(r))  # a path may be fixed in place later
+    if blobs:
+        with open(_undecodable_path(shard_dir), "a") as f:
+            f.writelines(r + "\n" for r in blobs)
+
+
+def _params(n_mels=N_MELS):
+    return [SAMPLE_RATE, DURATION, n_mels, N_FFT, HOP_LENGTH]
+
+
+def shard_key(samples, n_mels=N_MELS):
+    h = hashlib.blake2b(digest_size=12)
+    h.update(json.dumps(_params(n_mels)).encode())
+    for ref, label in samples:
+        h.update(f"{ref}\0{label}\n".encode())
+    return h.hexdigest()
+
+
+def _features(ref, n_mels=N_MELS):
+    """Log-mel features for one clip, or None if it can't be decoded."""
+    try:
+        wav = load_wav(ref)
+    except Exception as e:
+        print(f"⚠️ Dropping undecodable file {ref}: {e}")
+        return None
+    return wav_to_logmelspec(wav, n_mels=n_mels)
+
+
+def _existing_rows(shard_dir, refs, n_mels=N_MELS):
+    """{ref: (data_path, shape, row)} for blob refs already featurized in another shard."""
+    wanted = {r for r in refs if audio_store.is_blob(r)}  # paths may have changed content
+    found = {}
+    for name in os.listdir(shard_dir):
+        if not wanted:
+            break
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(shard_dir, name)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if meta.get("params") != _params(n_mels):
+            continue
+        data_path = os.path.join(shard_dir, name[:-len(".json")] + ".f16")
+        for row, ref in enumerate(meta["refs"]):
+            if ref in wanted:
+                found[ref] = (data_path, tuple(meta["shape"]), row)
+                wanted.discard(ref)
+    return found
+
+
+def build_shard(records, shard_dir=SHARD_DIR, workers=FEATURE_WORKERS, n_mels=N_MELS):
+    """Materialize features for `records`; returns the shard's .json path (reused if present)."""
+    os.makedirs(shard_dir, exist_ok=True)
+    samples, label_map = _samples(records, _load_undecodable(shard_dir))
+    if not samples:
+        raise RuntimeError("❌ Dataset is empty — no valid audio files found to train on.")
+    key = shard_key(samples, n_mels)
+    meta_path = os.path.join(shard_dir, f"{key}.json")
+    if os.path.exists(meta_path):
+        print(f"✅ Reusing feature shard {key} ({len(samples)} samples)")
+        return meta_path
+
+    tmp_path = os.path.join(shard_dir, f"{key}.f16.tmp")
+    refs = [ref for ref, _ in samples]
+    reuse = _existing_rows(shard_dir, refs, n_mels)
+    features = functools.partial(_features, n_mels=n_mels)
+    todo = [i for i, ref in enumerate(refs) if ref not in reuse]
+    out, failed = None, []
+
+    def put(i, mel):
+        nonlocal out
+        if mel is None:
+            failed.append(i)
+            return
+        if out is None:
+            out = np.memmap(tmp_path, dtype="<f2", mode="w+", shape=(len(samples), 1) + mel.shape)
+        out[i, 0] = mel
+
+    if reuse:
+        frames = next(iter(reuse.values()))[1][2:]
+        out = np.memmap(tmp_path, dtype="<f2", mode="w+", shape=(len(samples), 1) + frames)
+        maps = {}
+        for i, ref in enumerate(refs):
+            if ref in reuse:
+                src_path, src_shape, row = reuse[ref]
+                if src_path not in maps:
+                    maps[src_path] = np.memmap(src_path, dtype="<f2", mode="r", shape=src_shape)
+                out[i] = maps[src_path][row]
+        del maps
+    if workers > 1 and len(todo) > 1:
+        # spawn, not fork: the parent may already have torch threads running
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            for i, mel in zip(todo, pool.map(features, [refs[i] for i in todo], chunksize=8)):
+                put(i, mel)
+    else:
+        for i in todo:
+            put(i, features(refs[i]))
+    if failed:
+        _record_undecodable(shard_dir, [refs[i] for i in failed])
+    if out is None:
+        raise RuntimeError("❌ Dataset is empty — none of the audio files could be decoded.")
+    shape = out.shape
+
+    if failed:
+        # drop the undecodable clips: no zero rows, and the key covers only what the shard holds
+        dropped = set(failed)
+        keep = [i for i in range(len(refs)) if i not in dropped]
+        samples, refs = [samples[i] for i in keep], [refs[i] for i in keep]
+        key = shard_key(samples, n_mels)
+        meta_path = os.path.join(shard_dir, f"{key}.json")
+        if os.path.exists(meta_path):
+            del out
+            os.remove(tmp_path)
+            print(f"✅ Reusing feature shard {key} ({len(samples)} samples)")
+            return meta_path
+        shape = (len(keep),) + shape[1:]
+        compact_path = os.path.join(shard_dir, f"{key}.f16.tmp")
+        compact = np.memmap(compact_path, dtype="<f2", mode="w+", shape=shape)
+        for start in range(0, len(keep), 1024):
+            compact[start:start + 1024] = out[keep[start:start + 1024]]
+        compact.flush()
+        del out, compact
+        os.remove(tmp_path)
+        tmp_path = compact_path
+    else:
+        out.flush()
+        del out
+    data_path = os.path.join(shard_dir, f"{key}.f16")
+    os.replace(tmp_path, data_path)
+
+    meta = {
+        "key": key,
+        "shape": shape,
+        "dtype": "<f2",
+        "params": _params(n_mels),
+        "labels": [label for _, label in samples],
+        "label_map": label_map,
+        "refs": refs,
+    }
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+    print(
+        f"✅ Wrote feature shard {key}: {shape[0]} samples ({len(reuse)} reused"
+        f"{f', {len(failed)} undecodable dropped' if failed else ''}), "
+        f"{os.path.getsize(data_path) / 1e6:.1f} MB"
+    )
+    return meta_path
+
+
+class ShardDataset(Dataset):
+    """Features from a shard; `ds[i]` is one sample, `ds[[i, j, ...]]` a whole batch."""
+
+    def __init__(self, meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self.meta_path = meta_path
+        self.data_path = meta_path[:-len(".json")] + ".f16"
+        self.shape = tuple(meta["shape"])
+        self.label_map = meta["label_map"]
+        self.refs = meta["refs"]
+        self.labels = torch.tensor(meta["labels"], dtype=torch.long)
+        self._data = None  # mapped lazily so DataLoader workers each map it themselves
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _map(self):
+        if self._data is None:
+            self._data = np.memmap(self.data_path, dtype="<f2", mode="r", shape=self.shape)
+        return self._data
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_data"] = None
+        return state
+
+    def __getitem__(self, idx):
+        data = self._map()
+        if isinstance(idx, int):
+            return torch.from_numpy(data[idx].astype(np.float32)), self.labels[idx]
+        idx = np.sort(np.asarray(idx))  # sequential reads; order within a shuffled batch doesn't matter
+        return torch.from_numpy(data[idx].astype(np.float32)), self.labels[torch.from_numpy(idx)]
@@ -0,0 +1,129 @@
+# inference_executor.py
+"""
+Executor for CPU-bound inference called from async routes.
+
+Audio decode, resampling and the CNN forward pass must not run on the event
+loop, or every other request stalls behind an upload. Async routes await
+`executor.identify(path)` instead. The work runs in a thread pool (default)
+or a process pool (INFERENCE_EXECUTOR=process), and each worker loads the
+model once when it starts rather than once per request. Torch threads are
+budgeted across all concurrent callers (see cpu_budget.py) so workers do
+not oversubscribe the CPU.
+
+With INFERENCE_EXECUTOR=queue the API does no inference at all: jobs go on
+the shared job queue and separate `inference_worker.py` processes run them.
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing as mp
+
+import cpu_budget
+import job_queue
+from session_scheduler import INFERENCE_WORKERS
+
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")  # thread | process | queue
+INFERENCE_EXECUTOR_WORKERS = int(os.getenv("INFERENCE_EXECUTOR_WORKERS", "2"))
+
+
+# -----------------------------
+# Worker-side functions (top level so a process pool can pickle them)
+# -----------------------------
+def _warmup():
+    from attendance_inference import shared_model
+    try:
+        shared_model.get()
+    except FileNotFoundError as e:
+        print(f"⚠️ Inference worker started without a model: {e}")
+
+
+def _init_process_worker(counter, slots):
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    cpu_budget.apply_worker(index, slots)
+    _warmup()
+
+
+def _identify(audio_path, candidates=None):
+    from attendance_inference import process_attendance
+    return process_attendance(audio_path, candidates)
+
+
+# -----------------------------
+# Executor
+# -----------------------------
+class InferenceExecutor:
+    def __init__(self, kind=INFERENCE_EXECUTOR, workers=INFERENCE_EXECUTOR_WORKERS):
+        if kind not in ("thread", "process", "queue"):
+            raise ValueError("INFERENCE_EXECUTOR must be 'thread', 'process' or 'queue'")
+        self.kind = kind
+        self.workers = max(1, workers)
+        self._pool = None
+        self._started = False
+        self.threads = None
+
+    @property
+    def remote(self):
+        return self.kind == "queue"
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        if self.remote:
+            # no local model or pool: inference_worker.py processes do the work
+            print(f"⚙️ Inference executor forwarding to the job queue ({job_queue.JOB_QUEUE})")
+            return
+        # session scheduler threads in this process run inference too
+        slots = self.workers + INFERENCE_WORKERS
+        self.threads = cpu_budget.apply_shared(slots)
+        if self.kind == "process":
+            # spawn, not fork: torch and the Mongo client are not fork-safe
+            ctx = mp.get_context("spawn")
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=ctx,
+                initializer=_init_process_worker,
+                initargs=(ctx.Value("i", 0), slots),
+            )
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+            # threads share the process-wide model; load it now, not on the first upload
+            self._pool.submit(_warmup)
+        print(f"⚙️ Inference executor started ({self.kind} x{self.workers})")
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        self._started = False
+
+    async def run(self, fn, *args):
+        self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, fn, *args)
+
+    async def identify(self, audio_path, candidates=None):
+        """Identify the speaker of one audio file off the event loop (optionally among `candidates`)."""
+        if self.remote:
+            job_id = await asyncio.to_thread(
+                job_queue.get_queue().enqueue,
+                "identify",
+                {"audio_path": audio_path, "candidates": candidates},
+                job_queue.PRIORITY_UPLOAD,
+            )
+            return await job_queue.wait_async(job_id)
+        return await self.run(_identify, audio_path, candidates)
+
+    def stats(self):
+        s = {"kind": self.kind, "workers": self.workers, "core_budget": cpu_budget.CORE_BUDGET, "threads": self.threads}
+        if self.remote:
+            try:
+                s["queued_jobs"] = job_queue.get_queue().depth()
+            except Exception as e:
+                s["queue_error"] = str(e)
+        return s
+
+
+executor = InferenceExecutor()
@@ -0,0 +1,126 @@
+# inference_worker.py
+"""
+Standalone inference workers for INFERENCE_EXECUTOR=queue.
+
+Each worker process loads the model once, then claims jobs from the shared
+job queue (see job_queue.py), runs them and writes the result back. Run as
+many as the hardware allows, on any host that can reach the queue and the
+audio files, independently of the API:
+
+    python inference_worker.py --workers 4
+    python inference_worker.py --workers 1 --kinds identify
+
+Each worker gets an equal share of INFERENCE_CORE_BUDGET as torch intra-op
+threads; INFERENCE_PIN_CORES=1 also pins it to its own cores.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import signal
+import socket
+import threading
+import time
+
+import cpu_budget
+import job_queue
+
+IDLE_SLEEP_MAX = float(os.getenv("INFERENCE_WORKER_IDLE_MAX", "1.0"))
+
+
+# -----------------------------
+# Job handlers
+# -----------------------------
+def _identify(payload):
+    from attendance_inference import process_attendance
+    return process_attendance(payload["audio_path"], payload.get("candidates"))
+
+
+def _embed(payload):
+    from attendance_inference import DEVICE, compute_embedding, shared_model
+    model, _ = shared_model.get()
+    return compute_embedding(payload["audio_path"], model, DEVICE).tolist()
+
+
+def _reference(payload):
+    from attendance_inference import DEVICE, _average_embedding, shared_model
+    model, _ = shared_model.get()
+    emb = _average_embedding(payload["sources"], model, DEVICE)
+    return emb.tolist() if emb is not None else None
+
+
+HANDLERS = {
+    "identify": _identify,
+    "embed": _embed,
+    "reference": _reference,
+}
+
+
+# -----------------------------
+# Worker loop
+# -----------------------------
+def serve(worker_id, kinds=None, index=0, workers=1):
+    cpu_budget.apply_worker(index, workers)
+    from attendance_inference import shared_model
+
+    stopping = []
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+
+    try:
+        shared_model.get()
+    except FileNotFoundError as e:
+        print(f"⚠️ {worker_id} started without a model: {e}")
+
+    queue = job_queue.get_queue()
+    kinds = list(kinds or HANDLERS)
+    idle = 0.05
+    print(f"⚙️ Inference worker {worker_id} serving {', '.join(kinds)}")
+    while not stopping:
+        try:
+            job = queue.claim(worker_id, kinds)
+        except Exception as e:
+            print(f"⚠️ {worker_id} could not reach the job queue: {e}")
+            job = None
+        if job is None:
+            time.sleep(idle)
+            idle = min(idle * 2, IDLE_SLEEP_MAX)
+            continue
+        idle = 0.05
+        try:
+            result = HANDLERS[job["kind"]](job["payload"])
+        except Exception as e:
+            print(f"❌ {worker_id} job {job['_id']} ({job['kind']}) failed: {e}")
+            queue.fail(job["_id"], e)
+        else:
+            queue.complete(job["_id"], result)
+    print(f"🧹 Inference worker {worker_id} stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run inference workers against the job queue")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INFERENCE_WORKER_PROCESSES", "2")))
+    parser.add_argument("--kinds", nargs="*", choices=sorted(HANDLERS), help="only claim these job kinds")
+    args = parser.parse_args()
+
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    n = max(1, args.workers)
+    # spawn, not fork: torch and the Mongo client are not fork-safe
+    ctx = mp.get_context("spawn")
+    procs = [
+        ctx.Process(target=serve, args=(f"{prefix}:w{i}", args.kinds, i, n), name=f"inference-worker-{i}")
+        for i in range(n)
+    ]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.join()
+
+
+if __name__ == "__main__":
+    main()
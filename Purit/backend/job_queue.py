@@ -0,0 +1,286 @@
+# job_queue.py
+"""
+Pluggable job queue between the API and the inference worker tier.
+
+The API enqueues `identify` / `embed` jobs; `inference_worker.py` processes
+claim them, run the model and write the result back. A claimed job carries
+a lease: if its worker dies, the lease runs out and another worker picks
+the job up again (up to MAX_ATTEMPTS).
+
+Backends: Mongo (`inference_jobs` collection, the default) or SQLite for a
+single host (JOB_QUEUE=sqlite:/path/to/jobs.db).
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+
+JOB_QUEUE = os.getenv("JOB_QUEUE", "mongo")
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "120"))
+
+# live sessions first, then uploads, then anything batch-like
+PRIORITY_LIVE = 10
+PRIORITY_UPLOAD = 5
+PRIORITY_BATCH = 0
+
+
+class JobFailed(RuntimeError):
+    pass
+
+
+# -----------------------------
+# Mongo backend
+# -----------------------------
+class MongoJobQueue:
+    def __init__(self, db=None, collection="inference_jobs"):
+        if db is None:
+            from mongodb import get_db
+            db = get_db()
+        self.col = db[collection]
+        self.col.create_index([("state", ASCENDING), ("priority", DESCENDING), ("created_at", ASCENDING)])
+        self.col.create_index("finished_at", expireAfterSeconds=RESULT_TTL_SECONDS)
+
+    def enqueue(self, kind, payload, priority=0):
+        job_id = uuid.uuid4().hex
+        self.col.insert_one({
+            "_id": job_id,
+            "kind": kind,
+            "payload": payload,
+            "priority": priority,
+            "state": "queued",
+            "attempts": 0,
+            "created_at": datetime.utcnow(),
+            "lease_expires": 0,
+        })
+        return job_id
+
+    def claim(self, worker_id, kinds=None, lease=JOB_LEASE_SECONDS):
+        now = time.time()
+        query = {
+            "$or": [
+                {"state": "queued"},
+                {"state": "running", "lease_expires": {"$lt": now}},
+            ],
+            "attempts": {"$lt": MAX_ATTEMPTS},
+        }
+        if kinds:
+            query["kind"] = {"$in": list(kinds)}
+        return self.col.find_one_and_update(
+            query,
+            {
+                "$set": {"state": "running", "worker": worker_id, "lease_expires": now + lease},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", DESCENDING), ("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def complete(self, job_id, result):
+        self.col.update_one(
+            {"_id": job_id},
+            {"$set": {"state": "done", "result": result, "finished_at": datetime.utcnow()}},
+        )
+
+    def fail(self, job_id, error):
+        job = self.col.find_one({"_id": job_id}, {"attempts": 1})
+        final = not job or job.get("attempts", 0) >= MAX_ATTEMPTS
+        self.col.update_one(
+            {"_id": job_id},
+            {"$set": {
+                "state": "failed" if final else "queued",
+                "error": str(error),
+                "lease_expires": 0,
+                **({"finished_at": datetime.utcnow()} if final else {}),
+            }},
+        )
+
+    def get(self, job_id):
+        return self.col.find_one({"_id": job_id})
+
+    def depth(self):
+        return self.col.count_documents({"state": "queued"})
+
+
+# -----------------------------
+# SQLite backend (single-host stand-in)
+# -----------------------------
+class SQLiteJobQueue:
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT,
+                    payload TEXT,
+                    priority INTEGER,
+                    state TEXT,
+                    attempts INTEGER DEFAULT 0,
+                    created_at REAL,
+                    lease_expires REAL DEFAULT 0,
+                    worker TEXT,
+                    result TEXT,
+                    error TEXT,
+                    finished_at REAL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (state, priority DESC, created_at)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    @staticmethod
+    def _row(cur, row):
+        if row is None:
+            return None
+        job = {d[0]: v for d, v in zip(cur.description, row)}
+        job["_id"] = job.pop("id")
+        job["payload"] = json.loads(job["payload"]) if job["payload"] else None
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def enqueue(self, kind, payload, priority=0):
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, payload, priority, state, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(payload), priority, time.time()),
+            )
+        return job_id
+
+    def claim(self, worker_id, kinds=None, lease=JOB_LEASE_SECONDS):
+        now = time.time()
+        sql = (
+            "SELECT id FROM jobs WHERE (state = 'queued' OR (state = 'running' AND lease_expires < ?)) "
+            "AND attempts < ?"
+        )
+        args = [now, MAX_ATTEMPTS]
+        if kinds:
+            sql += f" AND kind IN ({', '.join('?' for _ in kinds)})"
+            args.extend(kinds)
+        sql += " ORDER BY priority DESC, created_at LIMIT 1"
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(sql, args).fetchone()
+                if row is None:
+                    conn.execute("ROLLBACK")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET state = 'running', worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                    (worker_id, now + lease, row[0]),
+                )
+                cur = conn.execute("SELECT * FROM jobs WHERE id = ?", (row[0],))
+                job = self._row(cur, cur.fetchone())
+                conn.execute("COMMIT")
+                return job
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def complete(self, job_id, result):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = 'done', result = ?, finished_at = ? WHERE id = ?",
+                (json.dumps(result), time.time(), job_id),
+            )
+
+    def fail(self, job_id, error):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET error = ?, lease_expires = 0, "
+                "state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                "finished_at = CASE WHEN attempts >= ? THEN ? ELSE NULL END "
+                "WHERE id = ?",
+                (str(error), MAX_ATTEMPTS, MAX_ATTEMPTS, time.time(), job_id),
+            )
+            conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                (time.time() - RESULT_TTL_SECONDS,),
+            )
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            cur = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            return self._row(cur, cur.fetchone())
+
+    def depth(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued'").fetchone()[0]
+
+
+# -----------------------------
+# Queue selection
+# -----------------------------
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            if JOB_QUEUE.startswith("sqlite:"):
+                _queue = SQLiteJobQueue(JOB_QUEUE[len("sqlite:"):])
+            else:
+                _queue = MongoJobQueue()
+        return _queue
+
+
+def result_of(job):
+    """(finished, result) for a job; raises JobFailed if it failed for good."""
+    if job is None:
+        raise JobFailed("job disappeared from the queue")
+    if job["state"] == "done":
+        return True, job.get("result")
+    if job["state"] == "failed" or job.get("attempts", 0) >= MAX_ATTEMPTS and job["lease_expires"] < time.time():
+        raise JobFailed(job.get("error") or "inference job failed")
+    return False, None
+
+
+def _poll_delays():
+    delay = 0.02
+    while True:
+        yield delay
+        delay = min(delay * 2, 0.25)
+
+
+def wait(job_id, timeout=JOB_TIMEOUT_SECONDS):
+    """Block until a job finishes and return its result."""
+    queue = get_queue()
+    deadline = time.monotonic() + timeout
+    for delay in _poll_delays():
+        finished, result = result_of(queue.get(job_id))
+        if finished:
+            return result
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"inference job {job_id} timed out after {timeout:.0f}s")
+        time.sleep(delay)
+
+
+async def wait_async(job_id, timeout=JOB_TIMEOUT_SECONDS):
+    """Like wait(), but polls from a thread so the event loop stays free."""
+    queue = get_queue()
+    deadline = time.monotonic() + timeout
+    for delay in _poll_delays():
+        finished, result = result_of(await asyncio.to_thread(queue.get, job_id))
+        if finished:
+            return result
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"inference job {job_id} timed out after {timeout:.0f}s")
+        await asyncio.sleep(delay)
+
+
+def run(kind, payload, priority=PRIORITY_BATCH, timeout=JOB_TIMEOUT_SECONDS):
+    """Enqueue a job and wait for a worker to finish it."""
+    return wait(get_queue().enqueue(kind, payload, priority), timeout)
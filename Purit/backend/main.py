@@ -1,7 +1,8 @@
 # main.py
 import os
-import subprocess
-from datetime import datetime
+import re
+import threading
+from datetime import datetime, timedelta
 from typing import Optional
 from bson import ObjectId
 from fastapi import (
@@ -14,19 +15,45 @@ from fastapi import (
     Request
 )
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from fastapi import Request
 
 # Internal modules (ensure these exist in your project)
-from mongodb import get_db, seed_students
+from mongodb import get_db, seed_students, ensure_indexes
 from attendance_inference import (
-    process_attendance,
+    register_student,
     #process_class_attendance,
     start_class_attendance,
     pause_class_attendance,
     resume_class_attendance,
-    finish_class_attendance
+    finish_class_attendance,
+    get_session_status,
+    get_session_snapshot,
 )
+import session_events
+import session_registry
+import session_scheduler
+import admission
+import audio_store
+import audio_retention
+import retrain_manager
+from embedding_gallery import gallery
+from inference_executor import executor as inference_executor
+from attendance_store import (
+    record_checkin,
+    correct_checkin,
+    attendance_rate,
+    attendance_trend,
+    low_attendance,
+    list_checkins,
+)
+import serialization
+from serialization import BSONJSONResponse, dumps
+import response_cache
+from response_cache import cached_json, class_tag, temp_tag
+from pagination import DEFAULT_LIMIT, MAX_LIMIT, clamp_limit, decode_cursor, encode_cursor, page
 # train.py is optional; import if present
 try:
     from train import train_model, get_records_from_mongo
@@ -37,7 +64,9 @@ except Exception:
 # -------------------------------------------------------------------
 # FastAPI app setup
 # -------------------------------------------------------------------
-app = FastAPI(title="PureTone Voice Recognition Backend")
+app = FastAPI(title="PureTone Voice Recognition Backend", default_response_class=BSONJSONResponse)
+# orjson for every route (ObjectIds/datetimes handled by the encoder) + gzip/brotli
+serialization.install(app)
 
 app.add_middleware(
     CORSMiddleware,
@@ -50,8 +79,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
+@app.exception_handler(admission.Overloaded)
+def overloaded_handler(request: Request, exc: admission.Overloaded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc), "traffic_class": exc.traffic_class},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # -------------------------------------------------------------------
 # Startup (seed MongoDB only if empty)
 # -------------------------------------------------------------------
@@ -60,51 +98,28 @@ def startup():
     try:
         db = get_db()
         seed_students()
+        ensure_indexes(db)
         print("✅ MongoDB seed checked (seed_students executed).")
     except Exception as e:
         print(f"⚠️ MongoDB seed failed/skipped: {e}")
-
-# -------------------------------------------------------------------
-# Helper: run model training in background
-# -------------------------------------------------------------------
-def trigger_retrain_background():
-    python = "python"
     try:
-        if os.path.exists("train.py"):
-            subprocess.Popen(
-                [python, "train.py"],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
-            print("🔁 Background model retraining started.")
-        else:
-            print("⚠️ train.py not found — skipping retrain trigger.")
+        orphaned = session_registry.get_store().cleanup_orphans()
+        if orphaned:
+            print(f"🧹 Marked {orphaned} orphaned attendance session(s) as stopped.")
     except Exception as e:
-        print("❌ Background training failed:", e)
-
-# -------------------------------------------------------------------
-# Utilities
-# -------------------------------------------------------------------
-def stringify_id(m):
+        print(f"⚠️ Session registry cleanup skipped: {e}")
+    inference_executor.start()
+    audio_retention.start_background()
+    retrain_manager.start_dispatcher()
     try:
-        if isinstance(m.get("_id"), ObjectId):
-            m["_id"] = str(m["_id"])
-    except Exception:
-        pass
-    return m
-
-
+        session_events.start_tailer()  # SESSION_EVENT_LOG=mongo only
+    except Exception as e:
+        print(f"⚠️ Shared session event log unavailable: {e}")
 
+@app.on_event("shutdown")
+def shutdown():
+    inference_executor.shutdown()
 
-def clean_mongo_ids(data):
-    """Recursively convert ObjectIds to strings for JSON safety."""
-    if isinstance(data, list):
-        return [clean_mongo_ids(item) for item in data]
-    elif isinstance(data, dict):
-        return {k: clean_mongo_ids(v) for k, v in data.items()}
-    elif isinstance(data, ObjectId):
-        return str(data)
-    return data
 # -------------------------------------------------------------------
 # Root
 # -------------------------------------------------------------------
@@ -116,12 +131,84 @@ def root():
 # CLASS MANAGEMENT
 # -------------------------------------------------------------------
 @app.get("/classes")
-def get_classes(date: Optional[str] = Query(None, description="Filter by date YYYY-MM-DD")):
-    db = get_db()
+def get_classes(request: Request, date: Optional[str] = Query(None, description="Filter by date YYYY-MM-DD")):
+    def load():
+        query = {"date": date} if date else {}
+        return list(get_db().classes.find(query))
+    return cached_json(request, ["classes"], load)
+
+# Fields the dashboard header row actually renders
+CLASS_SUMMARY_PROJECTION = {
+    "class_name": 1,
+    "department": 1,
+    "status": 1,
+    "confidence": 1,
+    "date": 1,
+    "time": 1,
+    "checkin_count": 1,
+    "student_count": {"$size": {"$ifNull": ["$students", []]}},
+}
+
+@app.get("/classes/summary")
+def get_class_summaries(
+    request: Request,
+    date: Optional[str] = Query(None, description="Filter by date YYYY-MM-DD"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = None,
+):
+    """Dashboard summary of classes, without attendance history, paged by (class_name, _id)."""
+    limit = clamp_limit(limit)
     query = {"date": date} if date else {}
-    classes = list(db.classes.find(query))
-    classes = [stringify_id(c) for c in classes]
-    return classes
+    after = decode_cursor(cursor, ("class_name", "_id"))
+    if after:
+        # class_name is not unique (classes are keyed on class_name + department): _id breaks ties
+        query["$or"] = [
+            {"class_name": {"$gt": after["class_name"]}},
+            {"class_name": after["class_name"], "_id": {"$gt": after["_id"]}},
+        ]
+
+    def load():
+        rows = list(
+            get_db().classes.find(query, CLASS_SUMMARY_PROJECTION)
+            .sort([("class_name", 1), ("_id", 1)])
+            .limit(limit + 1)
+        )
+        items, next_cursor = page(rows, limit, lambda c: {"class_name": c.get("class_name"), "_id": c["_id"]})
+        return {"items": items, "next_cursor": next_cursor}
+    return cached_json(request, ["classes"], load)
+
+@app.get("/classes/{class_id}/history")
+def get_class_history(
+    class_id: str,
+    start: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    end: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = None,
+):
+    """Newest-first check-in history for a class, one page at a time."""
+    db = get_db()
+    cls = db.classes.find_one({"_id": class_id}, {"class_name": 1}) or \
+        db.classes.find_one({"class_name": class_id}, {"class_name": 1})
+    if not cls:
+        raise HTTPException(status_code=404, detail="Class not found")
+    limit = clamp_limit(limit)
+    try:
+        after = decode_cursor(cursor, ("ts", "_id"))
+        rows = list_checkins(db, cls["class_name"], start=start, end=end, after=after, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    items, next_cursor = page(rows, limit, lambda r: {"ts": r["ts"], "_id": r["_id"]})
+    history = []
+    for r in items:
+        history.append({
+            "student_id": r["meta"]["student_id"],
+            "status": r.get("status"),
+            "confidence": r.get("confidence", 0),
+            "timestamp": r["ts"],
+            "audio_path": r.get("audio_path"),
+            "source": r.get("source"),
+        })
+    return {"class_name": cls["class_name"], "items": history, "next_cursor": next_cursor}
 
 # @app.post("/classes")
 # def create_class(class_data: dict):
@@ -167,6 +254,7 @@ def create_class(class_data: dict):
     # ✅ Clean temp/attendance data for this class if stale
     db.temp_attendance.delete_many({"class_name": class_data.get("class_name")})
     db.attendance.delete_many({"class_name": class_data.get("class_name")})
+    response_cache.invalidate("classes", temp_tag(class_data.get("class_name")))
 
     return {"message": "Class added successfully", "class_id": class_id}
 
@@ -175,24 +263,93 @@ def create_class(class_data: dict):
 
 
 @app.get("/classes/{class_id}/students")
-def get_class_students(class_id: str):
-    db = get_db()
-    cls = db.classes.find_one({"_id": class_id})
-    if not cls:
-        cls = db.classes.find_one({"class_name": class_id})
-    if not cls:
-        raise HTTPException(status_code=404, detail="Class not found")
-    students = list(db.students.find({"class_name": cls.get("class_name")}, {"_id": 0}))
-    return {"class": stringify_id(cls), "students": students}
+def get_class_students(request: Request, class_id: str):
+    def load():
+        db = get_db()
+        cls = db.classes.find_one({"_id": class_id})
+        if not cls:
+            cls = db.classes.find_one({"class_name": class_id})
+        if not cls:
+            raise HTTPException(status_code=404, detail="Class not found")
+        students = list(db.students.find({"class_name": cls.get("class_name")}, {"_id": 0}))
+        return {"class": cls, "students": students}
+    return cached_json(request, lambda c: ["classes", class_tag(c["class"].get("class_name"))], load)
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    """Hit/miss counters for the dashboard response cache."""
+    return response_cache.cache.stats()
+
+# -------------------------------------------------------------------
+# AUDIO RETENTION
+# -------------------------------------------------------------------
+@app.get("/maintenance/retention")
+def get_retention_report():
+    """Last audio retention pass: files deleted/transcoded and bytes reclaimed."""
+    return audio_retention.last_report(get_db()) or {"message": "No retention pass has run yet"}
+
+
+@app.post("/maintenance/retention/run")
+def run_retention(dry_run: bool = Query(False, description="Report what would be removed without touching it")):
+    threading.Thread(
+        target=audio_retention.run_exclusive, kwargs={"dry_run": dry_run}, daemon=True, name="audio-retention-manual",
+    ).start()
+    return {"status": "started", "dry_run": dry_run}
+
+
+# -------------------------------------------------------------------
+# Retraining (single-flight, debounced; see retrain_manager.py)
+# -------------------------------------------------------------------
+@app.get("/retrain/status")
+def get_retrain_status():
+    """Pending trigger state, the running job with its progress, and recent jobs."""
+    return retrain_manager.status(get_db())
+
+
+@app.post("/retrain")
+def request_retrain(reason: str = Query("manual")):
+    return retrain_manager.request_retrain(reason, get_db())
+
+
+@app.post("/retrain/cancel")
+def cancel_pending_retrain():
+    """Drop a retrain that has been requested but not started yet."""
+    return retrain_manager.cancel_pending(get_db())
+
+
+@app.get("/retrain/jobs/{job_id}")
+def get_retrain_job(job_id: str):
+    job = retrain_manager.get_job(job_id, get_db())
+    if not job:
+        raise HTTPException(status_code=404, detail="Retrain job not found")
+    return job
+
+
+@app.post("/retrain/jobs/{job_id}/cancel")
+def cancel_retrain_job(job_id: str):
+    if not retrain_manager.cancel_job(job_id, get_db()):
+        raise HTTPException(status_code=409, detail="Job is not running")
+    return {"status": "cancelling", "job_id": job_id}
+
+
+@app.post("/retrain/jobs/{job_id}/promote")
+def promote_retrain_job(job_id: str):
+    """Make a finished job's checkpoint the live model (when auto-promote is off)."""
+    job = retrain_manager.get_job(job_id, get_db())
+    if not job or job.get("state") != "succeeded" or not os.path.exists(job.get("checkpoint", "")):
+        raise HTTPException(status_code=409, detail="No successful checkpoint for this job")
+    retrain_manager.promote(job["checkpoint"])
+    get_db().retrain_jobs.update_one({"_id": job_id}, {"$set": {"promoted": True}})
+    return {"status": "promoted", "checkpoint": job["checkpoint"]}
 
 # -------------------------------------------------------------------
 # ATTENDANCE CONTROL ROUTES (New)
 # ------------------------------------------------------------------- 
 @app.post("/attendance/start/{class_name}")
-def start_attendance(class_name: str):
+def start_attendance(class_name: str, priority: int = Query(0, description="Higher runs first on the inference pool")):
     """Start a live attendance session for a class."""
     try:
-        result = start_class_attendance(class_name)
+        result = start_class_attendance(class_name, priority=priority)
         return {"status": "started", "class_name": class_name, "message": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -217,28 +374,50 @@ def resume_attendance(class_name: str):
 
 
 
+@app.get("/attendance/scheduler")
+def get_scheduler_stats():
+    """Inference pool and capture slot usage across all live sessions."""
+    stats = session_scheduler.stats()
+    stats["executor"] = inference_executor.stats()
+    stats["admission"] = admission.controller.stats()
+    stats["gallery"] = gallery.stats()
+    return stats
+
+
 @app.get("/attendance/status/{class_name}")
 def check_attendance_status(class_name: str):
-    from attendance_inference import active_sessions
-    session = active_sessions.get(class_name)
-    if not session:
-        return {"status": "completed"}
-    elif session.get("paused"):
-        return {"status": "paused"}
-    elif session.get("stop"):
-        return {"status": "completed"}
-    else:
-        return {"status": "running"}
+    return {"status": get_session_status(class_name)}
+
+
+@app.get("/attendance/stream/{class_name}")
+async def stream_attendance(
+    request: Request,
+    class_name: str,
+    last_event_id: Optional[str] = Query(None, description="Resume after this event id"),
+):
+    """
+    Server-sent events for a live session: `status`, `listening`, `result`
+    and `finished`, plus a `snapshot` on first connect. EventSource sends
+    the Last-Event-ID header on reconnect so missed events are replayed.
+    """
+    if last_event_id is None:
+        last_event_id = request.headers.get("last-event-id")
+    return StreamingResponse(
+        session_events.stream(request, class_name, last_event_id, lambda: get_session_snapshot(class_name)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
     
 
 # newly added this temp
 
 @app.get("/attendance/temp/{class_name}")
-def get_temp_results(class_name: str):
-    db = get_db()
-    data = list(db.temp_attendance.find({"class_name": class_name}, {"_id": 0}))
-    return {"results": data}
+def get_temp_results(request: Request, class_name: str):
+    def load():
+        data = list(get_db().temp_attendance.find({"class_name": class_name}, {"_id": 0}))
+        return {"results": data}
+    return cached_json(request, [temp_tag(class_name)], load)
 
 
 @app.delete("/attendance/temp/{class_name}/clear")
@@ -246,6 +425,7 @@ def clear_temp_attendance(class_name: str):
     """Delete previous temporary attendance for a clean start"""
     db = get_db()
     result = db.temp_attendance.delete_many({"class_name": class_name})
+    response_cache.invalidate(temp_tag(class_name))
     return {"message": f"Cleared {result.deleted_count} temp records for {class_name}"}
 
 
@@ -256,7 +436,6 @@ def clear_temp_attendance(class_name: str):
 def finish_attendance(class_name: str):
     try:
         results = finish_class_attendance(class_name)
-        results = clean_mongo_ids(results)  # ✅ Convert ObjectIds to strings
         return {"status": "completed", "results": results}
     except Exception as e:
         print("❌ Error finishing attendance:", e)
@@ -265,15 +444,8 @@ def finish_attendance(class_name: str):
 
 
 
-@app.post("/attendance/update")
-async def update_attendance(request: Request):
-    """Apply feedback and status updates from frontend"""
+def _apply_attendance_updates(updates):
     db = get_db()
-    updates = await request.json()
-
-    if not isinstance(updates, list):
-        raise HTTPException(status_code=400, detail="Invalid format — expected list")
-
     for u in updates:
         student_id = u.get("student_id")
         class_name = u.get("class_name")
@@ -303,13 +475,27 @@ async def update_attendance(request: Request):
             upsert=True
         )
 
+        # Keep the check-in store and its rollups in line with the correction
+        if class_name and status:
+            correct_checkin(db, class_name, student_id, status)
+
         # ✅ Optionally, sync this corrected status back to student stats
         if status == "Present":
             db.students.update_one(
                 {"student_id": student_id},
                 {"$inc": {"stats.total_checkins": 1}}
             )
+        response_cache.invalidate(class_tag(class_name))
+
+@app.post("/attendance/update")
+async def update_attendance(request: Request):
+    """Apply feedback and status updates from frontend"""
+    updates = await request.json()
+
+    if not isinstance(updates, list):
+        raise HTTPException(status_code=400, detail="Invalid format — expected list")
 
+    await run_in_threadpool(_apply_attendance_updates, updates)
     return {"message": "✅ Attendance updated with feedback corrections"}
 
 
@@ -317,81 +503,34 @@ async def update_attendance(request: Request):
 # -------------------------------------------------------------------
 # OLD ATTENDANCE ROUTES (Still supported for direct audio uploads)
 # -------------------------------------------------------------------
-@app.post("/attendance/{class_id}")
-async def attendance_upload(class_id: str, audio: UploadFile = File(...)):
-    tmp_dir = "./tmp"
-    os.makedirs(tmp_dir, exist_ok=True)
-    filename = f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{audio.filename}"
-    filepath = os.path.join(tmp_dir, filename)
-
-    with open(filepath, "wb") as f:
-        f.write(await audio.read())
-
-    try:
-        result = process_attendance(filepath)
-        student_id = result.get("student_id")
-        confidence = float(result.get("confidence", 0))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Inference failed: {e}")
+def _class_roster(class_id):
+    """Student ids of the class an upload is for (None if the class is unknown)."""
+    db = get_db()
+    cls = db.classes.find_one({"_id": class_id}) or db.classes.find_one({"class_name": class_id})
+    if not cls:
+        return None
+    return [s["student_id"] for s in db.students.find({"class_name": cls.get("class_name")}, {"student_id": 1})] or None
 
+def _record_upload(class_id, student_id, confidence, filepath):
     db = get_db()
-    now = datetime.now()
+    now = datetime.utcnow()  # same clock as session check-ins and the rollups
     date_now = now.strftime("%Y-%m-%d")
     time_now = now.strftime("%H:%M:%S")
 
-    if not student_id:
-        raise HTTPException(status_code=404, detail="Unknown or forged voice detected")
-
     cls = db.classes.find_one({"_id": class_id}) or db.classes.find_one({"class_name": class_id})
     if not cls:
         raise HTTPException(status_code=404, detail="Class not found")
 
-    date_entry = None
-    for d in cls.get("attendance_dates", []):
-        if d.get("date") == date_now:
-            date_entry = d
-            break
-
-    if date_entry:
-        db.classes.update_one(
-            {"_id": cls["_id"], "attendance_dates.date": date_now},
-            {
-                "$push": {
-                    "attendance_dates.$.entries": {
-                        "student_id": student_id,
-                        "confidence": confidence,
-                        "timestamp": now,
-                        "audio_path": filepath,
-                    }
-                },
-                "$inc": {"attendance_dates.$.checkin_count": 1},
-            },
-        )
-        updated = db.classes.find_one(
-            {"_id": cls["_id"], "attendance_dates.date": date_now}, {"attendance_dates.$": 1}
-        )
-        entries = updated["attendance_dates"][0].get("entries", [])
-        avg_conf = sum(e.get("confidence", 0) for e in entries) / (len(entries) or 1)
-        db.classes.update_one(
-            {"_id": cls["_id"], "attendance_dates.date": date_now},
-            {"$set": {"attendance_dates.$.avg_confidence": avg_conf}},
-        )
-    else:
-        new_date_obj = {
-            "date": date_now,
-            "time": time_now,
-            "entries": [
-                {
-                    "student_id": student_id,
-                    "confidence": confidence,
-                    "timestamp": now,
-                    "audio_path": filepath,
-                }
-            ],
-            "avg_confidence": confidence,
-            "checkin_count": 1,
-        }
-        db.classes.update_one({"_id": cls["_id"]}, {"$push": {"attendance_dates": new_date_obj}})
+    record_checkin(
+        db,
+        cls.get("class_name"),
+        student_id,
+        "Present",
+        confidence,
+        ts=now,
+        audio_path=filepath,
+        source="upload",
+    )
 
     db.classes.update_one(
         {"_id": cls["_id"]},
@@ -404,13 +543,32 @@ async def attendance_upload(class_id: str, audio: UploadFile = File(...)):
             }
         },
     )
-    db.students.update_one(
-        {"student_id": student_id},
-        {
-            "$push": {f"stats.{date_now}.confidences": confidence},
-            "$inc": {f"stats.{date_now}.checkins": 1},
-        },
-    )
+    response_cache.invalidate("classes")
+    return date_now, time_now
+
+@app.post("/attendance/{class_id}")
+async def attendance_upload(class_id: str, audio: UploadFile = File(...)):
+    # content-addressed: a re-sent clip is stored once, and any node can read it
+    filepath = await run_in_threadpool(audio_store.put_stream, audio.file, audio.content_type)
+    candidates = await run_in_threadpool(_class_roster, class_id)
+
+    # decode + CNN run on the inference executor, never on the event loop;
+    # admission control rejects with 429 rather than queueing without bound.
+    # The speaker is matched against the class's enrolled embeddings.
+    try:
+        async with admission.admit_async("upload"):
+            result = await inference_executor.identify(filepath, candidates)
+        student_id = result.get("student_id")
+        confidence = float(result.get("confidence", 0))
+    except admission.Overloaded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Inference failed: {e}")
+
+    if not student_id:
+        raise HTTPException(status_code=404, detail="Unknown or forged voice detected")
+
+    date_now, time_now = await run_in_threadpool(_record_upload, class_id, student_id, confidence, filepath)
     return {
         "message": "✅ Attendance recorded successfully",
         "student_id": student_id,
@@ -429,6 +587,56 @@ def record_class_attendance(class_name: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# -------------------------------------------------------------------
+# ATTENDANCE REPORTS (answered from precomputed rollups)
+# -------------------------------------------------------------------
+def _parse_range(start: Optional[str], end: Optional[str]):
+    try:
+        end_d = datetime.strptime(end, "%Y-%m-%d") if end else datetime.utcnow()
+        start_d = datetime.strptime(start, "%Y-%m-%d") if start else end_d - timedelta(days=29)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if start_d > end_d:
+        raise HTTPException(status_code=400, detail="start must be on or before end")
+    return start_d, end_d
+
+
+@app.get("/reports/{class_name}/rate")
+def report_attendance_rate(
+    class_name: str,
+    start: Optional[str] = Query(None, description="YYYY-MM-DD (default: 30 days before end)"),
+    end: Optional[str] = Query(None, description="YYYY-MM-DD (default: today)"),
+    student_id: Optional[str] = None,
+):
+    start_d, end_d = _parse_range(start, end)
+    return attendance_rate(get_db(), class_name, start_d, end_d, student_id=student_id)
+
+
+@app.get("/reports/{class_name}/trend")
+def report_attendance_trend(
+    class_name: str,
+    start: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    end: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    period: str = Query("day", pattern="^(day|week)$"),
+    student_id: Optional[str] = None,
+):
+    start_d, end_d = _parse_range(start, end)
+    points = attendance_trend(get_db(), class_name, start_d, end_d, period=period, student_id=student_id)
+    return {"class_name": class_name, "period": period, "points": points}
+
+
+@app.get("/reports/{class_name}/low-attendance")
+def report_low_attendance(
+    class_name: str,
+    start: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    end: Optional[str] = Query(None, description="YYYY-MM-DD"),
+    threshold: float = Query(0.75, ge=0.0, le=1.0),
+    min_sessions: int = Query(1, ge=1),
+):
+    start_d, end_d = _parse_range(start, end)
+    students = low_attendance(get_db(), class_name, start_d, end_d, threshold=threshold, min_sessions=min_sessions)
+    return {"class_name": class_name, "threshold": threshold, "students": students}
+
 # -------------------------------------------------------------------
 # FEEDBACK
 # -------------------------------------------------------------------
@@ -452,7 +660,7 @@ def feedback(feedback_in: FeedbackIn):
     # Use the audio path from frontend or the latest record
     audio_path = feedback_in.audio_path or (recent_attendance.get("audio_path") if recent_attendance else None)
 
-    if not audio_path or not os.path.exists(audio_path):
+    if not audio_path or not audio_store.exists(audio_path):
         print(f"⚠️ WARNING: No valid audio path found for {feedback_in.student_id}")
         raise HTTPException(status_code=400, detail="Audio path not found or invalid.")
 
@@ -499,12 +707,14 @@ def feedback(feedback_in: FeedbackIn):
         else:
             message = "⚠️ No prior attendance record found."
 
+    response_cache.invalidate(class_tag(student.get("class_name")))
+
     # 🔁 Retrain if verified_samples ≥ 10
     verified_count = len(
         db.students.find_one({"student_id": feedback_in.student_id}).get("verified_samples", [])
     )
     if verified_count >= 10:
-        trigger_retrain_background()
+        retrain_manager.request_retrain(f"feedback:{feedback_in.student_id}", db)
 
     return {
         "status": "ok",
@@ -519,63 +729,90 @@ def feedback(feedback_in: FeedbackIn):
 # -------------------------------------------------------------------
 # VOICE PROFILES
 # -------------------------------------------------------------------
-UPLOAD_DIR = "./uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+PROFILE_FIELDS = {
+    "_id": 0,
+    "student_id": 1,
+    "name": 1,
+    "department": 1,
+    "class_name": 1,
+}
+PROFILE_EXPANSIONS = {
+    "stats": {"stats": 1},
+    "samples": {"voice_samples": 1, "verified_samples": 1},
+}
+
+def _profile_row(s, expand, last_updated):
+    row = {
+        "voiceId": s["student_id"],
+        "name": s.get("name", ""),
+        "department": s.get("department", "N/A"),
+        "class_name": s.get("class_name", "N/A"),
+        "lastUpdated": last_updated,
+    }
+    if "samples" in expand:
+        row["voice_samples"] = s.get("voice_samples", [])
+        row["verified_samples"] = s.get("verified_samples", [])
+    if "stats" in expand:
+        row["stats"] = s.get("stats", {})
+    return row
+
+def _stream_profiles(cursor, limit, expand):
+    """Emit {"items": [...], "next_cursor": ...} one profile at a time."""
+    last_updated = datetime.utcnow().strftime("%Y-%m-%d %H:%M")
+    yield b'{"items":['
+    count = 0
+    last_id = None
+    has_more = False
+    for s in cursor:
+        if count == limit:
+            has_more = True
+            break
+        yield (b"," if count else b"") + dumps(_profile_row(s, expand, last_updated))
+        last_id = s["student_id"]
+        count += 1
+    next_cursor = encode_cursor(student_id=last_id) if has_more else None
+    yield b'],"next_cursor":' + dumps(next_cursor) + b"}"
 
 @app.get("/profiles")
-def get_profiles():
-    db = get_db()
-    students = list(
-        db.students.find(
-            {},
-            {
-                "_id": 0,
-                "student_id": 1,
-                "name": 1,
-                "department": 1,
-                "class_name": 1,
-                "verified_samples": 1,
-                "voice_samples": 1,
-                "stats": 1,
-            },
-        )
-    )
-    profiles = []
-    for s in students:
-        profiles.append(
-            {
-                "voiceId": s["student_id"],
-                "name": s["name"],
-                "department": s.get("department", "N/A"),
-                "class_name": s.get("class_name", "N/A"),
-                "lastUpdated": datetime.utcnow().strftime("%Y-%m-%d %H:%M"),
-                "voice_samples": s.get("voice_samples", []),
-                "verified_samples": s.get("verified_samples", []),
-                "stats": s.get("stats", {}),
-            }
-        )
-    return profiles
-
-@app.post("/profiles")
-async def create_profile(
-    fullName: str = Form(...),
-    usn: str = Form(...),
-    department: str = Form(""),
-    class_name: str = Form(...),
-    audio: UploadFile = File(None),
+def get_profiles(
+    class_name: Optional[str] = None,
+    department: Optional[str] = None,
+    name_prefix: Optional[str] = Query(None, description="Case-sensitive name prefix"),
+    expand: Optional[str] = Query(None, description="Comma-separated: stats,samples"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = None,
 ):
     db = get_db()
-    audio_path = None
-
-    if db.students.find_one({"student_id": usn}):
-        raise HTTPException(status_code=400, detail="Profile already exists for this USN")
-
-    if audio:
-        audio_filename = f"{usn}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.wav"
-        audio_path = os.path.join(UPLOAD_DIR, audio_filename)
-        with open(audio_path, "wb") as f:
-            f.write(await audio.read())
-
+    limit = clamp_limit(limit)
+    expand_set = {e.strip() for e in (expand or "").split(",") if e.strip()}
+    unknown = expand_set - PROFILE_EXPANSIONS.keys()
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown expand fields: {', '.join(sorted(unknown))}")
+
+    query = {}
+    if class_name:
+        query["class_name"] = class_name
+    if department:
+        query["department"] = department
+    if name_prefix:
+        # anchored, case-sensitive regex so the name index can be used
+        query["name"] = {"$regex": "^" + re.escape(name_prefix)}
+    after = decode_cursor(cursor, ("student_id",))
+    if after:
+        query["student_id"] = {"$gt": after["student_id"]}
+
+    projection = dict(PROFILE_FIELDS)
+    for e in expand_set:
+        projection.update(PROFILE_EXPANSIONS[e])
+
+    rows = db.students.find(query, projection).sort("student_id", 1).limit(limit + 1)
+    return StreamingResponse(_stream_profiles(rows, limit, expand_set), media_type="application/json")
+
+def _profile_exists(usn):
+    return get_db().students.find_one({"student_id": usn}, {"_id": 1}) is not None
+
+def _insert_profile(usn, fullName, department, class_name, audio_path):
+    db = get_db()
     student = {
         "student_id": usn,
         "name": fullName,
@@ -602,10 +839,42 @@ async def create_profile(
         },
         upsert=True,
     )
+    response_cache.invalidate("classes", class_tag(class_name))
+
+@app.post("/profiles")
+async def create_profile(
+    fullName: str = Form(...),
+    usn: str = Form(...),
+    department: str = Form(""),
+    class_name: str = Form(...),
+    audio: UploadFile = File(None),
+):
+    audio_path = None
+
+    if await run_in_threadpool(_profile_exists, usn):
+        raise HTTPException(status_code=400, detail="Profile already exists for this USN")
+
+    if audio:
+        async with admission.admit_async("bulk"):
+            audio_path = await run_in_threadpool(audio_store.put_stream, audio.file, audio.content_type)
+
+    await run_in_threadpool(_insert_profile, usn, fullName, department, class_name, audio_path)
+
+    # register the enrollment embedding now so uploads recognise the student
+    # without a retrain; if this fails the background gallery sync catches up
+    registered = False
+    if audio_path:
+        try:
+            registered = bool(await run_in_threadpool(
+                register_student, {"student_id": usn, "voice_samples": [audio_path]},
+            ))
+        except Exception as e:
+            print(f"⚠️ Could not register {usn} in the embedding gallery: {e}")
     return {
         "message": "✅ Voice profile created successfully",
         "student_id": usn,
         "audio_path": audio_path,
+        "registered": registered,
     }
 
 # -------------------------------------------------------------------
@@ -57,49 +57,81 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+BASE_CHANNELS = (16, 32, 64)
+
+# Named variants for train.py --variant / model_variants.py (keyword args of SpeakerRecognitionCNN)
+VARIANTS = {
+    "baseline": {},
+    "slim": {"width": 0.5},
+    "separable": {"separable": True},
+    "separable-slim": {"separable": True, "width": 0.5},
+    "mels40": {"n_mels": 40},
+    "tiny": {"separable": True, "width": 0.5, "n_mels": 40},
+}
+
+
+def _conv(in_ch, out_ch, separable):
+    """3x3 conv, or depthwise 3x3 + pointwise 1x1 (the first layer has one input channel, so stays dense)."""
+    if separable and in_ch > 1:
+        return nn.Sequential(
+            nn.Conv2d(in_ch, in_ch, kernel_size=3, padding=1, groups=in_ch, bias=False),
+            nn.Conv2d(in_ch, out_ch, kernel_size=1),
+        )
+    return nn.Conv2d(in_ch, out_ch, kernel_size=3, padding=1)
+
+
 class SpeakerRecognitionCNN(nn.Module):
     """
     Simple CNN for speaker classification.
     Input: (batch, 1, n_mels, time_frames)
+
+    Variants: `width` scales the (16, 32, 64) channel counts, `separable`
+    uses depthwise-separable conv2/conv3, and `channels` sets the counts
+    explicitly (pruned models). The defaults are the original architecture
+    with the original state_dict keys. Checkpoints store `config()` so the
+    same variant can be rebuilt with `from_config()`.
     """
-    def __init__(self, n_classes=2, n_mels=64):
+    def __init__(self, n_classes=2, n_mels=64, width=1.0, separable=False, channels=None):
         super().__init__()
         self.n_mels = n_mels
+        self.width = width
+        self.separable = separable
+        self.channels = tuple(channels or (max(4, round(c * width)) for c in BASE_CHANNELS))
+        c1, c2, c3 = self.channels
         # Convolutional layers
-        self.conv1 = nn.Conv2d(1, 16, kernel_size=3, padding=1)
-        self.bn1 = nn.BatchNorm2d(16)
+        self.conv1 = _conv(1, c1, separable)
+        self.bn1 = nn.BatchNorm2d(c1)
 
-        self.conv2 = nn.Conv2d(16, 32, kernel_size=3, padding=1)
-        self.bn2 = nn.BatchNorm2d(32)
+        self.conv2 = _conv(c1, c2, separable)
+        self.bn2 = nn.BatchNorm2d(c2)
 
-        self.conv3 = nn.Conv2d(32, 64, kernel_size=3, padding=1)
-        self.bn3 = nn.BatchNorm2d(64)
+        self.conv3 = _conv(c2, c3, separable)
+        self.bn3 = nn.BatchNorm2d(c3)
 
         # Pooling and fully connected
         self.pool = nn.MaxPool2d((2, 2))
         self.global_pool = nn.AdaptiveAvgPool2d((1, 1))
-        self.fc = nn.Linear(64, n_classes)
+        self.fc = nn.Linear(c3, n_classes)
+
+    def config(self):
+        return {"n_mels": self.n_mels, "width": self.width, "separable": self.separable, "channels": list(self.channels)}
+
+    @classmethod
+    def from_config(cls, n_classes, config=None):
+        """Model for a checkpoint's "config" (None: checkpoint predates variants, i.e. the baseline)."""
+        return cls(n_classes=n_classes, **(config or {}))
 
     def forward(self, x):
-        x = F.relu(self.bn1(self.conv1(x)))
-        x = self.pool(x)
-        x = F.relu(self.bn2(self.conv2(x)))
-        x = self.pool(x)
-        x = F.relu(self.bn3(self.conv3(x)))
-        x = self.pool(x)
-        x = self.global_pool(x)       # shape (B, 64, 1, 1)
-        x = x.view(x.size(0), -1)     # shape (B, 64)
-        logits = self.fc(x)
-        return logits
+        return self.fc(self.embed(x))
 
     def embed(self, x):
-        """Return 64-D speaker embedding before final classification layer."""
+        """Return the speaker embedding (channels[-1]-D, 64 for the baseline) before the classification layer."""
         x = F.relu(self.bn1(self.conv1(x)))
         x = self.pool(x)
         x = F.relu(self.bn2(self.conv2(x)))
         x = self.pool(x)
         x = F.relu(self.bn3(self.conv3(x)))
         x = self.pool(x)
-        x = self.global_pool(x)
-        x = x.view(x.size(0), -1)
+        x = self.global_pool(x)       # shape (B, C, 1, 1)
+        x = x.view(x.size(0), -1)     # shape (B, C)
         return x
@@ -0,0 +1,236 @@
+# model_variants.py
+"""
+Lightweight model variants, structured channel pruning and a
+latency/accuracy report.
+
+Variants (model.VARIANTS, or train.py --variant/--width/--separable/--n-mels)
+trade accuracy for speed on cheap classroom machines: a width multiplier
+on the channel counts, depthwise-separable conv2/conv3, and fewer mel bins.
+
+prune_model() removes whole channels from a trained model. Channel
+importance is the |gamma| of the BatchNorm that follows each conv; the
+lowest `ratio` of every layer is dropped, together with the matching input
+slices of the next conv (and the fc columns), so the result is a smaller
+dense model, not a masked one. A pruned checkpoint records its exact
+channel counts under "config", so load_model rebuilds it. It is written
+without "sources", so warm-starting train.py from it (--finetune --init)
+re-tunes on every student rather than a replay sample.
+
+    python model_variants.py --compare                       # train every variant, prune, print the table
+    python model_variants.py --prune speaker_cnn.pt --ratio 0.5 --out speaker_cnn-pruned.pt
+"""
+import json
+import os
+import time
+
+import torch
+import torch.nn as nn
+
+import cpu_precision
+from dataset import DURATION, HOP_LENGTH, SAMPLE_RATE
+from model import VARIANTS, SpeakerRecognitionCNN
+
+FRAMES = int(SAMPLE_RATE * DURATION) // HOP_LENGTH + 1
+VARIANT_DIR = os.getenv("MODEL_VARIANT_DIR", "./variants")
+
+
+# -----------------------------
+# Cost
+# -----------------------------
+def count_params(model):
+    return sum(p.numel() for p in model.parameters())
+
+
+def count_macs(model, frames=FRAMES):
+    """Multiply-accumulates of one forward pass on a single clip (conv + linear layers)."""
+    total = 0
+
+    def hook(module, inputs, output):
+        nonlocal total
+        if isinstance(module, nn.Conv2d):
+            kh, kw = module.kernel_size
+            total += output.numel() * (module.in_channels // module.groups) * kh * kw
+        elif isinstance(module, nn.Linear):
+            total += module.in_features * module.out_features
+
+    handles = [m.register_forward_hook(hook) for m in model.modules() if isinstance(m, (nn.Conv2d, nn.Linear))]
+    model.eval()
+    with torch.no_grad():
+        model(torch.zeros(1, 1, model.n_mels, frames))
+    for h in handles:
+        h.remove()
+    return total
+
+
+def latency_ms(model, frames=FRAMES, runs=50, repeats=5, execution=None):
+    """Single-clip embedding time on CPU (best of `repeats`), in the MODEL_PRECISION / MODEL_CHANNELS_LAST mode."""
+    execution = execution or cpu_precision.ExecutionMode()
+    model = execution.prepare(model).eval()
+    x = execution.input(torch.randn(1, 1, model.n_mels, frames))
+    with torch.no_grad(), execution.autocast():
+        for _ in range(5):
+            model.embed(x)
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for _ in range(runs):
+                model.embed(x)
+            best = min(best, time.perf_counter() - start)
+    return best * 1000 / runs
+
+
+# -----------------------------
+# Structured pruning
+# -----------------------------
+def _conv_parts(conv):
+    """(depthwise or None, dense / pointwise conv)."""
+    return (conv[0], conv[1]) if isinstance(conv, nn.Sequential) else (None, conv)
+
+
+def prune_model(model, ratio):
+    """Copy of `model` with the lowest-|gamma| `ratio` of each conv layer's channels removed."""
+    if not 0 <= ratio < 1:
+        raise ValueError("ratio must be in [0, 1)")
+    keep = [torch.tensor([0])]  # the single input channel
+    for i in (1, 2, 3):
+        gamma = getattr(model, f"bn{i}").weight.detach().abs()
+        n = max(1, round(len(gamma) * (1 - ratio)))
+        keep.append(gamma.topk(n).indices.sort().values)
+
+    pruned = SpeakerRecognitionCNN(
+        n_classes=model.fc.out_features, n_mels=model.n_mels, width=model.width,
+        separable=model.separable, channels=[len(k) for k in keep[1:]],
+    )
+    with torch.no_grad():
+        for i in (1, 2, 3):
+            inp, out = keep[i - 1], keep[i]
+            src_dw, src = _conv_parts(getattr(model, f"conv{i}"))
+            dst_dw, dst = _conv_parts(getattr(pruned, f"conv{i}"))
+            if src_dw is not None:
+                dst_dw.weight.copy_(src_dw.weight[inp])
+            dst.weight.copy_(src.weight[out][:, inp])
+            dst.bias.copy_(src.bias[out])
+            src_bn, dst_bn = getattr(model, f"bn{i}"), getattr(pruned, f"bn{i}")
+            for name in ("weight", "bias", "running_mean", "running_var"):
+                getattr(dst_bn, name).copy_(getattr(src_bn, name)[out])
+            dst_bn.num_batches_tracked.copy_(src_bn.num_batches_tracked)
+        pruned.fc.weight.copy_(model.fc.weight[:, keep[3]])
+        pruned.fc.bias.copy_(model.fc.bias)
+    return pruned.train(model.training)
+
+
+def load_checkpoint(path, device="cpu"):
+    """(model, checkpoint) rebuilt from the checkpoint's variant config."""
+    ckpt = torch.load(path, map_location=device)
+    labels = ckpt.get("labels") or {}
+    model = SpeakerRecognitionCNN.from_config(len(labels) or 2, ckpt.get("config"))
+    model.load_state_dict(ckpt.get("model_state_dict") or ckpt)
+    return model.to(device).eval(), ckpt
+
+
+def prune_checkpoint(path, out_path, ratio):
+    model, ckpt = load_checkpoint(path)
+    pruned = prune_model(model, ratio)
+    torch.save({
+        "model_state_dict": pruned.state_dict(),
+        "labels": ckpt.get("labels"),
+        "config": pruned.config(),
+        "pruned_from": {"checkpoint": os.path.basename(path), "ratio": ratio},
+    }, out_path + ".tmp")
+    os.replace(out_path + ".tmp", out_path)
+    print(f"✅ Pruned {path} ({ratio:.0%} of channels): {model.channels} → {pruned.channels}, saved to {out_path}")
+    return out_path
+
+
+# -----------------------------
+# Report
+# -----------------------------
+def val_accuracy(model, records, features="shard"):
+    """Classifier accuracy on train.py's stratified validation split (the same clips for every variant)."""
+    import train
+    dataset = train.make_dataset(records, features, n_mels=model.n_mels)
+    _, val_idx = train.stratified_split(train._sample_labels(dataset))
+    if not val_idx:
+        return None
+    _, loader = train.make_loader(records, 64, features, 0, "cpu", dataset=dataset, indices=val_idx)
+    return train.evaluate(model, loader, nn.CrossEntropyLoss(), "cpu")[1]
+
+
+def report_row(name, path, records, features="shard"):
+    model, _ = load_checkpoint(path)
+    return {
+        "variant": name,
+        "channels": list(model.channels),
+        "n_mels": model.n_mels,
+        "params": count_params(model),
+        "macs": count_macs(model),
+        "latency_ms": latency_ms(SpeakerRecognitionCNN.from_config(model.fc.out_features, model.config())),
+        "accuracy": val_accuracy(model, records, features),
+        "checkpoint": path,
+    }
+
+
+def compare(records, variants=tuple(VARIANTS), epochs=None, prune_ratios=(0.25, 0.5), recover_epochs=None,
+            out_dir=VARIANT_DIR, features="shard"):
+    """Train each variant, prune the baseline at each ratio (before/after a recovery fine-tune), measure all."""
+    import train
+    epochs = epochs or train.EPOCHS
+    recover_epochs = recover_epochs or train.FINETUNE_EPOCHS
+    os.makedirs(out_dir, exist_ok=True)
+    rows = []
+    for name in variants:
+        path = os.path.join(out_dir, f"speaker_cnn-{name}.pt")
+        print(f"🧠 Training variant {name}: {VARIANTS[name] or 'default'}")
+        train.train_model(records, epochs=epochs, out_path=path, features=features, num_workers=0,
+                          checkpoint_every=0, variant=VARIANTS[name])
+        rows.append(report_row(name, path, records, features))
+        if name != "baseline":
+            continue
+        for ratio in prune_ratios:
+            tag = f"baseline-pruned{round(ratio * 100)}"
+            pruned = prune_checkpoint(path, os.path.join(out_dir, f"speaker_cnn-{tag}.pt"), ratio)
+            rows.append(report_row(tag, pruned, records, features))
+            recovered = os.path.join(out_dir, f"speaker_cnn-{tag}-ft.pt")
+            train.train_model(records, epochs=recover_epochs, lr=train.FINETUNE_LR, out_path=recovered,
+                              features=features, num_workers=0, checkpoint_every=0, init_from=pruned)
+            rows.append(report_row(f"{tag}+ft", recovered, records, features))
+    return rows
+
+
+def print_table(rows):
+    base = next((r for r in rows if r["variant"] == "baseline"), rows[0] if rows else None)
+    print(f"\n{'variant':>22} {'channels':>13} {'mels':>4} {'params':>8} {'MMACs':>7} "
+          f"{'ms/clip':>8} {'speedup':>7} {'val acc':>7}")
+    for r in rows:
+        acc = f"{r['accuracy']:7.3f}" if r["accuracy"] is not None else f"{'-':>7}"
+        print(f"{r['variant']:>22} {'/'.join(map(str, r['channels'])):>13} {r['n_mels']:>4} {r['params']:>8} "
+              f"{r['macs'] / 1e6:7.2f} {r['latency_ms']:8.2f} {base['latency_ms'] / r['latency_ms']:6.2f}x {acc}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Model variants, pruning and latency/accuracy report")
+    parser.add_argument("--compare", action="store_true", help="train every variant and print the comparison table")
+    parser.add_argument("--variants", nargs="+", choices=sorted(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--epochs", type=int, default=None)
+    parser.add_argument("--prune-ratios", type=float, nargs="*", default=[0.25, 0.5])
+    parser.add_argument("--out-dir", default=VARIANT_DIR)
+    parser.add_argument("--json", default=None, help="also write the table here")
+    parser.add_argument("--prune", default=None, metavar="CHECKPOINT", help="prune one checkpoint and exit")
+    parser.add_argument("--ratio", type=float, default=0.5)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    if args.prune:
+        prune_checkpoint(args.prune, args.out or args.prune.replace(".pt", f"-pruned{round(args.ratio * 100)}.pt"),
+                         args.ratio)
+    elif args.compare:
+        from train import get_records_from_mongo
+        rows = compare(get_records_from_mongo(), args.variants, args.epochs, args.prune_ratios, out_dir=args.out_dir)
+        print_table(rows)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(rows, f, indent=2)
+    else:
+        parser.print_help()
@@ -76,10 +76,12 @@
 
 
 # mongodb.py
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING
 from dotenv import load_dotenv
 import os
 
+import attendance_store
+
 load_dotenv()
 
 MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
@@ -90,6 +92,17 @@ def get_db():
     db = client[DB_NAME]
     return db
 
+def ensure_indexes(db=None):
+    """Create the indexes the list/summary routes page and filter on (idempotent)."""
+    db = db if db is not None else get_db()
+    db.classes.create_index([("class_name", ASCENDING), ("_id", ASCENDING)])
+    db.classes.create_index([("date", ASCENDING), ("class_name", ASCENDING), ("_id", ASCENDING)])
+    db.students.create_index([("student_id", ASCENDING)])
+    db.students.create_index([("class_name", ASCENDING), ("student_id", ASCENDING)])
+    db.students.create_index([("department", ASCENDING), ("student_id", ASCENDING)])
+    db.students.create_index([("name", ASCENDING), ("student_id", ASCENDING)])
+    attendance_store.ensure_indexes(db)
+
 def seed_students():
     """
     Seed example students only if the students collection is empty.
@@ -0,0 +1,73 @@
+# pagination.py
+"""
+Opaque cursor helpers for keyset ("seek") pagination.
+
+A cursor is the sort key of the last item on a page, JSON-encoded and
+base64'd so clients treat it as an opaque token. Pages are fetched with a
+range query on that key instead of skip/limit, so every page costs the same
+however deep the client goes.
+"""
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def _encode_value(v):
+    if isinstance(v, ObjectId):
+        return {"$oid": str(v)}
+    if isinstance(v, datetime):
+        return {"$date": v.isoformat()}
+    return v
+
+
+def _decode_value(v):
+    if isinstance(v, dict):
+        if "$oid" in v:
+            return ObjectId(v["$oid"])
+        if "$date" in v:
+            return datetime.fromisoformat(v["$date"])
+    return v
+
+
+def encode_cursor(**keys):
+    raw = json.dumps({k: _encode_value(v) for k, v in keys.items()}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, keys):
+    """
+    Decode a cursor produced by encode_cursor for a route paged on `keys`;
+    raises HTTP 400 if it is malformed or carries other keys (e.g. a cursor
+    from a different endpoint).
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(data, dict) or set(data) != set(keys):
+            raise ValueError("cursor keys")
+        return {k: _decode_value(v) for k, v in data.items()}
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def clamp_limit(limit):
+    return max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+
+
+def page(items, limit, key_fn):
+    """
+    Split a fetch of limit + 1 rows into (page_items, next_cursor).
+    key_fn maps the last item on the page to the cursor's keyword args.
+    """
+    has_more = len(items) > limit
+    items = items[:limit]
+    next_cursor = encode_cursor(**key_fn(items[-1])) if has_more and items else None
+    return items, next_cursor
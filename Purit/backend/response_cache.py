@@ -0,0 +1,160 @@
+# response_cache.py
+"""
+Small in-process read-through cache for hot dashboard GET routes.
+
+Entries hold the already-serialized body plus an ETag and a set of tags.
+Routes that mutate data call `invalidate(tag)`; entries also expire after a
+TTL as a safety net for writes made outside this process. A poll carrying
+a matching If-None-Match gets a 304 straight from the cache, without Mongo.
+
+Every invalidation bumps a generation counter; a load that overlapped an
+invalidation of one of its tags is served but not stored, so a slow read
+that started before a write cannot repopulate the cache with stale data.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi.responses import Response
+
+from serialization import dumps
+
+CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+
+
+class ResponseCache:
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, etag, body, tags)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._invalidated_at = {}  # tag -> generation of its last invalidation
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def put(self, key, body, tags, since=None):
+        """
+        Store and return an entry. `since` is generation() from before the
+        body was loaded: if any of `tags` was invalidated after it, the entry
+        is returned but not stored.
+        """
+        etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        entry = (time.monotonic() + self.ttl, etag, body, frozenset(tags))
+        with self._lock:
+            if since is not None and any(self._invalidated_at.get(t, -1) > since for t in entry[3]):
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, *tags):
+        tags = set(tags)
+        with self._lock:
+            self._generation += 1
+            for t in tags:
+                self._invalidated_at[t] = self._generation
+            stale = [k for k, e in self._entries.items() if e[3] & tags]
+            for k in stale:
+                del self._entries[k]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "not_modified": self.not_modified,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "ttl_seconds": self.ttl,
+            }
+
+
+cache = ResponseCache()
+
+
+def invalidate(*tags):
+    """Drop every cached response carrying any of these tags."""
+    return cache.invalidate(*tags)
+
+
+def class_tag(class_name):
+    return f"class:{class_name}"
+
+
+def temp_tag(class_name):
+    return f"temp:{class_name}"
+
+
+def _etag_matches(header, etag):
+    """If-None-Match check: "*" or a comma-separated list of entity tags (weak comparison)."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _respond(request, entry):
+    _, etag, body, _ = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        with cache._lock:
+            cache.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def cached_json(request, tags, loader):
+    """
+    Serve `loader()` through the cache, keyed on path + query string.
+    `tags` is a list, or a callable taking the loaded content and returning
+    one (for routes whose tags are only known after the lookup).
+    """
+    key = f"{request.url.path}?{request.url.query}"
+    entry = cache.get(key)
+    if entry is None:
+        since = cache.generation()
+        content = loader()
+        entry = cache.put(key, dumps(content), tags(content) if callable(tags) else tags, since=since)
+    return _respond(request, entry)
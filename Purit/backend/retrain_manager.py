@@ -0,0 +1,405 @@
+# retrain_manager.py
+"""
+Single-flight, debounced model retraining.
+
+`/feedback` used to Popen a fresh `python train.py` every time a student
+crossed 10 verified samples, so several full retrains could run at once
+and race to overwrite speaker_cnn.pt. Now:
+
+- request_retrain() only marks a retrain as wanted. Triggers within
+  RETRAIN_DEBOUNCE_SECONDS of each other coalesce into one job, which
+  starts at most RETRAIN_MAX_DELAY_SECONDS after the first trigger.
+- A dispatcher thread in every API worker tries to claim the job from the
+  shared `retrain_state` document; exactly one wins, and while its job
+  runs (lease renewed by heartbeat) nobody else starts another. Triggers
+  arriving meanwhile queue one follow-up run.
+- The job is a `train.py` subprocess (`--finetune` from the live model
+  unless RETRAIN_MODE=full) with resource limits (nice level,
+  torch/OMP threads, address-space cap, wall-clock timeout). It can be
+  cancelled; progress is read from the file train.py writes each epoch.
+- If the owning worker dies mid-job its lease runs out; the next
+  dispatcher poll marks the job failed, frees the slot and, on the same
+  host, stops the orphaned train.py (its own process group). An owner
+  that finds its lease taken over stops its child too.
+- A job that fails or times out keeps train.py's `<checkpoint>.resume`
+  state; the next job reuses that checkpoint path with `--resume` and
+  continues from the last saved epoch (train.py ignores the state if the
+  training data changed meanwhile). Cancelled jobs are discarded.
+- Output goes to a versioned file in RETRAIN_CHECKPOINT_DIR. Promotion to
+  the live MODEL_PATH is an atomic rename (automatic with
+  RETRAIN_AUTO_PROMOTE=1, the default, or via the promote endpoint), and
+  the shared model picks it up on its next mtime check.
+"""
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits
+    resource = None
+
+RETRAIN_DEBOUNCE_SECONDS = float(os.getenv("RETRAIN_DEBOUNCE_SECONDS", "120"))
+RETRAIN_MAX_DELAY_SECONDS = float(os.getenv("RETRAIN_MAX_DELAY_SECONDS", "900"))
+RETRAIN_CHECKPOINT_DIR = os.getenv("RETRAIN_CHECKPOINT_DIR", "./checkpoints")
+RETRAIN_AUTO_PROMOTE = os.getenv("RETRAIN_AUTO_PROMOTE", "1") == "1"
+RETRAIN_MODE = os.getenv("RETRAIN_MODE", "finetune")  # finetune: warm start from the live model | full
+RETRAIN_NICE = int(os.getenv("RETRAIN_NICE", "10"))
+RETRAIN_THREADS = int(os.getenv("RETRAIN_THREADS", "2"))
+RETRAIN_MAX_MEMORY_MB = int(os.getenv("RETRAIN_MAX_MEMORY_MB", "0"))  # 0 = unlimited
+RETRAIN_TIMEOUT_MINUTES = float(os.getenv("RETRAIN_TIMEOUT_MINUTES", "120"))
+RETRAIN_POLL_SECONDS = float(os.getenv("RETRAIN_POLL_SECONDS", "5"))
+LEASE_SECONDS = 60
+
+MODEL_PATH = "speaker_cnn.pt"
+STATE_ID = "retrain"
+
+
+def _db():
+    from mongodb import get_db
+    return get_db()
+
+
+def _owner():
+    from session_registry import WORKER_ID
+    return WORKER_ID
+
+
+# -----------------------------
+# Triggering
+# -----------------------------
+def request_retrain(reason="manual", db=None, now=None):
+    """Ask for a retrain; coalesced with other requests inside the debounce window."""
+    db = db or _db()
+    now = now or time.time()
+    state = db.retrain_state.find_one({"_id": STATE_ID}) or {}
+    first_at = state.get("first_requested_at") if state.get("pending") else None
+    first_at = first_at or now
+    due_at = min(now + RETRAIN_DEBOUNCE_SECONDS, first_at + RETRAIN_MAX_DELAY_SECONDS)
+    db.retrain_state.update_one(
+        {"_id": STATE_ID},
+        {
+            "$set": {"pending": True, "due_at": due_at, "first_requested_at": first_at},
+            "$inc": {"triggers": 1},
+            "$push": {"reasons": {"$each": [reason], "$slice": -20}},
+        },
+        upsert=True,
+    )
+    print(f"🔁 Retrain requested ({reason}); due in {due_at - now:.0f}s")
+    return status(db)
+
+
+def cancel_pending(db=None):
+    db = db or _db()
+    db.retrain_state.update_one(
+        {"_id": STATE_ID},
+        {"$set": {"pending": False, "triggers": 0, "reasons": [], "first_requested_at": None}},
+    )
+    return status(db)
+
+
+def cancel_job(job_id, db=None):
+    """Flag a running job for cancellation; its owner stops it on the next poll."""
+    db = db or _db()
+    res = db.retrain_jobs.update_one({"_id": job_id, "state": "running"}, {"$set": {"cancel": True}})
+    return res.modified_count > 0
+
+
+# -----------------------------
+# Claiming (single flight)
+# -----------------------------
+def _claim(db, owner, now):
+    try:
+        return db.retrain_state.find_one_and_update(
+            {
+                "_id": STATE_ID,
+                "pending": True,
+                "due_at": {"$lte": now},
+                "$or": [{"running_job": None}, {"lease_expires": {"$lt": now}}],
+            },
+            {"$set": {
+                "pending": False,
+                "running_job": uuid.uuid4().hex,
+                "owner": owner,
+                "lease_expires": now + LEASE_SECONDS,
+                "triggers": 0,
+                "first_requested_at": None,
+            }},
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        return None
+
+
+def _renew(db, job_id, owner):
+    """False once the lease is gone (it expired and the job was reaped)."""
+    res = db.retrain_state.update_one(
+        {"_id": STATE_ID, "running_job": job_id, "owner": owner},
+        {"$set": {"lease_expires": time.time() + LEASE_SECONDS}},
+    )
+    return res.matched_count > 0
+
+
+def _release(db, job_id, owner):
+    db.retrain_state.update_one(
+        {"_id": STATE_ID, "running_job": job_id, "owner": owner},
+        {"$set": {"running_job": None, "lease_expires": 0}},
+    )
+
+
+def _stop_orphan(job):
+    """Terminate a dead owner's train.py if it runs on this host (and is still that job)."""
+    pid = job.get("pid")
+    if not pid or job.get("host") != socket.gethostname() or os.name != "posix":
+        return False
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            if job["checkpoint"].encode() not in f.read():
+                return False  # pid reused by something else
+        os.killpg(pid, signal.SIGTERM)
+    except (OSError, KeyError):
+        return False
+    return True
+
+
+def _reap_expired(db, now):
+    """Fail the running job of an owner that stopped renewing its lease. Returns its id or None."""
+    state = db.retrain_state.find_one_and_update(
+        {"_id": STATE_ID, "running_job": {"$ne": None}, "lease_expires": {"$lt": now}},
+        {"$set": {"running_job": None, "lease_expires": 0}},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if not state:
+        return None
+    job_id = state["running_job"]
+    job = db.retrain_jobs.find_one_and_update(
+        {"_id": job_id, "state": "running"},
+        {"$set": {
+            "state": "failed",
+            "error": f"owner {state.get('owner')} stopped renewing its lease",
+            "finished_at": datetime.utcnow(),
+            "resumable": True,  # checked against the file when the next job starts
+        }},
+    )
+    stopped = bool(job) and _stop_orphan(job)
+    print(f"⚠️ Retrain job {job_id} lost its owner — marked failed{' (stopped orphaned train.py)' if stopped else ''}")
+    return job_id
+
+
+# -----------------------------
+# Running a job
+# -----------------------------
+def _apply_limits(pid):
+    """
+    Lower the training process's priority and cap its address space. Done
+    from the parent after spawn: preexec_fn is not safe in a process that
+    runs threads (the API's dispatcher, heartbeats, pools).
+    """
+    if os.name != "posix":
+        return
+    if RETRAIN_NICE:
+        try:
+            os.setpriority(os.PRIO_PROCESS, pid, os.getpriority(os.PRIO_PROCESS, 0) + RETRAIN_NICE)
+        except OSError as e:
+            print(f"⚠️ Could not renice retrain process {pid}: {e}")
+    if resource is not None and hasattr(resource, "prlimit") and RETRAIN_MAX_MEMORY_MB:
+        limit = RETRAIN_MAX_MEMORY_MB * 1024 * 1024
+        try:
+            resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+        except OSError as e:
+            print(f"⚠️ Could not cap retrain process {pid} memory: {e}")
+
+
+def _read_progress(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _resumable_checkpoint(db):
+    """
+    Checkpoint path of the latest failed job whose .resume state is still
+    on disk here (claimed for the new job), else None. Older resume files
+    are superseded and removed.
+    """
+    found = None
+    for job in db.retrain_jobs.find({"state": "failed", "resumable": True}).sort("finished_at", -1):
+        resume_path = job["checkpoint"] + ".resume"
+        if found is None and os.path.exists(resume_path):
+            found = job["checkpoint"]
+        elif os.path.exists(resume_path):
+            os.remove(resume_path)
+        db.retrain_jobs.update_one({"_id": job["_id"]}, {"$set": {"resumable": False}})
+    return found
+
+
+def promote(checkpoint, model_path=MODEL_PATH):
+    """Atomically make `checkpoint` the live model."""
+    tmp = f"{model_path}.promote-{os.getpid()}"
+    shutil.copyfile(checkpoint, tmp)
+    os.replace(tmp, model_path)
+    print(f"✅ Promoted {checkpoint} to {model_path}")
+
+
+def _run_job(db, state, owner):
+    job_id = state["running_job"]
+    os.makedirs(RETRAIN_CHECKPOINT_DIR, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    resume_from = _resumable_checkpoint(db)
+    checkpoint = resume_from or os.path.join(RETRAIN_CHECKPOINT_DIR, f"speaker_cnn-{stamp}-{job_id[:6]}.pt")
+    progress_path = os.path.join(RETRAIN_CHECKPOINT_DIR, f".progress-{job_id}.json")
+    db.retrain_jobs.insert_one({
+        "_id": job_id,
+        "state": "running",
+        "owner": owner,
+        "reasons": state.get("reasons", []),
+        "started_at": datetime.utcnow(),
+        "checkpoint": checkpoint,
+        "resumed": bool(resume_from),
+        "progress": None,
+        "cancel": False,
+    })
+    db.retrain_state.update_one({"_id": STATE_ID}, {"$set": {"reasons": []}})
+
+    env = dict(os.environ, OMP_NUM_THREADS=str(RETRAIN_THREADS), MKL_NUM_THREADS=str(RETRAIN_THREADS))
+    cmd = [sys.executable, "train.py", "--out", checkpoint, "--progress", progress_path]
+    if RETRAIN_MODE == "finetune":
+        cmd += ["--finetune", "--init", MODEL_PATH]
+    if resume_from:
+        cmd.append("--resume")
+    print(f"🔁 Retrain job {job_id} {'resumed' if resume_from else 'started'} → {checkpoint}")
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        env=env,
+        start_new_session=True,  # own process group, so a reaper can stop it as a whole
+    )
+    _apply_limits(proc.pid)
+    db.retrain_jobs.update_one({"_id": job_id}, {"$set": {"pid": proc.pid, "host": socket.gethostname()}})
+    deadline = time.monotonic() + RETRAIN_TIMEOUT_MINUTES * 60
+    outcome, error = None, None
+    stderr_tail = deque(maxlen=40)  # drained continuously so the pipe never fills up
+    threading.Thread(target=stderr_tail.extend, args=(proc.stderr,), daemon=True).start()
+    while proc.poll() is None:
+        time.sleep(RETRAIN_POLL_SECONDS)
+        lease_held = _renew(db, job_id, owner)
+        job = db.retrain_jobs.find_one_and_update(
+            {"_id": job_id}, {"$set": {"progress": _read_progress(progress_path)}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if not lease_held:
+            outcome, error = "failed", "lease lost (job was reaped by another worker)"
+        elif job and job.get("cancel"):
+            outcome = "cancelled"
+        elif time.monotonic() > deadline:
+            outcome, error = "failed", f"timed out after {RETRAIN_TIMEOUT_MINUTES:.0f} min"
+        if outcome:
+            proc.terminate()
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            break
+
+    if outcome is None:
+        if proc.returncode == 0 and os.path.exists(checkpoint) and not _renew(db, job_id, owner):
+            outcome, error = "failed", "lease lost (job was reaped by another worker)"
+        elif proc.returncode == 0 and os.path.exists(checkpoint):
+            outcome = "succeeded"
+        else:
+            outcome = "failed"
+            error = b"".join(stderr_tail).decode(errors="replace")[-2000:] or f"exit code {proc.returncode}"
+    resumable = False
+    if outcome != "succeeded":
+        # never leave a partial checkpoint behind; keep the resume state of a failed run for the next job
+        doomed = [checkpoint] + ([checkpoint + ".resume"] if outcome == "cancelled" else [])
+        for path in doomed:
+            if os.path.exists(path):
+                os.remove(path)
+        resumable = outcome == "failed" and os.path.exists(checkpoint + ".resume")
+
+    promoted = False
+    if outcome == "succeeded" and RETRAIN_AUTO_PROMOTE:
+        promote(checkpoint)
+        promoted = True
+    db.retrain_jobs.update_one(
+        {"_id": job_id},
+        {"$set": {
+            "state": outcome,
+            "error": error,
+            "finished_at": datetime.utcnow(),
+            "progress": _read_progress(progress_path),
+            "promoted": promoted,
+            "resumable": resumable,
+        }},
+    )
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    _release(db, job_id, owner)
+    print(f"{'✅' if outcome == 'succeeded' else '⚠️'} Retrain job {job_id} {outcome}")
+    return outcome
+
+
+def dispatch_once(db=None, owner=None):
+    """Claim and run a due retrain if this worker wins it. Returns the outcome or None."""
+    db = db or _db()
+    owner = owner or _owner()
+    now = time.time()
+    _reap_expired(db, now)
+    state = _claim(db, owner, now)
+    if not state:
+        return None
+    try:
+        return _run_job(db, state, owner)
+    except Exception as e:
+        print(f"❌ Retrain job {state['running_job']} crashed: {e}")
+        db.retrain_jobs.update_one(
+            {"_id": state["running_job"]},
+            {"$set": {"state": "failed", "error": str(e), "finished_at": datetime.utcnow()}},
+        )
+        _release(db, state["running_job"], owner)
+        return "failed"
+
+
+def start_dispatcher(poll_seconds=RETRAIN_POLL_SECONDS):
+    def _loop():
+        while True:
+            try:
+                dispatch_once()
+            except Exception as e:
+                print(f"⚠️ Retrain dispatcher error: {e}")
+            time.sleep(poll_seconds)
+
+    thread = threading.Thread(target=_loop, daemon=True, name="retrain-dispatcher")
+    thread.start()
+    return thread
+
+
+# -----------------------------
+# Status
+# -----------------------------
+def status(db=None):
+    db = db or _db()
+    state = db.retrain_state.find_one({"_id": STATE_ID}, {"_id": 0}) or {"pending": False}
+    current = db.retrain_jobs.find_one({"_id": state["running_job"]}) if state.get("running_job") else None
+    recent = list(db.retrain_jobs.find({}, {"reasons": 0}).sort("started_at", -1).limit(5))
+    return {"state": state, "current": current, "recent": recent}
+
+
+def get_job(job_id, db=None):
+    return (db or _db()).retrain_jobs.find_one({"_id": job_id})
@@ -0,0 +1,97 @@
+# serialization.py
+"""
+Response serialization for the API.
+
+Route results are handed straight to orjson, which converts BSON types
+(ObjectId, Decimal128, ...) through a `default` hook while encoding. This
+replaces the recursive Python walks (`clean_mongo_ids` / `stringify_id`)
+and FastAPI's `jsonable_encoder` pass. Large bodies are compressed with
+brotli when `brotli-asgi` is installed, otherwise with gzip.
+"""
+import asyncio
+import functools
+
+import numpy as np
+import orjson
+from bson import ObjectId, Decimal128
+from fastapi.responses import JSONResponse, Response
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.routing import APIRoute
+from starlette.middleware.gzip import GZipMiddleware
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+COMPRESS_MIN_SIZE = 1024  # bytes; smaller bodies are not worth compressing
+
+
+def _default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode("utf-8", errors="replace")
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content):
+    """Serialize to JSON bytes, converting BSON/NumPy types on the fly."""
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class BSONJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
+
+
+def _wrap(result):
+    if isinstance(result, Response):
+        return result
+    return BSONJSONResponse(result)
+
+
+def fast_json(endpoint):
+    """
+    Wrap an endpoint so a plain return value goes straight to orjson.
+    Returning a Response short-circuits FastAPI's jsonable_encoder walk.
+    """
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            return _wrap(await endpoint(*args, **kwargs))
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            return _wrap(endpoint(*args, **kwargs))
+    return wrapper
+
+
+class FastJSONRoute(APIRoute):
+    """APIRoute that serializes every route without a response_model via orjson."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        response_model = kwargs.get("response_model")
+        if isinstance(response_model, DefaultPlaceholder):
+            response_model = response_model.value
+        if response_model is None and "return" not in getattr(endpoint, "__annotations__", {}):
+            endpoint = fast_json(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def install(app, minimum_size=COMPRESS_MIN_SIZE):
+    """Use the fast serializer for all routes declared after this call and add compression."""
+    app.router.route_class = FastJSONRoute
+    if BrotliMiddleware is not None:
+        app.add_middleware(BrotliMiddleware, minimum_size=minimum_size, gzip_fallback=True)
+    else:
+        app.add_middleware(GZipMiddleware, minimum_size=minimum_size)
@@ -0,0 +1,263 @@
+# session_events.py
+"""
+In-process event bus for live attendance sessions.
+
+The session thread publishes state transitions and per-student results; SSE
+subscribers (running on the event loop) receive them through an
+asyncio.Queue fed with call_soon_threadsafe, so nobody polls. A bounded
+per-class log with increasing ids lets a reconnecting client resume from
+its Last-Event-ID.
+
+Event ids are "<boot>-<n>": `n` restarts at 1 with every process, so the
+boot token tells this process's ids apart from ones handed out before a
+restart or by another worker. A Last-Event-ID from another boot, or one
+no longer in the log, gets a fresh snapshot instead of a replay.
+
+With several uvicorn workers the session thread, the pause/resume/finish
+request and the dashboard's stream can each land on a different process.
+Set SESSION_EVENT_LOG=mongo there: every event is then also appended to a
+shared log (Mongo `session_events`, kept for SESSION_EVENT_LOG_TTL
+seconds), and one tailer thread per process reads it every
+SESSION_EVENT_POLL_SECONDS, with a single query for all classes that have
+subscribers here, and fans events published by other boots out to them.
+It re-reads SESSION_EVENT_OVERLAP_SECONDS behind its cursor (late inserts,
+clock skew between hosts) and drops ids it has already delivered. With no
+subscribers it does not query at all. The default (off) keeps events
+in-process, which is all a single worker needs.
+"""
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+
+from serialization import dumps
+
+EVENT_HISTORY = 1000
+KEEPALIVE_SECONDS = 15
+EVENT_LOG = os.getenv("SESSION_EVENT_LOG", "off")  # off | mongo (several workers)
+EVENT_LOG_TTL = int(os.getenv("SESSION_EVENT_LOG_TTL", "86400"))
+EVENT_POLL_SECONDS = float(os.getenv("SESSION_EVENT_POLL_SECONDS", "1"))
+EVENT_OVERLAP_SECONDS = float(os.getenv("SESSION_EVENT_OVERLAP_SECONDS", "5"))
+
+BOOT_ID = uuid.uuid4().hex[:8]
+
+
+def format_event_id(n):
+    return f"{BOOT_ID}-{n}"
+
+
+def parse_event_id(value):
+    """(boot, n) for a "<boot>-<n>" event id, or None if it isn't one."""
+    boot, _, n = (value or "").rpartition("-")
+    return (boot, int(n)) if boot and n.isdigit() else None
+
+
+class SessionEventBus:
+    def __init__(self, history=EVENT_HISTORY):
+        self.history = history
+        self._lock = threading.Lock()
+        self._logs = {}         # class_name -> deque[(id, event, data)]
+        self._next_id = 1       # ids are global so they never repeat across sessions (within this boot)
+        self._subscribers = {}  # class_name -> {queue: loop}
+
+    def publish(self, class_name, event, data):
+        with self._lock:
+            event_id = self._next_id
+            self._next_id += 1
+            item = (event_id, event, data)
+            self._logs.setdefault(class_name, deque(maxlen=self.history)).append(item)
+            subscribers = list(self._subscribers.get(class_name, {}).items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # loop already closed; the subscriber is gone
+                pass
+        return format_event_id(event_id)
+
+    def subscribe(self, class_name, last_event_id=None):
+        """
+        Register a subscriber on the running loop. Returns (queue, backlog,
+        after): `after` is the sequence number the replay resumes from, or
+        None if last_event_id is missing, from another boot, or no longer in
+        the log, and the client needs a snapshot.
+        """
+        queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subscribers.setdefault(class_name, {})[queue] = loop
+            log = list(self._logs.get(class_name, ()))
+        parsed = parse_event_id(last_event_id)
+        if parsed is None or parsed[0] != BOOT_ID or not any(e[0] == parsed[1] for e in log):
+            return queue, [], None
+        after = parsed[1]
+        return queue, [e for e in log if e[0] > after], after
+
+    def deliver(self, class_name, item):
+        """Hand an event from another worker to this class's subscribers (not logged for replay here)."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(class_name, {}).items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                pass
+
+    def subscribed_classes(self):
+        with self._lock:
+            return list(self._subscribers)
+
+    def unsubscribe(self, class_name, queue):
+        with self._lock:
+            subs = self._subscribers.get(class_name)
+            if subs is not None:
+                subs.pop(queue, None)
+                if not subs:
+                    del self._subscribers[class_name]
+
+
+# -----------------------------
+# Shared log (cross-worker delivery)
+# -----------------------------
+class MongoEventLog:
+    def __init__(self, db=None, collection="session_events"):
+        if db is None:
+            from mongodb import get_db
+            db = get_db()
+        self.col = db[collection]
+        self.col.create_index([("class_name", ASCENDING), ("ts", ASCENDING)])
+        self.col.create_index("ts", expireAfterSeconds=EVENT_LOG_TTL)
+
+    def append(self, class_name, event_id, event, data):
+        self.col.insert_one({
+            "class_name": class_name,
+            "event_id": event_id,
+            "boot": BOOT_ID,
+            "event": event,
+            "data": data,
+            "ts": datetime.utcnow(),
+        })
+
+    def since(self, class_names, ts, limit=EVENT_HISTORY):
+        """Events other boots published for any of `class_names` at or after `ts`, oldest first."""
+        return list(
+            self.col.find(
+                {"class_name": {"$in": list(class_names)}, "boot": {"$ne": BOOT_ID}, "ts": {"$gte": ts}},
+                {"_id": 0, "class_name": 1, "event_id": 1, "event": 1, "data": 1, "ts": 1},
+            ).sort("ts", ASCENDING).limit(limit)
+        )
+
+
+def _tail_shared_log(log, bus):
+    """Tailer thread body: deliver other workers' events to this process's subscribers."""
+    cursor, seen = datetime.utcnow(), {}  # seen: event_id -> ts, for ids inside the overlap window
+    overlap = timedelta(seconds=EVENT_OVERLAP_SECONDS)
+    while True:
+        time.sleep(EVENT_POLL_SECONDS)
+        classes = bus.subscribed_classes()
+        if not classes:
+            cursor, seen = datetime.utcnow(), {}  # nobody to catch up: a new subscriber starts from its snapshot
+            continue
+        try:
+            docs = log.since(classes, cursor - overlap)
+        except Exception as e:
+            print(f"⚠️ Shared event log read failed: {e}")
+            continue
+        for doc in docs:
+            if doc["event_id"] in seen:
+                continue
+            seen[doc["event_id"]] = doc["ts"]
+            cursor = max(cursor, doc["ts"])
+            bus.deliver(doc["class_name"], (doc["event_id"], doc["event"], doc["data"]))
+        seen = {k: ts for k, ts in seen.items() if ts >= cursor - overlap}
+
+
+bus = SessionEventBus()
+_event_log = None
+_event_log_lock = threading.Lock()
+_tailer = None
+
+
+def get_event_log():
+    """The shared log, or None when SESSION_EVENT_LOG=off."""
+    global _event_log
+    if EVENT_LOG == "off":
+        return None
+    with _event_log_lock:
+        if _event_log is None:
+            _event_log = MongoEventLog()
+        return _event_log
+
+
+def start_tailer():
+    """Start this process's shared-log tailer once (no-op with SESSION_EVENT_LOG=off)."""
+    global _tailer
+    log = get_event_log()
+    if log is None:
+        return None
+    with _event_log_lock:
+        if _tailer is None:
+            _tailer = threading.Thread(target=_tail_shared_log, args=(log, bus), daemon=True,
+                                       name="session-events-tailer")
+            _tailer.start()
+        return _tailer
+
+
+def publish(class_name, event, data):
+    event_id = bus.publish(class_name, event, data)
+    try:
+        log = get_event_log()
+        if log is not None:
+            log.append(class_name, event_id, event, data)
+    except Exception as e:
+        # local subscribers already have it; only other workers miss this one
+        print(f"⚠️ Could not append {event} event for {class_name} to the shared log: {e}")
+    return event_id
+
+
+def format_sse(event_id, event, data):
+    head = f"event: {event}\n".encode("utf-8")
+    if event_id is not None:
+        head = f"id: {event_id}\n".encode("utf-8") + head
+    return head + b"data: " + dumps(data) + b"\n\n"
+
+
+async def stream(request, class_name, last_event_id, snapshot):
+    """
+    Async generator of SSE frames for one subscriber. `snapshot()` returns
+    the current {"status", "results"} and is sent on a fresh connect or
+    when the replay log can't cover the gap since last_event_id. Events
+    from this process arrive with integer sequence numbers, events from
+    the shared-log tailer with the publishing worker's full id.
+    """
+    start_tailer()
+    queue, backlog, after = bus.subscribe(class_name, last_event_id)
+    try:
+        if after is None:
+            yield format_sse(None, "snapshot", await asyncio.to_thread(snapshot))  # Mongo reads: off the event loop
+        sent = after or 0
+        for event_id, event, data in backlog:
+            sent = event_id
+            yield format_sse(format_event_id(event_id), event, data)
+        while True:
+            try:
+                event_id, event, data = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield b": keepalive\n\n"
+                continue
+            if isinstance(event_id, str):
+                yield format_sse(event_id, event, data)  # from another worker
+                continue
+            if event_id <= sent:
+                continue  # already replayed from the backlog
+            sent = event_id
+            yield format_sse(format_event_id(event_id), event, data)
+    finally:
+        bus.unsubscribe(class_name, queue)
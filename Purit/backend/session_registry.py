@@ -0,0 +1,311 @@
+# session_registry.py
+"""
+Shared registry for live attendance sessions.
+
+`active_sessions` only exists inside the process running the session
+thread. With several uvicorn workers, a pause/resume/status/finish request
+can land on any of them, so the session's state and control flags live in
+a shared store instead:
+
+- the worker running the session holds a lease on it and renews it from
+  a heartbeat thread;
+- control requests from any worker set `paused`/`stop` on the record and
+  the owner picks them up on its next heartbeat;
+- a session whose lease has expired (its worker died) is orphaned: it
+  reports as completed and can be started again anywhere.
+
+The store is Mongo by default (`attendance_sessions` collection). For a
+single host without Mongo, set SESSION_STORE=sqlite:/path/to/sessions.db.
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+SESSION_STORE = os.getenv("SESSION_STORE", "mongo")
+LEASE_SECONDS = float(os.getenv("SESSION_LEASE_SECONDS", "30"))
+HEARTBEAT_SECONDS = float(os.getenv("SESSION_HEARTBEAT_SECONDS", "5"))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+LIVE_STATES = ("running", "paused")
+
+
+def _fresh(class_name, owner, now, lease):
+    return {
+        "class_name": class_name,
+        "owner": owner,
+        "state": "running",
+        "paused": False,
+        "stop": False,
+        "started_at": now,
+        "heartbeat_at": now,
+        "lease_expires": now + lease,
+    }
+
+
+def describe(record, now=None):
+    """Status string the API reports for a registry record (or None)."""
+    now = now or time.time()
+    if not record or record.get("stop") or record.get("state") not in LIVE_STATES:
+        return "completed"
+    if record.get("lease_expires", 0) < now:
+        return "completed"  # owner stopped heartbeating: orphaned
+    return "paused" if record.get("paused") else "running"
+
+
+# -----------------------------
+# Mongo backend
+# -----------------------------
+class MongoSessionStore:
+    def __init__(self, db=None, collection="attendance_sessions"):
+        if db is None:
+            from mongodb import get_db
+            db = get_db()
+        self.col = db[collection]
+        self.col.create_index("lease_expires")
+
+    def acquire(self, class_name, owner, lease=LEASE_SECONDS):
+        now = time.time()
+        try:
+            doc = self.col.find_one_and_update(
+                {
+                    "_id": class_name,
+                    "$or": [
+                        {"lease_expires": {"$lt": now}},
+                        {"state": {"$nin": list(LIVE_STATES)}},
+                    ],
+                },
+                {"$set": _fresh(class_name, owner, now, lease)},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            return False  # a live session already holds the lease
+        return bool(doc and doc.get("owner") == owner)
+
+    def heartbeat(self, class_name, owner, lease=LEASE_SECONDS):
+        now = time.time()
+        return self.col.find_one_and_update(
+            {"_id": class_name, "owner": owner, "state": {"$in": list(LIVE_STATES)}},
+            {"$set": {"heartbeat_at": now, "lease_expires": now + lease}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def set_control(self, class_name, **flags):
+        doc = self.col.find_one_and_update(
+            {"_id": class_name, "state": {"$in": list(LIVE_STATES)}, "lease_expires": {"$gte": time.time()}},
+            {"$set": flags},
+            return_document=ReturnDocument.AFTER,
+        )
+        return doc
+
+    def get(self, class_name):
+        return self.col.find_one({"_id": class_name})
+
+    def release(self, class_name, owner):
+        """Owner marks its session completed (the loop ran to the end)."""
+        self.col.update_one(
+            {"_id": class_name, "owner": owner, "state": {"$in": list(LIVE_STATES)}},
+            {"$set": {"state": "completed", "stop": True, "lease_expires": 0}},
+        )
+
+    def claim_finish(self, class_name):
+        """
+        Atomically mark the session finished so exactly one worker finalizes
+        it. Returns the record as it was before, or None if there is no
+        session or it was already finished.
+        """
+        return self.col.find_one_and_update(
+            {"_id": class_name, "state": {"$ne": "finished"}},
+            {"$set": {"state": "finished", "stop": True, "lease_expires": 0}},
+            return_document=ReturnDocument.BEFORE,
+        )
+
+    def cleanup_orphans(self):
+        res = self.col.update_many(
+            {"state": {"$in": list(LIVE_STATES)}, "lease_expires": {"$lt": time.time()}},
+            {"$set": {"state": "orphaned", "stop": True}},
+        )
+        return res.modified_count
+
+
+# -----------------------------
+# SQLite backend (single-host stand-in)
+# -----------------------------
+class SQLiteSessionStore:
+    COLUMNS = ("class_name", "owner", "state", "paused", "stop", "started_at", "heartbeat_at", "lease_expires")
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS sessions (
+                    class_name TEXT PRIMARY KEY,
+                    owner TEXT,
+                    state TEXT,
+                    paused INTEGER DEFAULT 0,
+                    stop INTEGER DEFAULT 0,
+                    started_at REAL,
+                    heartbeat_at REAL,
+                    lease_expires REAL
+                )"""
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def _row(self, row):
+        if not row:
+            return None
+        rec = dict(zip(self.COLUMNS, row))
+        rec["paused"] = bool(rec["paused"])
+        rec["stop"] = bool(rec["stop"])
+        return rec
+
+    def _select(self, conn, class_name):
+        cur = conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM sessions WHERE class_name = ?", (class_name,))
+        return self._row(cur.fetchone())
+
+    def acquire(self, class_name, owner, lease=LEASE_SECONDS):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                current = self._select(conn, class_name)
+                if current and current["state"] in LIVE_STATES and current["lease_expires"] >= now:
+                    conn.execute("ROLLBACK")
+                    return False
+                rec = _fresh(class_name, owner, now, lease)
+                conn.execute(
+                    f"INSERT OR REPLACE INTO sessions ({', '.join(self.COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    tuple(int(rec[c]) if isinstance(rec[c], bool) else rec[c] for c in self.COLUMNS),
+                )
+                conn.execute("COMMIT")
+                return True
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def heartbeat(self, class_name, owner, lease=LEASE_SECONDS):
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE sessions SET heartbeat_at = ?, lease_expires = ? "
+                "WHERE class_name = ? AND owner = ? AND state IN ('running', 'paused')",
+                (now, now + lease, class_name, owner),
+            )
+            if cur.rowcount == 0:
+                return None
+            return self._select(conn, class_name)
+
+    def set_control(self, class_name, **flags):
+        if not flags:
+            return self.get(class_name)
+        assignments = ", ".join(f"{k} = ?" for k in flags)
+        with self._connect() as conn:
+            cur = conn.execute(
+                f"UPDATE sessions SET {assignments} "
+                "WHERE class_name = ? AND state IN ('running', 'paused') AND lease_expires >= ?",
+                (*[int(v) if isinstance(v, bool) else v for v in flags.values()], class_name, time.time()),
+            )
+            if cur.rowcount == 0:
+                return None
+            return self._select(conn, class_name)
+
+    def get(self, class_name):
+        with self._connect() as conn:
+            return self._select(conn, class_name)
+
+    def release(self, class_name, owner):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE sessions SET state = 'completed', stop = 1, lease_expires = 0 "
+                "WHERE class_name = ? AND owner = ? AND state IN ('running', 'paused')",
+                (class_name, owner),
+            )
+
+    def claim_finish(self, class_name):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                before = self._select(conn, class_name)
+                if not before or before["state"] == "finished":
+                    conn.execute("ROLLBACK")
+                    return None
+                conn.execute(
+                    "UPDATE sessions SET state = 'finished', stop = 1, lease_expires = 0 WHERE class_name = ?",
+                    (class_name,),
+                )
+                conn.execute("COMMIT")
+                return before
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def cleanup_orphans(self):
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE sessions SET state = 'orphaned', stop = 1 "
+                "WHERE state IN ('running', 'paused') AND lease_expires < ?",
+                (time.time(),),
+            )
+            return cur.rowcount
+
+
+# -----------------------------
+# Store selection
+# -----------------------------
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            if SESSION_STORE.startswith("sqlite:"):
+                _store = SQLiteSessionStore(SESSION_STORE[len("sqlite:"):])
+            else:
+                _store = MongoSessionStore()
+        return _store
+
+
+# -----------------------------
+# Owner-side heartbeat
+# -----------------------------
+def start_heartbeat(class_name, session, owner=WORKER_ID, interval=HEARTBEAT_SECONDS):
+    """
+    Renew the lease for a session this worker owns and copy control flags
+    set by other workers into the local `session` dict. Stops when the
+    session stops or the lease is lost.
+    """
+    store = get_store()
+
+    def _beat():
+        while not session.get("stop"):
+            try:
+                rec = store.heartbeat(class_name, owner)
+            except Exception as e:
+                print(f"⚠️ Session heartbeat failed for {class_name}: {e}")
+                rec = {}
+            if rec is None:
+                print(f"⚠️ Lost session lease for {class_name} — stopping")
+                session["stop"] = True
+                break
+            if rec:
+                session["paused"] = bool(rec.get("paused"))
+                if rec.get("stop"):
+                    session["stop"] = True
+                    break
+            time.sleep(interval)
+
+    thread = threading.Thread(target=_beat, daemon=True, name=f"session-heartbeat-{class_name}")
+    thread.start()
+    return thread
@@ -0,0 +1,200 @@
+# session_scheduler.py
+"""
+Shared resources for running many class sessions at once.
+
+- SharedModel: one copy of the CNN for the whole process, reloaded when the
+  checkpoint file changes, instead of a model per session thread.
+- FairScheduler: a fixed pool of inference workers. Each session gets its
+  own queue; workers always serve the highest-priority session with work
+  waiting, round-robin among equals, so a big class can't starve a small
+  one and CPU use stays flat however many rooms start at once.
+- capture_slot(): caps how many sessions record/announce at the same time,
+  independently of the inference pool size.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+MAX_CONCURRENT_CAPTURES = int(os.getenv("MAX_CONCURRENT_CAPTURES", "4"))
+REFERENCE_CACHE_SIZE = int(os.getenv("REFERENCE_CACHE_SIZE", "4096"))
+
+
+# -----------------------------
+# Shared model
+# -----------------------------
+class SharedModel:
+    """Lazily loaded (model, inv_labels) shared by every session in the process."""
+
+    def __init__(self, loader, path):
+        self._loader = loader
+        self._path = path
+        self._lock = threading.Lock()
+        self._value = None
+        self._mtime = None
+
+    @property
+    def version(self):
+        return self._mtime
+
+    def file_version(self):
+        """Checkpoint mtime on disk, without loading it."""
+        try:
+            return os.path.getmtime(self._path)
+        except OSError:
+            return None
+
+    def get(self):
+        mtime = self.file_version()
+        with self._lock:
+            if self._value is None or mtime != self._mtime:
+                self._value = self._loader()
+                self._mtime = mtime
+                print(f"🧠 Loaded shared model from {self._path}")
+            return self._value
+
+
+# -----------------------------
+# Reference embedding cache
+# -----------------------------
+class ReferenceCache:
+    """LRU of per-student reference embeddings keyed on (student, samples, model version)."""
+
+    def __init__(self, size=REFERENCE_CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+# -----------------------------
+# Fair inference scheduler
+# -----------------------------
+class FairScheduler:
+    def __init__(self, workers=INFERENCE_WORKERS):
+        self.workers = max(1, workers)
+        self._cv = threading.Condition()
+        self._queues = {}        # session key -> deque of (future, fn, args, kwargs, enqueued_at)
+        self._priority = {}      # session key -> int (higher runs first)
+        self._last_served = {}   # session key -> tick of last dispatch
+        self._tick = 0
+        self._running = 0
+        self._threads = []
+        self.completed = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, daemon=True, name=f"inference-worker-{i}")
+            t.start()
+            self._threads.append(t)
+
+    def set_priority(self, key, priority):
+        with self._cv:
+            self._priority[key] = int(priority)
+
+    def submit(self, key, fn, *args, **kwargs):
+        fut = Future()
+        with self._cv:
+            self._ensure_started()
+            self._queues.setdefault(key, deque()).append((fut, fn, args, kwargs, time.monotonic()))
+            self._cv.notify()
+        return fut
+
+    def forget(self, key):
+        """Drop a finished session's bookkeeping (and cancel anything still queued)."""
+        with self._cv:
+            for fut, *_ in self._queues.pop(key, ()):
+                fut.cancel()
+            self._priority.pop(key, None)
+            self._last_served.pop(key, None)
+
+    def _pick(self):
+        ready = [k for k, q in self._queues.items() if q]
+        if not ready:
+            return None
+        key = max(ready, key=lambda k: (self._priority.get(k, 0), -self._last_served.get(k, 0)))
+        self._tick += 1
+        self._last_served[key] = self._tick
+        return key, self._queues[key].popleft()
+
+    def _work(self):
+        while True:
+            with self._cv:
+                picked = self._pick()
+                while picked is None:
+                    self._cv.wait()
+                    picked = self._pick()
+                self._running += 1
+            _, (fut, fn, args, kwargs, _) = picked
+            try:
+                if fut.set_running_or_notify_cancel():
+                    try:
+                        fut.set_result(fn(*args, **kwargs))
+                        with self._cv:
+                            self.completed += 1
+                    except BaseException as e:
+                        fut.set_exception(e)
+                        with self._cv:
+                            self.failed += 1
+            finally:
+                with self._cv:
+                    self._running -= 1
+
+    def stats(self):
+        with self._cv:
+            return {
+                "workers": self.workers,
+                "running": self._running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "queued": {k: len(q) for k, q in self._queues.items() if q},
+                "priorities": dict(self._priority),
+            }
+
+
+scheduler = FairScheduler()
+reference_cache = ReferenceCache()
+_capture_slots = threading.BoundedSemaphore(max(1, MAX_CONCURRENT_CAPTURES))
+_capturing = 0
+_capture_lock = threading.Lock()
+
+
+@contextmanager
+def capture_slot():
+    """Hold one of the MAX_CONCURRENT_CAPTURES recording slots."""
+    global _capturing
+    _capture_slots.acquire()
+    with _capture_lock:
+        _capturing += 1
+    try:
+        yield
+    finally:
+        with _capture_lock:
+            _capturing -= 1
+        _capture_slots.release()
+
+
+def stats():
+    s = scheduler.stats()
+    s["capture_slots"] = MAX_CONCURRENT_CAPTURES
+    s["capturing"] = _capturing
+    return s
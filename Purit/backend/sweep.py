@@ -0,0 +1,254 @@
+# sweep.py
+"""
+Parallel hyperparameter sweep for the speaker model.
+
+    python sweep.py --lr 1e-3 5e-4 --batch-size 16 32 --n-mels 40 64 \
+        --conf 0.90 0.93 --margin 0.05 0.08 --parallel 4 --threads 2
+    python sweep.py --mode random --trials 12 ...
+
+Features are materialized once per n_mels value (feature_shards.py) before
+any trial starts; every trial maps the same shard read-only. Trials run in
+a spawn process pool, each limited to --threads torch threads, and share
+their per-epoch validation accuracy through a manager dict: from
+--grace epochs on, a trial that is below the median of the other trials
+at the same epoch is stopped (median stopping rule).
+
+CONF_THRESHOLD / MARGIN_THRESHOLD do not change training, so every trained
+model is scored for all threshold pairs and the best pair is reported:
+
+- accuracy: held-out clips accepted *and* matched to the right student
+  (same rule as attendance_inference.match_scores) against reference
+  embeddings averaged from the training clips;
+- EER: equal error rate of genuine vs impostor cosine scores;
+- train time and single-clip embedding latency.
+
+Results are printed as a table and written to --out (JSON).
+"""
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import torch
+
+from feature_shards import SHARD_DIR, ShardDataset, build_shard
+from model import SpeakerRecognitionCNN
+
+DEFAULT_SPACE = {
+    "lr": [1e-3, 5e-4],
+    "batch_size": [16, 32],
+    "n_mels": [64],
+    "conf": [0.90, 0.93],
+    "margin": [0.05, 0.08],
+}
+TRAIN_KEYS = ("lr", "batch_size", "n_mels")
+
+
+# -----------------------------
+# Search space
+# -----------------------------
+def trial_configs(space, mode="grid", trials=None, seed=0):
+    """Training configs (lr, batch_size, n_mels); thresholds are scored per config."""
+    grid = [dict(zip(TRAIN_KEYS, values)) for values in itertools.product(*(space[k] for k in TRAIN_KEYS))]
+    if mode == "random":
+        rng = random.Random(seed)
+        grid = rng.sample(grid, min(trials or len(grid), len(grid)))
+    return [dict(cfg, trial=i) for i, cfg in enumerate(grid)]
+
+
+# -----------------------------
+# Scoring
+# -----------------------------
+def _embed(model, dataset, indices, batch=64):
+    model.eval()
+    with torch.no_grad():
+        out = [model.embed(dataset[indices[i:i + batch]][0]) for i in range(0, len(indices), batch)]
+    emb = torch.cat(out).numpy()
+    return emb / (np.linalg.norm(emb, axis=1, keepdims=True) + 1e-9)
+
+
+def equal_error_rate(genuine, impostor):
+    scores = np.concatenate([genuine, impostor])
+    labels = np.concatenate([np.ones_like(genuine), np.zeros_like(impostor)])
+    order = np.argsort(-scores)
+    labels = labels[order]
+    far = np.cumsum(1 - labels) / max(len(impostor), 1)   # impostors accepted above each cut
+    frr = 1 - np.cumsum(labels) / max(len(genuine), 1)    # genuine rejected
+    i = int(np.argmin(np.abs(far - frr)))
+    return float((far[i] + frr[i]) / 2)
+
+
+def score(model, dataset, train_idx, val_idx, conf_values, margin_values):
+    """Best (conf, margin) identification accuracy and EER on the validation clips."""
+    train_idx, val_idx = sorted(train_idx), sorted(val_idx)  # ShardDataset returns batches in index order
+    labels = dataset.labels.numpy()
+    train_emb = _embed(model, dataset, train_idx)
+    classes = sorted(set(labels[train_idx]))
+    refs = np.stack([train_emb[labels[train_idx] == c].mean(axis=0) for c in classes])
+    refs /= np.linalg.norm(refs, axis=1, keepdims=True) + 1e-9
+    val_emb = _embed(model, dataset, val_idx)
+    sims = val_emb @ refs.T                                  # (V, C)
+    truth = np.searchsorted(classes, labels[val_idx])
+
+    ranked = np.sort(sims, axis=1)
+    best = ranked[:, -1]
+    if sims.shape[1] > 1:
+        margin = best - ranked[:, -2]
+    else:  # no runner-up: match_scores rejects an identification outright
+        margin = np.full_like(best, -np.inf)
+    correct = sims.argmax(axis=1) == truth
+    results = []
+    for c, m in itertools.product(conf_values, margin_values):
+        accepted = (best >= c) & (margin >= m)
+        results.append({"conf": c, "margin": m, "accuracy": float(np.mean(accepted & correct)),
+                        "false_accept": float(np.mean(accepted & ~correct))})
+    top = max(results, key=lambda r: (r["accuracy"], -r["false_accept"]))
+
+    genuine = sims[np.arange(len(truth)), truth]
+    mask = np.ones_like(sims, dtype=bool)
+    mask[np.arange(len(truth)), truth] = False
+    return dict(top, eer=equal_error_rate(genuine, sims[mask]), top1=float(np.mean(correct)))
+
+
+def inference_latency_ms(model, shape, runs=30):
+    model.eval()
+    x = torch.randn(1, *shape)
+    with torch.no_grad():
+        model.embed(x)
+        start = time.perf_counter()
+        for _ in range(runs):
+            model.embed(x)
+    return (time.perf_counter() - start) * 1000 / runs
+
+
+# -----------------------------
+# Trial (runs in a pool process)
+# -----------------------------
+def _should_stop(progress, trial, epoch, grace):
+    if epoch + 1 < grace:
+        return False
+    others = [h[epoch] for t, h in progress.items() if t != trial and len(h) > epoch]
+    return len(others) >= 2 and progress[trial][epoch] < statistics.median(others)
+
+
+def run_trial(cfg, meta_path, epochs, threads, conf_values, margin_values, progress, grace):
+    from train import evaluate, make_loader, stratified_split
+
+    torch.set_num_threads(threads)
+    torch.manual_seed(cfg["trial"])
+    dataset = ShardDataset(meta_path)
+    samples = list(zip(dataset.refs, dataset.labels.tolist()))
+    train_idx, val_idx = stratified_split(samples)
+    if not val_idx:
+        raise RuntimeError("❌ No speaker has enough samples for a validation split.")
+    _, loader = make_loader(None, cfg["batch_size"], "shard", 0, "cpu", dataset=dataset, indices=train_idx)
+    _, val_loader = make_loader(None, 256, "shard", 0, "cpu", dataset=dataset, indices=val_idx)
+
+    model = SpeakerRecognitionCNN(n_classes=len(dataset.label_map), n_mels=cfg["n_mels"])
+    optimizer = torch.optim.Adam(model.parameters(), lr=cfg["lr"])
+    criterion = torch.nn.CrossEntropyLoss()
+    progress[cfg["trial"]] = []
+    started = time.perf_counter()
+    stopped_at = None
+    for epoch in range(epochs):
+        model.train()
+        for x, y in loader:
+            loss = criterion(model(x), y)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+        _, val_acc = evaluate(model, val_loader, criterion, "cpu")
+        progress[cfg["trial"]] = progress[cfg["trial"]] + [val_acc]
+        if epoch + 1 < epochs and _should_stop(progress, cfg["trial"], epoch, grace):
+            stopped_at = epoch + 1
+            break
+    train_time = time.perf_counter() - started
+
+    result = dict(cfg)
+    result.update(score(model, dataset, train_idx, val_idx, conf_values, margin_values))
+    result.update(
+        val_acc=progress[cfg["trial"]][-1],
+        epochs=len(progress[cfg["trial"]]),
+        stopped_early=stopped_at is not None,
+        train_time=train_time,
+        latency_ms=inference_latency_ms(model, dataset.shape[1:]),
+        threads=threads,
+    )
+    return result
+
+
+# -----------------------------
+# Sweep
+# -----------------------------
+def run_sweep(records, space=DEFAULT_SPACE, mode="grid", trials=None, epochs=20, parallel=2, threads=1,
+              grace=5, shard_dir=SHARD_DIR):
+    configs = trial_configs(space, mode, trials)
+    # one shared feature set per n_mels, built before any trial starts
+    shards = {n: build_shard(records, shard_dir, n_mels=n) for n in sorted({c["n_mels"] for c in configs})}
+    print(f"🔁 {len(configs)} trial(s), {parallel} at a time, {threads} thread(s) each")
+
+    results = []
+    ctx = mp.get_context("spawn")  # torch is not fork-safe
+    with ctx.Manager() as manager, ProcessPoolExecutor(max_workers=parallel, mp_context=ctx) as pool:
+        progress = manager.dict()
+        futures = {
+            pool.submit(run_trial, cfg, shards[cfg["n_mels"]], epochs, threads,
+                        space["conf"], space["margin"], progress, grace): cfg
+            for cfg in configs
+        }
+        for fut in as_completed(futures):
+            cfg = futures[fut]
+            try:
+                r = fut.result()
+            except Exception as e:
+                print(f"⚠️ Trial {cfg['trial']} failed: {e}")
+                continue
+            results.append(r)
+            print(f"✅ Trial {r['trial']}: acc {r['accuracy']:.3f}, EER {r['eer']:.3f}, "
+                  f"{r['epochs']} epoch(s){' (stopped early)' if r['stopped_early'] else ''}")
+    results.sort(key=lambda r: (-r["accuracy"], r["eer"]))
+    return results
+
+
+def print_table(results):
+    cols = [("trial", "{:>5}"), ("lr", "{:>8.0e}"), ("batch_size", "{:>5}"), ("n_mels", "{:>6}"),
+            ("conf", "{:>5.2f}"), ("margin", "{:>6.2f}"), ("accuracy", "{:>8.3f}"), ("top1", "{:>6.3f}"),
+            ("eer", "{:>6.3f}"), ("epochs", "{:>6}"), ("train_time", "{:>9.1f}"), ("latency_ms", "{:>10.2f}")]
+    heads = {"batch_size": "batch", "train_time": "train s", "latency_ms": "infer ms"}
+    print(" ".join(f"{heads.get(name, name):>{len(fmt.format(0))}}" for name, fmt in cols))
+    for r in results:
+        row = " ".join(fmt.format(r[name]) for name, fmt in cols)
+        print(row + ("  ⏹️" if r["stopped_early"] else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter sweep")
+    parser.add_argument("--mode", choices=["grid", "random"], default="grid")
+    parser.add_argument("--trials", type=int, default=None, help="random mode: number of configs")
+    parser.add_argument("--lr", type=float, nargs="+", default=DEFAULT_SPACE["lr"])
+    parser.add_argument("--batch-size", type=int, nargs="+", default=DEFAULT_SPACE["batch_size"])
+    parser.add_argument("--n-mels", type=int, nargs="+", default=DEFAULT_SPACE["n_mels"])
+    parser.add_argument("--conf", type=float, nargs="+", default=DEFAULT_SPACE["conf"])
+    parser.add_argument("--margin", type=float, nargs="+", default=DEFAULT_SPACE["margin"])
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--parallel", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--threads", type=int, default=1, help="torch threads per trial")
+    parser.add_argument("--grace", type=int, default=5, help="epochs before median stopping applies")
+    parser.add_argument("--out", default="sweep_results.json")
+    args = parser.parse_args()
+
+    from train import get_records_from_mongo
+    space = {"lr": args.lr, "batch_size": args.batch_size, "n_mels": args.n_mels,
+             "conf": args.conf, "margin": args.margin}
+    results = run_sweep(get_records_from_mongo(), space, args.mode, args.trials, args.epochs,
+                        args.parallel, args.threads, args.grace)
+    print_table(results)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {args.out}")
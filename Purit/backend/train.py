@@ -1,22 +1,49 @@
 # train.py
 import torch
-from torch.utils.data import DataLoader
-from dataset import StudentAudioDataset
-from model import SpeakerRecognitionCNN
+import torch.distributed as dist
+import torch.multiprocessing as torch_mp
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import BatchSampler, DataLoader, DistributedSampler, RandomSampler, Subset, SubsetRandomSampler
+from dataset import N_MELS, StudentAudioDataset
+from feature_shards import SHARD_DIR, ShardDataset, build_shard
+from model import VARIANTS, SpeakerRecognitionCNN
 from pymongo import MongoClient
 import os
-import pathlib
 from tqdm import tqdm
+import audio_store
+import augment
+import cpu_budget
+import cpu_precision
 import argparse
+import copy
+import socket
+import tempfile
+import json
+import random
+import time
 
 # -----------------------------
 # Config (can be overridden by args)
 # -----------------------------
 EPOCHS = 100
-BATCH_SIZE = 4
+BATCH_SIZE = 32
 LR = 5e-4
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 MODEL_OUT = "speaker_cnn.pt"
+FEATURES = "shard"  # shard: precomputed memory-mapped features | raw: decode every epoch
+NUM_WORKERS = int(os.getenv("TRAIN_LOADER_WORKERS", "2"))
+
+# Validation / early stopping / checkpointing
+VAL_FRACTION = 0.2         # per speaker; speakers with a single sample stay train-only
+PATIENCE = 10              # epochs without improvement before stopping (0 = never stop early)
+MONITOR = "loss"           # loss: validation loss | acc: validation accuracy
+LR_PATIENCE = 4            # epochs without improvement before halving the LR
+CHECKPOINT_EVERY = 5       # epochs between resumable checkpoints (0 = off)
+
+# Incremental fine-tuning (--finetune): warm start from the previous checkpoint
+FINETUNE_EPOCHS = 8
+FINETUNE_LR = 2e-4
+REPLAY_PER_CLASS = int(os.getenv("TRAIN_REPLAY_PER_CLASS", "4"))  # old samples replayed per unchanged student
 
 
 # -----------------------------
@@ -38,22 +65,21 @@ def get_records_from_mongo(uri="mongodb://localhost:27017", db_name="purit_db"):
         for path in r.get("verified_samples", []):
             if not path:
                 continue
-            norm_path = str(pathlib.Path(path))  # ✅ normalize slashes for Windows/Linux
-            if os.path.exists(norm_path):
-                student_paths.append(norm_path)
+            # blob ids or legacy paths (audio_store normalizes slashes)
+            if audio_store.exists(path):
+                student_paths.append(path)
             else:
-                print(f"⚠️ WARNING: Missing verified file for {r['student_id']}: {norm_path}")
+                print(f"⚠️ WARNING: Missing verified file for {r['student_id']}: {path}")
 
         # Add voice_samples if verified ones are empty
         if not student_paths:
             for path in r.get("voice_samples", []):
                 if not path:
                     continue
-                norm_path = str(pathlib.Path(path))
-                if os.path.exists(norm_path):
-                    student_paths.append(norm_path)
+                if audio_store.exists(path):
+                    student_paths.append(path)
                 else:
-                    print(f"⚠️ WARNING: Missing voice file for {r['student_id']}: {norm_path}")
+                    print(f"⚠️ WARNING: Missing voice file for {r['student_id']}: {path}")
 
         if not student_paths:
             print(f"⚠️ WARNING: No valid audio for {r['student_id']}")
@@ -79,62 +105,535 @@ def get_records_from_mongo(uri="mongodb://localhost:27017", db_name="purit_db"):
 # -----------------------------
 # Train the speaker recognition model
 # -----------------------------
-def train_model(records, epochs=EPOCHS, batch_size=BATCH_SIZE, lr=LR, device=DEVICE, out_path=MODEL_OUT):
-    dataset = StudentAudioDataset(records)
+def write_progress(path, **fields):
+    """Atomically replace the JSON progress file the retrain manager polls."""
+    if not path:
+        return
+    with open(path + ".tmp", "w") as f:
+        json.dump(fields, f)
+    os.replace(path + ".tmp", path)
+
+
+def make_dataset(records, features=FEATURES, shard_dir=SHARD_DIR, n_mels=N_MELS):
+    if features == "shard":
+        return ShardDataset(build_shard(records, shard_dir, n_mels=n_mels))
+    return StudentAudioDataset(records, n_mels=n_mels)
+
+
+def model_config(init_from=None, variant=None):
+    """Architecture to train: the warm-start checkpoint's (it wins), else `variant`, else the baseline."""
+    if init_from and os.path.exists(init_from):
+        return torch.load(init_from, map_location="cpu").get("config") or {}
+    return dict(variant or {})
+
+
+class _DistributedIndices(DistributedSampler):
+    """DistributedSampler over a list of dataset indices (yields the indices, not positions)."""
+
+    def __init__(self, indices, num_replicas, rank, seed=0):
+        super().__init__(indices, num_replicas=num_replicas, rank=rank, shuffle=True, seed=seed)
+        self.indices = indices
+
+    def __iter__(self):
+        return (self.indices[i] for i in super().__iter__())
+
+
+def _set_epoch(loader, epoch):
+    """Reseed a distributed sampler (wherever the loader keeps it) for a new epoch."""
+    for sampler in (loader.sampler, getattr(loader.sampler, "sampler", None)):
+        if hasattr(sampler, "set_epoch"):
+            sampler.set_epoch(epoch)
+
+
+def make_loader(records, batch_size=BATCH_SIZE, features=FEATURES, num_workers=NUM_WORKERS,
+                device=DEVICE, shard_dir=SHARD_DIR, dataset=None, indices=None, rank=0, world_size=1):
+    """(dataset, loader) reading precomputed shard features or decoding raw audio.
+
+    `indices` restricts the loader to a subset of the dataset (replay training).
+    With world_size > 1 each rank gets its own 1/world_size share per epoch.
+    """
+    pin = str(device).startswith("cuda")
+    dataset = dataset or make_dataset(records, features, shard_dir)
+    if world_size > 1:
+        indices = list(range(len(dataset))) if indices is None else indices
+    if features == "shard":
+        if world_size > 1:
+            base = _DistributedIndices(indices, world_size, rank)
+        else:
+            base = SubsetRandomSampler(indices) if indices is not None else RandomSampler(dataset)
+        # the sampler yields whole index batches; the dataset returns stacked tensors
+        sampler = BatchSampler(base, batch_size=batch_size, drop_last=False)
+        loader = DataLoader(
+            dataset, sampler=sampler, batch_size=None,
+            num_workers=num_workers, pin_memory=pin, persistent_workers=num_workers > 0,
+        )
+    else:
+        subset = Subset(dataset, indices) if indices is not None else dataset
+        sampler = DistributedSampler(subset, num_replicas=world_size, rank=rank) if world_size > 1 else None
+        loader = DataLoader(
+            subset, batch_size=batch_size, shuffle=sampler is None, sampler=sampler,
+            num_workers=num_workers, pin_memory=pin, persistent_workers=num_workers > 0 and len(subset) > 0,
+        )
+    return dataset, loader
+
+
+# -----------------------------
+# Validation split, evaluation, resumable checkpoints
+# -----------------------------
+def stratified_split(samples, pool=None, val_fraction=VAL_FRACTION, seed=0):
+    """(train, val) index lists holding out ~val_fraction of each speaker's samples (at least one train sample)."""
+    rng = random.Random(seed)
+    by_label = {}
+    for i in (pool if pool is not None else range(len(samples))):
+        by_label.setdefault(samples[i][1], []).append(i)
+    train, val = [], []
+    for label, idx in by_label.items():
+        idx = idx[:]
+        rng.shuffle(idx)
+        n_val = min(len(idx) - 1, max(1, round(len(idx) * val_fraction))) if val_fraction > 0 else 0
+        val += idx[:n_val]
+        train += idx[n_val:]
+    return sorted(train), sorted(val)
+
+
+def evaluate(model, loader, criterion, device=DEVICE, execution=None):
+    """(mean loss, accuracy) over a loader."""
+    execution = execution or cpu_precision.ExecutionMode("fp32", False)
+    model.eval()
+    total_loss, correct, count = 0.0, 0, 0
+    with torch.no_grad():
+        for x, y in loader:
+            x, y = x.to(device, non_blocking=True), y.to(device, non_blocking=True)
+            with execution.autocast():
+                logits = model(execution.input(x)).float()
+            total_loss += criterion(logits, y).item() * x.size(0)
+            correct += (logits.argmax(dim=1) == y).sum().item()
+            count += x.size(0)
+    return total_loss / max(count, 1), correct / max(count, 1)
+
+
+def _save_atomic(obj, path):
+    torch.save(obj, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def _load_resume(path, label_map, train_idx, val_idx):
+    """Resume state saved by an interrupted run on the same data, else None."""
+    if not os.path.exists(path):
+        return None
+    state = torch.load(path, map_location="cpu", weights_only=False)
+    if state.get("labels") != label_map or state.get("train_idx") != train_idx or state.get("val_idx") != val_idx:
+        print(f"⚠️ Ignoring {path}: it was saved for different training data.")
+        return None
+    return state
+
+
+# -----------------------------
+# Incremental fine-tuning
+# -----------------------------
+def _sample_labels(dataset):
+    """[(audio_ref, label)] for either dataset type."""
+    if hasattr(dataset, "samples"):
+        return dataset.samples
+    return list(zip(dataset.refs, dataset.labels.tolist()))
+
+
+def warm_start(init_path, label_map, device=DEVICE):
+    """Model from a previous checkpoint with `fc` remapped to `label_map`.
+
+    Backbone weights load as-is; students already in the old checkpoint keep
+    their classifier rows (moved to their new index), students no longer
+    present are dropped. Returns (model, old checkpoint).
+    """
+    ckpt = torch.load(init_path, map_location="cpu")
+    state = ckpt.get("model_state_dict", ckpt)
+    old_labels = ckpt.get("labels") or {}
+    model = SpeakerRecognitionCNN.from_config(len(label_map), ckpt.get("config"))
+    model.load_state_dict({k: v for k, v in state.items() if not k.startswith("fc.")}, strict=False)
+    with torch.no_grad():
+        for sid, new_idx in label_map.items():
+            old_idx = old_labels.get(sid)
+            if old_idx is not None and old_idx < state["fc.weight"].shape[0]:
+                model.fc.weight[new_idx] = state["fc.weight"][old_idx]
+                model.fc.bias[new_idx] = state["fc.bias"][old_idx]
+    return model.to(device), ckpt
+
+
+def _imprint(model, dataset, samples, indices, new_labels, kept_labels, device=DEVICE):
+    """Initialize new students' fc rows from their embeddings.
+
+    Embeddings are post-ReLU, so all of them point the same general way; the
+    row is the student's mean embedding minus the mean over the training
+    subset, scaled like the existing rows, with the bias chosen so the
+    average clip scores like an average old class.
+    """
+    if not new_labels or not kept_labels:
+        return
+    model.eval()
+    with torch.no_grad():
+        kept = torch.tensor(sorted(kept_labels), device=device)
+        scale = model.fc.weight[kept].norm(dim=1).mean()
+        bias = model.fc.bias[kept].mean()
+        emb = torch.cat([
+            model.embed(torch.stack([dataset[i][0] for i in indices[j:j + 64]]).to(device))
+            for j in range(0, len(indices), 64)
+        ])
+        center = emb.mean(dim=0)
+        labels = torch.tensor([samples[i][1] for i in indices], device=device)
+        for label in new_labels:
+            mask = labels == label
+            if not mask.any():
+                continue
+            direction = emb[mask].mean(dim=0) - center
+            model.fc.weight[label] = direction / direction.norm().clamp_min(1e-8) * scale
+            model.fc.bias[label] = bias - model.fc.weight[label] @ center
+
+
+def replay_indices(samples, label_map, changed, per_class=REPLAY_PER_CLASS, seed=0):
+    """
+    All samples of changed students plus a few of everyone else's. The
+    subset is seeded so that every rank, and a run resumed after an
+    interruption, trains on the same samples.
+    """
+    rng = random.Random(seed)
+    changed_labels = {label_map[sid] for sid in changed}
+    by_label = {}
+    for i, (_, label) in enumerate(samples):
+        by_label.setdefault(label, []).append(i)
+    indices = []
+    for label, idx in by_label.items():
+        indices += idx if label in changed_labels else rng.sample(idx, min(per_class, len(idx)))
+    return sorted(indices)
+
+
+def _changed_students(records, old_ckpt):
+    """Students that are new or whose samples differ from the ones the checkpoint was trained on."""
+    old_sources = old_ckpt.get("sources")
+    if old_sources is None:  # checkpoint predates source tracking: treat everything as changed
+        return {r["student_id"] for r in records}
+    return {
+        r["student_id"] for r in records
+        if set(r.get("paths", [])) != set(old_sources.get(r["student_id"], []))
+    }
+
+
+def train_model(records, epochs=EPOCHS, batch_size=BATCH_SIZE, lr=LR, device=DEVICE, out_path=MODEL_OUT,
+                features=FEATURES, num_workers=NUM_WORKERS, progress_path=None, init_from=None,
+                val_fraction=VAL_FRACTION, patience=PATIENCE, monitor=MONITOR,
+                checkpoint_every=CHECKPOINT_EVERY, resume=False, augmenter=None, execution=None, variant=None,
+                rank=0, world_size=1):
+    """
+    Train from scratch, or fine-tune `init_from` on changed students plus a
+    replay buffer. A stratified validation split drives early stopping and
+    LR reduction; the best epoch is what gets saved. Every
+    `checkpoint_every` epochs a resumable state goes to `<out_path>.resume`.
+    `augmenter` (augment.BatchAugment) is applied to each training batch on the device.
+    `execution` (cpu_precision.ExecutionMode) selects bf16 autocast / channels_last;
+    it defaults to MODEL_PRECISION / MODEL_CHANNELS_LAST.
+    `variant` (SpeakerRecognitionCNN kwargs, see model.VARIANTS) picks the
+    architecture when training from scratch; a warm start keeps the
+    checkpoint's. The saved checkpoint records it under "config".
+
+    With world_size > 1 this runs inside one rank of an initialized gloo
+    process group (see train_distributed): gradients are all-reduced by
+    DistributedDataParallel, every rank takes the same stopping/LR decisions
+    from rank 0's validation metrics, and only rank 0 writes files.
+    """
+    distributed = world_size > 1
+    lead = rank == 0
+    log = print if lead else (lambda *a, **k: None)
+    config = model_config(init_from, variant)
+    dataset = make_dataset(records, features, n_mels=config.get("n_mels", N_MELS))
     n_classes = len(dataset.label_map)
     total_samples = len(dataset)
 
     if total_samples == 0:
         raise RuntimeError("❌ Dataset is empty — no valid audio files found to train on.")
 
-    print(f"✅ Loaded {total_samples} total samples for {n_classes} speakers.")
+    log(f"✅ Loaded {total_samples} total samples for {n_classes} speakers ({features} features).")
+
+    samples = _sample_labels(dataset)
+    indices = None
+    if init_from and os.path.exists(init_from):
+        model, old_ckpt = warm_start(init_from, dataset.label_map, device)
+        old_labels = old_ckpt.get("labels") or {}
+        changed = _changed_students(records, old_ckpt)
+        kept = {idx for sid, idx in dataset.label_map.items() if sid in old_labels}
+        indices = replay_indices(samples, dataset.label_map, changed)
+        _imprint(model, dataset, samples, indices, set(range(n_classes)) - kept, kept, device)
+        log(
+            f"✅ Fine-tuning from {init_from}: {len(changed)} changed/new student(s), "
+            f"{len(indices)}/{total_samples} samples incl. replay"
+        )
+    else:
+        if init_from:
+            log(f"⚠️ {init_from} not found — training from scratch.")
+        model = SpeakerRecognitionCNN.from_config(n_classes, config)
+        model.to(device)
 
-    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True)
-    model = SpeakerRecognitionCNN(n_classes=n_classes)
-    model.to(device)
+    execution = execution or cpu_precision.ExecutionMode(device=device)
+    execution.prepare(model)
+    train_idx, val_idx = stratified_split(samples, indices, val_fraction)
+    _, loader = make_loader(records, batch_size, features, num_workers, device, dataset=dataset, indices=train_idx,
+                            rank=rank, world_size=world_size)
+    val_loader = None
+    if val_idx:
+        _, val_loader = make_loader(records, batch_size, features, 0, device, dataset=dataset, indices=val_idx)
+    else:
+        log("⚠️ No speaker has enough samples for validation — monitoring training loss instead.")
+    log(f"✅ {len(train_idx)} training / {len(val_idx)} validation samples")
 
+    net = DistributedDataParallel(model) if distributed else model  # model stays the unwrapped module
     optimizer = torch.optim.Adam(model.parameters(), lr=lr)
     criterion = torch.nn.CrossEntropyLoss()
+    mode = "max" if monitor == "acc" and val_loader else "min"
+    scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode=mode, factor=0.5, patience=LR_PATIENCE)
 
-    print(f"✅ Training started on {device} with {n_classes} classes")
-    for epoch in range(epochs):
+    resume_path = out_path + ".resume"
+    start_epoch, best_metric, best_state, best_epoch, bad_epochs = 0, None, None, 0, 0
+    state = _load_resume(resume_path, dataset.label_map, train_idx, val_idx) if resume else None
+    if state:
+        model.load_state_dict(state["model"])
+        optimizer.load_state_dict(state["optimizer"])
+        scheduler.load_state_dict(state["scheduler"])
+        torch.set_rng_state(state["rng"])
+        start_epoch, best_metric, best_state = state["epoch"], state["best_metric"], state["best_state"]
+        best_epoch, bad_epochs = state["best_epoch"], state["bad_epochs"]
+        log(f"🔁 Resuming from epoch {start_epoch} ({resume_path})")
+
+    log(f"✅ Training started on {device} with {n_classes} classes, {execution!r}"
+        + (f", {augmenter!r}" if augmenter else ""))
+    started = time.perf_counter()
+    epochs_run = 0
+    for epoch in range(start_epoch, epochs):
+        epochs_run += 1
         model.train()
-        total_loss = 0.0
-        pbar = tqdm(loader, desc=f"Epoch {epoch+1}/{epochs}")
+        _set_epoch(loader, epoch)
+        total_loss, seen = 0.0, 0
+        aug_time = step_time = 0.0
+        epoch_start = time.perf_counter()
+        pbar = tqdm(loader, desc=f"Epoch {epoch+1}/{epochs}", disable=not lead)
         for x, y in pbar:
-            x, y = x.to(device), y.to(device)
-            logits = model(x)
-            loss = criterion(logits, y)
+            x, y = x.to(device, non_blocking=True), y.to(device, non_blocking=True)
+            t0 = time.perf_counter()
+            if augmenter is not None:
+                x = augmenter(x)
+            t1 = time.perf_counter()
+            with execution.autocast():
+                logits = net(execution.input(x))
+            loss = criterion(logits.float(), y)
 
             optimizer.zero_grad()
             loss.backward()
             optimizer.step()
 
             total_loss += loss.item() * x.size(0)
+            seen += x.size(0)
+            aug_time += t1 - t0
+            step_time += time.perf_counter() - t1
             pbar.set_postfix({"loss": loss.item()})
-        avg_loss = total_loss / len(dataset)
-        print(f"Epoch {epoch+1}: Average Loss = {avg_loss:.4f}")
+        if distributed:
+            totals = torch.tensor([total_loss, seen], dtype=torch.float64)
+            dist.all_reduce(totals)
+            total_loss, seen = totals.tolist()
+        throughput = seen / (time.perf_counter() - epoch_start)
+        avg_loss = total_loss / seen
+        if augmenter is not None and epoch == min(start_epoch + 1, epochs - 1):  # past one-time setup
+            log(f"⚙️ Augmentation: {aug_time:.2f}s vs {step_time:.2f}s forward/backward ({aug_time / step_time:.1%})")
+
+        val_loss, val_acc = evaluate(model, val_loader, criterion, device, execution) if val_loader else (avg_loss, None)
+        if distributed:  # identical decisions on every rank
+            shared = torch.tensor([val_loss, -1.0 if val_acc is None else val_acc], dtype=torch.float64)
+            dist.broadcast(shared, 0)
+            val_loss, val_acc = shared[0].item(), (None if shared[1] < 0 else shared[1].item())
+        metric = val_acc if mode == "max" else val_loss
+        scheduler.step(metric)
+        improved = best_metric is None or (metric > best_metric if mode == "max" else metric < best_metric - 1e-4)
+        if improved:
+            best_metric, best_epoch, bad_epochs = metric, epoch + 1, 0
+            best_state = copy.deepcopy(model.state_dict())
+        else:
+            bad_epochs += 1
+        lr_now = optimizer.param_groups[0]["lr"]
+        acc_text = f", Val Acc = {val_acc:.3f}" if val_acc is not None else ""
+        log(
+            f"Epoch {epoch+1}: Average Loss = {avg_loss:.4f}, Val Loss = {val_loss:.4f}{acc_text}, "
+            f"LR = {lr_now:.2e}, {throughput:.0f} samples/s"
+        )
+        if lead:
+            write_progress(
+                progress_path, epoch=epoch + 1, epochs=epochs, loss=avg_loss, val_loss=val_loss,
+                val_acc=val_acc, lr=lr_now, best_epoch=best_epoch, samples_per_sec=throughput,
+            )
+
+        if lead and checkpoint_every and (epoch + 1) % checkpoint_every == 0:
+            _save_atomic({
+                "epoch": epoch + 1,
+                "model": model.state_dict(),
+                "optimizer": optimizer.state_dict(),
+                "scheduler": scheduler.state_dict(),
+                "rng": torch.get_rng_state(),
+                "best_metric": best_metric,
+                "best_state": best_state,
+                "best_epoch": best_epoch,
+                "bad_epochs": bad_epochs,
+                "labels": dataset.label_map,
+                "train_idx": train_idx,
+                "val_idx": val_idx,
+            }, resume_path)
+        if patience and bad_epochs >= patience:
+            log(f"⏹️ Early stopping at epoch {epoch+1}: no improvement since epoch {best_epoch}")
+            break
+
+    elapsed = time.perf_counter() - started
+    log(f"✅ Trained {epochs_run} epoch(s) in {elapsed:.1f}s; best epoch {best_epoch}")
 
-    # Save model and label mapping
+    # Save the best model and label mapping
     save_dict = {
-        "model_state_dict": model.state_dict(),
-        "labels": dataset.label_map
+        "model_state_dict": best_state or model.state_dict(),
+        "labels": dataset.label_map,
+        "config": model.config(),
+        "sources": {r["student_id"]: list(r.get("paths", [])) for r in records},
+        "best_epoch": best_epoch,
+        "best_metric": {"monitor": monitor if val_loader else "train_loss", "value": best_metric},
     }
-    torch.save(save_dict, out_path)
-    print(f"✅ Model saved to {out_path}")
+    if lead:
+        _save_atomic(save_dict, out_path)
+        if os.path.exists(resume_path):
+            os.remove(resume_path)
+        log(f"✅ Model saved to {out_path}")
     return out_path
 
 
+# -----------------------------
+# Multi-process (gloo) data-parallel training
+# -----------------------------
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _distributed_worker(rank, world_size, port, threads, records, kwargs):
+    os.environ.update(MASTER_ADDR="127.0.0.1", MASTER_PORT=str(port))
+    cpu_budget.apply_worker(rank, world_size, budget=world_size * threads, pin=cpu_budget.PIN_CORES)
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+    try:
+        train_model(records, rank=rank, world_size=world_size, **kwargs)
+    finally:
+        dist.destroy_process_group()
+
+
+def train_distributed(records, world_size, threads_per_worker=None, **kwargs):
+    """
+    train_model() across `world_size` local processes (gloo, CPU). Features
+    are materialized once up front so the ranks only map the shard. Each
+    rank keeps the per-process batch size, so the global batch is
+    world_size x batch_size.
+    """
+    if world_size <= 1:
+        return train_model(records, **kwargs)
+    if kwargs.get("features", FEATURES) == "shard":
+        config = model_config(kwargs.get("init_from"), kwargs.get("variant"))
+        build_shard(records, SHARD_DIR, n_mels=config.get("n_mels", N_MELS))
+    threads = threads_per_worker or max(1, len(cpu_budget.available_cores()) // world_size)
+    kwargs.setdefault("device", "cpu")
+    torch_mp.spawn(
+        _distributed_worker,
+        args=(world_size, _free_port(), threads, records, kwargs),
+        nprocs=world_size,
+        join=True,
+    )
+    return kwargs.get("out_path", MODEL_OUT)
+
+
+def scaling_curve(records, worker_counts, epochs=3, threads_per_worker=None, **kwargs):
+    """[(workers, samples/sec)] measured on the last of `epochs` epochs (no early stopping)."""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in worker_counts:
+            progress = os.path.join(tmp, f"progress-{n}.json")
+            train_distributed(
+                records, n, threads_per_worker, epochs=epochs, patience=0, checkpoint_every=0, progress_path=progress,
+                out_path=os.path.join(tmp, f"scaling-{n}.pt"), **kwargs,
+            )
+            with open(progress) as f:
+                results.append((n, json.load(f)["samples_per_sec"]))
+    base = results[0][1] / results[0][0] if results else 1.0
+    print(f"\n{'workers':>8} {'samples/s':>10} {'speedup':>8} {'efficiency':>10}")
+    for n, rate in results:
+        print(f"{n:>8} {rate:10.1f} {rate / results[0][1]:8.2f} {rate / (base * n):10.1%}")
+    return results
+
+
 # -----------------------------
 # CLI Entry Point
 # -----------------------------
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--epochs", type=int, default=None, help=f"default {EPOCHS}, or {FINETUNE_EPOCHS} with --finetune")
     parser.add_argument("--batch_size", type=int, default=BATCH_SIZE)
-    parser.add_argument("--lr", type=float, default=LR)
+    parser.add_argument("--lr", type=float, default=None, help=f"default {LR}, or {FINETUNE_LR} with --finetune")
     parser.add_argument("--out", type=str, default=MODEL_OUT)
+    parser.add_argument("--features", choices=["shard", "raw"], default=FEATURES)
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="DataLoader worker processes")
+    parser.add_argument("--progress", type=str, default=None, help="JSON file updated after every epoch")
+    parser.add_argument("--finetune", action="store_true", help="warm-start from --init instead of training from scratch")
+    parser.add_argument("--init", type=str, default=MODEL_OUT, help="checkpoint to fine-tune")
+    parser.add_argument("--val-fraction", type=float, default=VAL_FRACTION, help="held out per speaker")
+    parser.add_argument("--patience", type=int, default=PATIENCE, help="early-stopping patience in epochs (0 = off)")
+    parser.add_argument("--monitor", choices=["loss", "acc"], default=MONITOR)
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY, help="epochs between resumable checkpoints")
+    parser.add_argument("--resume", action="store_true", help="continue from <out>.resume if present")
+    parser.add_argument("--augment", default="none",
+                        help="comma-separated: speed,pitch,gain,noise,specaugment | all | none (gain needs noise)")
+    parser.add_argument("--aug-prob", type=float, default=0.5, help="per-sample probability of each augmentation")
+    parser.add_argument("--time-mask", type=int, default=20, help="max SpecAugment time-mask width (frames)")
+    parser.add_argument("--freq-mask", type=int, default=8, help="max SpecAugment frequency-mask width (mel bins)")
+    parser.add_argument("--gain-db", type=float, default=6.0)
+    parser.add_argument("--snr", type=float, nargs=2, default=(5.0, 25.0), metavar=("MIN", "MAX"))
+    parser.add_argument("--speed", type=float, nargs="*", default=[0.9, 0.95, 1.05, 1.1])
+    parser.add_argument("--pitch-shift", type=float, default=0.05, help="max mel-axis warp (fraction)")
+    parser.add_argument("--noise-dir", default=None, help="extra noise WAVs for the noise bank")
+    parser.add_argument("--precision", choices=cpu_precision.PRECISIONS, default=cpu_precision.PRECISION,
+                        help="bf16: autocast on CPUs with native bf16, else falls back to fp32")
+    parser.add_argument("--channels-last", action="store_true", default=cpu_precision.CHANNELS_LAST,
+                        help="run the CNN in channels_last (NHWC) memory format")
+    parser.add_argument("--variant", choices=sorted(VARIANTS), default="baseline",
+                        help="model architecture when training from scratch (see model.VARIANTS)")
+    parser.add_argument("--width", type=float, default=None, help="channel width multiplier (overrides --variant)")
+    parser.add_argument("--separable", action="store_true", help="depthwise-separable conv2/conv3")
+    parser.add_argument("--n-mels", type=int, default=None, help="mel bins (overrides --variant)")
+    parser.add_argument("--distributed", type=int, default=1, metavar="N", help="data-parallel worker processes (gloo)")
+    parser.add_argument("--threads-per-worker", type=int, default=None, help="default: available cores / N")
+    parser.add_argument("--scaling", type=int, nargs="+", default=None, metavar="N",
+                        help="only measure samples/sec for these worker counts and exit")
     args = parser.parse_args()
 
+    epochs = args.epochs or (FINETUNE_EPOCHS if args.finetune else EPOCHS)
+    lr = args.lr or (FINETUNE_LR if args.finetune else LR)
+    augmenter = augment.from_args(
+        args.augment, device=DEVICE, p=args.aug_prob, time_mask=args.time_mask, freq_mask=args.freq_mask,
+        gain_db=args.gain_db, snr_db=tuple(args.snr), speed=tuple(args.speed), pitch_shift=args.pitch_shift,
+        noise_dir=args.noise_dir,
+    )
+    execution = cpu_precision.ExecutionMode(args.precision, args.channels_last, device=DEVICE)
+    variant = dict(VARIANTS[args.variant])
+    if args.width is not None:
+        variant["width"] = args.width
+    if args.separable:
+        variant["separable"] = True
+    if args.n_mels is not None:
+        variant["n_mels"] = args.n_mels
     records = get_records_from_mongo()
-    train_model(records, epochs=args.epochs, batch_size=args.batch_size, lr=args.lr, out_path=args.out)
+    if args.scaling:
+        scaling_curve(records, args.scaling, epochs=args.epochs or 3, batch_size=args.batch_size, lr=lr,
+                      features=args.features, num_workers=args.workers, augmenter=augmenter,
+                      execution=execution, variant=variant, threads_per_worker=args.threads_per_worker)
+    else:
+        train_distributed(records, args.distributed, threads_per_worker=args.threads_per_worker,
+                          epochs=epochs, batch_size=args.batch_size, lr=lr, out_path=args.out,
+                          features=args.features, num_workers=args.workers, progress_path=args.progress,
+                          init_from=args.init if args.finetune else None, val_fraction=args.val_fraction,
+                          patience=args.patience, monitor=args.monitor, checkpoint_every=args.checkpoint_every,
+                          resume=args.resume, augmenter=augmenter, execution=execution, variant=variant)
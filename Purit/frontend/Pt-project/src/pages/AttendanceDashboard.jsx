@@ -4,9 +4,12 @@ import axios from "axios";
 import "../styles/AttendanceDashboard.css";
 
 const API = "http://127.0.0.1:8000";
+const CLASS_PAGE_SIZE = 50;
 
 const AttendanceDashboard = () => {
   const [classes, setClasses] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [expandedClass, setExpandedClass] = useState(null);
   const [classStudents, setClassStudents] = useState({});
   const [showAddClass, setShowAddClass] = useState(false);
@@ -16,25 +19,45 @@ const AttendanceDashboard = () => {
   const [updates, setUpdates] = useState([]);
   const [recordStates, setRecordStates] = useState({});
   const [currentHighlight, setCurrentHighlight] = useState(null);  // 🔥 highlight active voices
-  const pollIntervalRef = useRef(null);
-  const highlightTimerRef = useRef(null);
-  const [highlightIndex, setHighlightIndex] = useState(0);
+  const streamRef = useRef(null);
 
-
-  
   useEffect(() => {
     fetchClasses();
+    return () => {
+      if (streamRef.current) streamRef.current.close();
+    };
   }, []);
 
+  // summary rows only — history lives behind /classes/{id}/history
+  const fetchClassPage = (cursor) =>
+    axios.get(`${API}/classes/summary`, {
+      params: { limit: CLASS_PAGE_SIZE, ...(cursor ? { cursor } : {}) },
+    });
+
   const fetchClasses = async () => {
     try {
-      const res = await axios.get(`${API}/classes`);
-      setClasses(res.data || []);
+      const res = await fetchClassPage(null);
+      setClasses(res.data.items || []);
+      setNextCursor(res.data.next_cursor || null);
     } catch (err) {
       console.error("Error fetching classes:", err);
     }
   };
 
+  const loadMoreClasses = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const res = await fetchClassPage(nextCursor);
+      setClasses((prev) => [...prev, ...(res.data.items || [])]);
+      setNextCursor(res.data.next_cursor || null);
+    } catch (err) {
+      console.error("Error loading more classes:", err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const toggleClassExpand = async (classId) => {
     if (expandedClass === classId) {
       setExpandedClass(null);
@@ -61,6 +84,86 @@ const AttendanceDashboard = () => {
     }
   };
 
+  // ---------------------------
+  // Live session stream (server-sent events, replaces status/temp polling)
+  // ---------------------------
+  const closeSessionStream = () => {
+    if (streamRef.current) {
+      streamRef.current.close();
+      streamRef.current = null;
+    }
+  };
+
+  const mergeResults = (classId, partial) => {
+    if (!partial || partial.length === 0) return;
+    setClassStudents((prev) => {
+      const prevClass = prev[classId] || [];
+      const merged = prevClass.map((s) => {
+        const update = partial.find((p) => p.student_id === s.student_id);
+        return update ? { ...s, ...update } : s;
+      });
+      return { ...prev, [classId]: merged };
+    });
+  };
+
+  const completeSession = async (className, classId) => {
+    closeSessionStream();
+    setCurrentHighlight(null);
+
+    // final finish call
+    let results = [];
+    try {
+      const finishRes = await axios.post(`${API}/attendance/finish/${className}`);
+      results = finishRes.data.results || [];
+    } catch (finishErr) {
+      console.error("Finish failed:", finishErr);
+    }
+
+    if (results.length > 0) {
+      const updatedStudents = results.map((stu) => ({
+        ...stu,
+        status: stu.status || (stu.confidence >= 85 ? "Present" : "Absent"),
+        checkins: (stu.checkins || 0) + 1,
+        date: new Date().toLocaleDateString(),
+        time: new Date().toLocaleTimeString(),
+        feedback: "",
+      }));
+      setClassStudents((prev) => ({ ...prev, [classId]: updatedStudents }));
+      setUpdates(updatedStudents);
+    }
+
+    setRecordStates((prev) => ({ ...prev, [classId]: "completed" }));
+    setRecordingStatus(`✅ Attendance completed for ${className}`);
+    await fetchClasses();
+  };
+
+  const openSessionStream = (className, classId) => {
+    closeSessionStream();
+    // EventSource reconnects by itself and sends Last-Event-ID, so missed events are replayed
+    const source = new EventSource(`${API}/attendance/stream/${encodeURIComponent(className)}`);
+    streamRef.current = source;
+
+    const handleStatus = (status) => {
+      if (status === "completed") {
+        completeSession(className, classId);
+      } else if (status === "paused") {
+        setRecordingStatus(`⏸️ Attendance paused for ${className}`);
+      } else {
+        setRecordingStatus(`🎙️ Attendance in progress for ${className}...`);
+      }
+    };
+
+    source.addEventListener("snapshot", (e) => {
+      const data = JSON.parse(e.data);
+      mergeResults(classId, data.results);
+      handleStatus(data.status);
+    });
+    source.addEventListener("status", (e) => handleStatus(JSON.parse(e.data).status));
+    source.addEventListener("listening", (e) => setCurrentHighlight(JSON.parse(e.data).student_id));
+    source.addEventListener("result", (e) => mergeResults(classId, [JSON.parse(e.data)]));
+    source.onerror = (err) => console.warn("Session stream interrupted, reconnecting:", err);
+  };
+
   // ---------------------------
   // Record / Pause / Resume / Finish Attendance
   // ---------------------------
@@ -75,113 +178,9 @@ const handleRecordControl = async (className, classId) => {
     if (currentState === "idle") {
       setRecordStates((prev) => ({ ...prev, [classId]: "recording" }));
       setRecordingStatus(`🎙️ Recording started for ${className}...`);
+      setCurrentHighlight(null);
       await axios.post(`${API}/attendance/start/${className}`);
-
-      // reset highlight index for that class
-      setHighlightIndex(0);
-
-      // --- clear any existing poll ---
-      if (pollIntervalRef.current) {
-        clearInterval(pollIntervalRef.current);
-        pollIntervalRef.current = null;
-      }
-
-      // --- start backend polling every 1s ---
-      pollIntervalRef.current = setInterval(async () => {
-        try {
-          const statusRes = await axios.get(`${API}/attendance/status/${className}`);
-          const sessionStatus = statusRes.data.status;
-
-          if (sessionStatus === "completed") {
-            clearInterval(pollIntervalRef.current);
-            pollIntervalRef.current = null;
-
-            // final finish call
-            let results = [];
-            try {
-              const finishRes = await axios.post(`${API}/attendance/finish/${className}`);
-              results = finishRes.data.results || [];
-            } catch (finishErr) {
-              console.error("Finish failed:", finishErr);
-            }
-
-            if (results.length > 0) {
-              const updatedStudents = results.map((stu) => ({
-                ...stu,
-                status: stu.status || (stu.confidence >= 85 ? "Present" : "Absent"),
-                checkins: (stu.checkins || 0) + 1,
-                date: new Date().toLocaleDateString(),
-                time: new Date().toLocaleTimeString(),
-                feedback: "",
-              }));
-              setClassStudents((prev) => ({ ...prev, [classId]: updatedStudents }));
-              setUpdates(updatedStudents);
-            }
-
-            setRecordStates((prev) => ({ ...prev, [classId]: "completed" }));
-            setRecordingStatus(`✅ Attendance completed for ${className}`);
-
-            // stop highlight timer too
-            if (highlightTimerRef.current) {
-              clearInterval(highlightTimerRef.current);
-              highlightTimerRef.current = null;
-            }
-            setHighlightIndex(0);
-            await fetchClasses();
-            return;
-          } else if (sessionStatus === "paused") {
-            setRecordingStatus(`⏸️ Attendance paused for ${className}`);
-          } else {
-            // polling partials
-            try {
-              const tempRes = await axios.get(`${API}/attendance/temp/${className}`);
-              const partial = tempRes.data.results || [];
-
-              if (partial.length > 0) {
-                setClassStudents((prev) => {
-                  const prevClass = prev[classId] || [];
-                  const merged = prevClass.map((s) => {
-                    const update = partial.find((p) => p.student_id === s.student_id);
-                    return update ? { ...s, ...update } : s;
-                  });
-                  return { ...prev, [classId]: merged };
-                });
-              }
-            } catch (tempErr) {
-              console.warn("Temp fetch failed:", tempErr);
-            }
-            setRecordingStatus(`🎙️ Attendance in progress for ${className}...`);
-          }
-        } catch (err) {
-          console.error("Polling error:", err);
-          if (pollIntervalRef.current) {
-            clearInterval(pollIntervalRef.current);
-            pollIntervalRef.current = null;
-          }
-        }
-      }, 1000); // poll every 1 second
-
-      // --- start highlight timer (sequential every 4s) ---
-      if (highlightTimerRef.current) {
-        clearInterval(highlightTimerRef.current);
-        highlightTimerRef.current = null;
-      }
-
-      // Immediately highlight the first student
-      setHighlightIndex(1);
-
-      highlightTimerRef.current = setInterval(() => {
-        setHighlightIndex((prev) => {
-          const students = classStudents[classId] || [];
-          if (students.length === 0) return 0;
-          if (prev >= students.length) {
-            clearInterval(highlightTimerRef.current);
-            highlightTimerRef.current = null;
-            return prev;
-          }
-          return prev + 1;
-        });
-      }, 7400);
+      openSessionStream(className, classId);
     }
 
     // ---------------- PAUSE ----------------
@@ -189,16 +188,6 @@ const handleRecordControl = async (className, classId) => {
       setRecordStates((prev) => ({ ...prev, [classId]: "paused" }));
       setRecordingStatus(`⏸️ Paused attendance for ${className}`);
       await axios.post(`${API}/attendance/pause/${className}`);
-
-      // pause both timers
-      if (pollIntervalRef.current) {
-        clearInterval(pollIntervalRef.current);
-        pollIntervalRef.current = null;
-      }
-      if (highlightTimerRef.current) {
-        clearInterval(highlightTimerRef.current);
-        highlightTimerRef.current = null;
-      }
     }
 
     // ---------------- RESUME ----------------
@@ -206,74 +195,13 @@ const handleRecordControl = async (className, classId) => {
       setRecordStates((prev) => ({ ...prev, [classId]: "recording" }));
       setRecordingStatus(`▶️ Resumed attendance for ${className}`);
       await axios.post(`${API}/attendance/resume/${className}`);
-
-      // restart polling
-      if (!pollIntervalRef.current) {
-        pollIntervalRef.current = setInterval(async () => {
-          try {
-            const statusRes = await axios.get(`${API}/attendance/status/${className}`);
-            const sessionStatus = statusRes.data.status;
-
-            if (sessionStatus === "completed") {
-              clearInterval(pollIntervalRef.current);
-              pollIntervalRef.current = null;
-            } else {
-              try {
-                const tempRes = await axios.get(`${API}/attendance/temp/${className}`);
-                const partial = tempRes.data.results || [];
-                if (partial.length > 0) {
-                  setClassStudents((prev) => {
-                    const prevClass = prev[classId] || [];
-                    const merged = prevClass.map((s) => {
-                      const update = partial.find((p) => p.student_id === s.student_id);
-                      return update ? { ...s, ...update } : s;
-                    });
-                    return { ...prev, [classId]: merged };
-                  });
-                }
-              } catch (tempErr) {
-                console.warn("Temp fetch failed:", tempErr);
-              }
-            }
-          } catch (err) {
-            console.error("Polling error:", err);
-            if (pollIntervalRef.current) {
-              clearInterval(pollIntervalRef.current);
-              pollIntervalRef.current = null;
-            }
-          }
-        }, 1000);
-      }
-
-      // restart highlight timer
-      if (!highlightTimerRef.current) {
-        highlightTimerRef.current = setInterval(() => {
-          setHighlightIndex((prev) => {
-            const students = classStudents[classId] || [];
-            if (students.length === 0) return 0;
-            if (prev >= students.length) {
-              clearInterval(highlightTimerRef.current);
-              highlightTimerRef.current = null;
-              return prev;
-            }
-            return prev + 1;
-          });
-        }, 4000);
-      }
+      if (!streamRef.current) openSessionStream(className, classId);
     }
 
     // ---------------- COMPLETED ----------------
     else if (currentState === "completed") {
-      // ensure timers cleared
-      if (pollIntervalRef.current) {
-        clearInterval(pollIntervalRef.current);
-        pollIntervalRef.current = null;
-      }
-      if (highlightTimerRef.current) {
-        clearInterval(highlightTimerRef.current);
-        highlightTimerRef.current = null;
-      }
-      setHighlightIndex(0);
+      closeSessionStream();
+      setCurrentHighlight(null);
       await handleUpdate();
     }
   } catch (err) {
@@ -479,7 +407,7 @@ const handleFeedbackChange = async (studentId, value) => {
 
     {classStudents[cls._id].map((stu, idx) => {
 
-                      const isHighlighted = idx === highlightIndex - 1 || currentHighlight === stu.student_id;
+                      const isHighlighted = currentHighlight === stu.student_id;
                       return (
                         <div
                           key={stu.student_id}
@@ -539,6 +467,11 @@ const handleFeedbackChange = async (studentId, value) => {
         ) : (
           <p className="no-classes">No classes available.</p>
         )}
+        {nextCursor && (
+          <button className="btn btn-outline" onClick={loadMoreClasses} disabled={loadingMore}>
+            {loadingMore ? "Loading…" : "Load more classes"}
+          </button>
+        )}
       </div>
 
 {showAddClass && (
@@ -4,9 +4,12 @@ import axios from "axios";
 import "./VoiceProfiles.css";
 
 const API_BASE = "http://127.0.0.1:8000";
+const PROFILE_PAGE_SIZE = 50;
 
 const VoiceProfiles = () => {
   const [profiles, setProfiles] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [form, setForm] = useState({
     fullName: "",
     usn: "",
@@ -21,17 +24,38 @@ const VoiceProfiles = () => {
   const [uploadFile, setUploadFile] = useState(null);
   const [recorder, setRecorder] = useState(null);
 
-  // Fetch existing profiles
+  // Fetch existing profiles, one page at a time
+  const fetchProfilePage = (cursor) =>
+    axios.get(`${API_BASE}/profiles`, {
+      params: { limit: PROFILE_PAGE_SIZE, ...(cursor ? { cursor } : {}) },
+    });
+
   const fetchProfiles = async () => {
     try {
-      const res = await axios.get(`${API_BASE}/profiles`);
-      setProfiles(res.data);
+      const res = await fetchProfilePage(null);
+      setProfiles(res.data.items || []);
+      setNextCursor(res.data.next_cursor || null);
     } catch (err) {
       console.error("Failed to fetch profiles:", err);
       setError("Failed to load profiles");
     }
   };
 
+  const loadMoreProfiles = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const res = await fetchProfilePage(nextCursor);
+      setProfiles((prev) => [...prev, ...(res.data.items || [])]);
+      setNextCursor(res.data.next_cursor || null);
+    } catch (err) {
+      console.error("Failed to load more profiles:", err);
+      setError("Failed to load profiles");
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     fetchProfiles();
   }, []);
@@ -163,6 +187,11 @@ const VoiceProfiles = () => {
               ))}
             </div>
           )}
+          {nextCursor && (
+            <button className="add-btn" onClick={loadMoreProfiles} disabled={loadingMore}>
+              {loadingMore ? "Loading…" : "Load more profiles"}
+            </button>
+          )}
         </div>
       </div>
 
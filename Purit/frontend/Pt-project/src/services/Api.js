@@ -34,8 +34,14 @@
 
 const API = import.meta.env.VITE_API_URL || "http://localhost:8000";
 
-export async function fetchProfiles() {
-  const res = await fetch(`${API}/profiles`);
+export async function fetchProfiles({ cursor = null, limit = 50, className, department, namePrefix, expand } = {}) {
+  const params = new URLSearchParams({ limit });
+  if (cursor) params.set("cursor", cursor);
+  if (className) params.set("class_name", className);
+  if (department) params.set("department", department);
+  if (namePrefix) params.set("name_prefix", namePrefix);
+  if (expand) params.set("expand", expand);
+  const res = await fetch(`${API}/profiles?${params}`);
   if (!res.ok) throw new Error("Failed to fetch profiles");
   return res.json();
 }
@@ -50,12 +56,24 @@ export async function createProfile(data) {
   return res.json();
 }
 
-export async function fetchClasses() {
-  const res = await fetch(`${API}/classes`);
+export async function fetchClasses(cursor = null, limit = 100) {
+  const params = new URLSearchParams({ limit });
+  if (cursor) params.set("cursor", cursor);
+  const res = await fetch(`${API}/classes/summary?${params}`);
   if (!res.ok) throw new Error("Failed to fetch classes");
   return res.json();
 }
 
+export async function fetchClassHistory(classId, { cursor = null, start, end, limit = 50 } = {}) {
+  const params = new URLSearchParams({ limit });
+  if (cursor) params.set("cursor", cursor);
+  if (start) params.set("start", start);
+  if (end) params.set("end", end);
+  const res = await fetch(`${API}/classes/${classId}/history?${params}`);
+  if (!res.ok) throw new Error("Failed to fetch class history");
+  return res.json();
+}
+
 export async function fetchClassStudents(classId) {
   const res = await fetch(`${API}/classes/${classId}/students`);
   if (!res.ok) throw new Error("Failed to fetch class students");